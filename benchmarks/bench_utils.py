@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Small helpers shared by the benchmark scripts in this folder.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCHMARKS_PATH = os.path.abspath(os.path.dirname(__file__))
+REPO_PATH = os.path.normpath(os.path.join(BENCHMARKS_PATH, '..'))
+DATASETS_PATH = os.path.join(REPO_PATH, 'notebooks', 'datasets')
+TEMPLATES_PATH = os.path.join(REPO_PATH, 'models', 'containerized_model', 'templates')
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000]
+
+
+def add_template_to_path(model_type):
+    """
+    Makes the `src` modules of a containerized model template importable, e.g.
+    `add_template_to_path('h2o_mojo')` followed by `import prediction_service`.
+
+    :param str model_type: template folder name, e.g. python, h2o_mojo, proxy
+    """
+    paths = [os.path.join(TEMPLATES_PATH, 'src'),
+             os.path.join(TEMPLATES_PATH, model_type, 'src')]
+    for path in paths:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def load_dataset(name, drop=('outcome', 'income', 'readmitted')):
+    """
+    Loads a csv from `notebooks/datasets`, dropping any outcome column.
+
+    :param str name: file name without the `.csv` extension, or a path to a csv file
+    :return: (column names, object numpy array of instances)
+    """
+    path = name if name.endswith('.csv') else os.path.join(DATASETS_PATH, f'{name}.csv')
+    df = pd.read_csv(path)
+    df = df.drop(columns=[c for c in drop if c in df.columns])
+    return list(df.columns), df.values.astype(object)
+
+
+def sample_rows(instances, batch_size, seed=0):
+    """Samples `batch_size` rows (with replacement) from `instances`."""
+    rng = np.random.RandomState(seed)
+    return instances[rng.randint(0, len(instances), size=batch_size)]
+
+
+def time_call(fn, *args, repeat=5, min_time=0.2):
+    """
+    Times `fn(*args)`, returning the best seconds per call over `repeat` rounds.
+    Each round runs enough calls to take at least `min_time` seconds.
+    """
+    fn(*args)  # warm up
+    best = float('inf')
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn(*args)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+
+def percentiles(latencies, points=(50, 95, 99)):
+    """Returns a dict of latency percentiles in milliseconds."""
+    if len(latencies) == 0:
+        return {f'p{p}_ms': None for p in points}
+    values = np.percentile(np.asarray(latencies) * 1000., points)
+    return {f'p{p}_ms': round(float(v), 3) for p, v in zip(points, values)}
+
+
+def print_table(rows, columns):
+    """Prints a list of dicts as a fixed width table."""
+    widths = [max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns]
+    print('  '.join(c.rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(_fmt(row.get(c)).rjust(w) for c, w in zip(columns, widths)))
+
+
+def write_json(rows, path):
+    """Writes benchmark results as json, if a path is given."""
+    if path:
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f'{value:.4g}'
+    return str(value)
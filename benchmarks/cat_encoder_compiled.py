@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the time to encode a batch of instances with the tutorial and AzureML
+`CatEncoder`, as it was (sklearn `StandardScaler.transform` of the numeric columns,
+`OneHotEncoder.transform(...).toarray()` of the categorical columns, and a
+concatenation), and as compiled at fit time (lookup of each category's output
+column in a dict per categorical column, written with the scaled numeric columns
+into one preallocated matrix), on german_credit and adult income, for batch sizes
+1-100k, with and without normalization. The outputs are checked to be identical
+(without normalization, the output is now float rather than object), and both
+encoders are checked to reject an unknown category with a ValueError.
+
+    python cat_encoder_compiled.py --batch-sizes 1 100 10000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import DATASETS_PATH, DEFAULT_BATCH_SIZES, REPO_PATH, print_table, sample_rows, time_call, write_json
+
+sys.path.insert(0, os.path.join(REPO_PATH, 'notebooks', 'azureml_model_headers_demo', 'scripts'))
+from cat_encoder import CatEncoder  # noqa: E402
+
+# dataset, outcome column
+DATASETS = {
+    'german_credit': ('german_credit_eval', 'outcome'),
+    'adult_income': ('adult_income_explan', 'income'),
+}
+
+
+def sklearn_transform(encoder):
+    """The transform of the `CatEncoder` before it was compiled, with its fitted sklearn objects"""
+    def transform(x):
+        if encoder.normalizer is not None:
+            numeric = encoder.normalizer.transform(x[:, encoder.num_indexes])
+        else:
+            numeric = x[:, encoder.num_indexes]
+        categorical = encoder.encoder.transform(x[:, encoder.cat_indexes]).toarray()
+        return np.concatenate((numeric, categorical), axis=1)
+    return transform
+
+
+def check_unknown_category(encoders, instances, cat_index):
+    """Checks that the encoders reject an instance with a category not seen at fit time"""
+    unknown = instances[:1].copy()
+    unknown[0, cat_index] = 'not a category'
+    for encoder in encoders:
+        try:
+            encoder(unknown)
+        except ValueError:
+            continue
+        raise AssertionError(f'{encoder} encoded an unknown category')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', nargs='+', choices=sorted(DATASETS), default=sorted(DATASETS))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    rows = []
+    for dataset in args.datasets:
+        name, outcome = DATASETS[dataset]
+        df = pd.read_csv(os.path.join(DATASETS_PATH, f'{name}.csv')).drop(columns=[outcome])
+        cat_columns = list(df.select_dtypes(exclude='number').columns)
+        instances = df.values.astype(object)
+        for normalize in (True, False):
+            encoder = CatEncoder(cat_columns, df, normalize=normalize)
+            reference = sklearn_transform(encoder)
+            check_unknown_category([reference, encoder], instances, encoder.cat_indexes[0])
+            for batch_size in args.batch_sizes:
+                batch = sample_rows(instances, batch_size)
+                expected = reference(batch)
+                actual = encoder(batch)
+                np.testing.assert_array_equal(expected.astype(float), actual)
+                sklearn_s = time_call(reference, batch)
+                compiled_s = time_call(encoder, batch)
+                rows.append({'dataset': dataset, 'normalize': normalize, 'columns out': actual.shape[1],
+                             'batch_size': batch_size, 'sklearn dtype': str(expected.dtype),
+                             'compiled dtype': str(actual.dtype), 'sklearn ms': round(sklearn_s * 1000., 3),
+                             'compiled ms': round(compiled_s * 1000., 3), 'speedup': round(sklearn_s / compiled_s, 1)})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
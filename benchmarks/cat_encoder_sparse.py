@@ -0,0 +1,123 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the memory and latency of scoring adult income instances with logistic
+regression and SVM models through the `CatEncoder` with dense output, and with
+sparse (CSR) output (`CatEncoder(..., sparse=True)`, with the models trained on
+the sparse output), for batch sizes 1-100k:
+
+- the size of the encoded batch, and the peak memory allocated to encode and
+  score it (tracemalloc),
+- the time to encode the batch, and to encode and score it.
+
+The adult income sample in `notebooks/datasets` only has a few of the 41 native
+countries of the full dataset; by default its `native-country` values are
+redrawn from all of them, so that the one-hot encoding is as wide as for the
+full dataset (`--no-widen` to keep them). Predictions of the dense and sparse
+models are compared (they are trained with the same data, and agree closely).
+
+    python cat_encoder_sparse.py --batch-sizes 1 100 10000 --svm-max-batch-size 10000
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import SVC
+
+from bench_utils import DATASETS_PATH, DEFAULT_BATCH_SIZES, REPO_PATH, print_table, sample_rows, time_call, write_json
+
+sys.path.insert(0, os.path.join(REPO_PATH, 'notebooks', 'azureml_model_headers_demo', 'scripts'))
+from cat_encoder import CatEncoder  # noqa: E402
+
+NATIVE_COUNTRIES = [
+    'Cambodia', 'Canada', 'China', 'Columbia', 'Cuba', 'Dominican-Republic', 'Ecuador', 'El-Salvador', 'England',
+    'France', 'Germany', 'Greece', 'Guatemala', 'Haiti', 'Holand-Netherlands', 'Honduras', 'Hong', 'Hungary', 'India',
+    'Iran', 'Ireland', 'Italy', 'Jamaica', 'Japan', 'Laos', 'Mexico', 'Nicaragua', 'Outlying-US(Guam-USVI-etc)', 'Peru',
+    'Philippines', 'Poland', 'Portugal', 'Puerto-Rico', 'Scotland', 'South', 'Taiwan', 'Thailand', 'Trinadad&Tobago',
+    'United-States', 'Vietnam', 'Yugoslavia',
+]
+
+
+def encoded_bytes(encoded):
+    if hasattr(encoded, 'indptr'):
+        return encoded.data.nbytes + encoded.indices.nbytes + encoded.indptr.nbytes
+    return encoded.nbytes
+
+
+def peak_bytes(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--svm-max-batch-size', type=int, default=10000,
+                        help='largest batch scored with the SVM, whose scoring is slow for large batches')
+    parser.add_argument('--train-rows', type=int, default=5000)
+    parser.add_argument('--no-widen', action='store_true', help='keep the native countries of the sample')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    df = pd.read_csv(os.path.join(DATASETS_PATH, 'adult_income_explan.csv'))
+    rng = np.random.RandomState(0)
+    df = df.iloc[rng.randint(0, len(df), size=args.train_rows)].reset_index(drop=True)
+    if not args.no_widen:
+        df['native-country'] = [f'native-country_{country}' for country in rng.choice(NATIVE_COUNTRIES, len(df))]
+    y = df.pop('income').values
+    cat_columns = list(df.select_dtypes(exclude='number').columns)
+    dense_encoder = CatEncoder(cat_columns, df)
+    sparse_encoder = CatEncoder(cat_columns, df, sparse=True)
+    instances = df.values.astype(object)
+    print(f'{len(dense_encoder.transformed_features)} encoded columns, '
+          f'{len(dense_encoder.num_indexes) + len(cat_columns)} values per row; category counts: '
+          + ', '.join(f'{name} {len(categories)}'
+                      for name, categories in zip(cat_columns, dense_encoder.encoder.categories_)))
+
+    models = {}
+    for name, model_class, kwargs in [('logit', LogisticRegression, {'max_iter': 1000}), ('svm', SVC, {})]:
+        models[name] = (model_class(**kwargs).fit(dense_encoder(instances), y),
+                        model_class(**kwargs).fit(sparse_encoder(instances), y))
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = sample_rows(instances, batch_size, seed=1)
+        dense, sparse = dense_encoder(batch), sparse_encoder(batch)
+        np.testing.assert_array_equal(dense, sparse.toarray())
+        row = {'batch_size': batch_size,
+               'dense MB': round(encoded_bytes(dense) / 1e6, 3), 'csr MB': round(encoded_bytes(sparse) / 1e6, 3),
+               'encode dense ms': round(time_call(dense_encoder, batch) * 1000., 3),
+               'encode csr ms': round(time_call(sparse_encoder, batch) * 1000., 3)}
+        for name, (dense_model, sparse_model) in models.items():
+            if name == 'svm' and batch_size > args.svm_max_batch_size:
+                continue
+
+            def score_dense():
+                return dense_model.predict(dense_encoder(batch))
+
+            def score_sparse():
+                return sparse_model.predict(sparse_encoder(batch))
+            row[f'{name} agree'] = round(float(np.mean(score_dense() == score_sparse())), 4)
+            row[f'{name} dense peak MB'] = round(peak_bytes(score_dense) / 1e6, 3)
+            row[f'{name} csr peak MB'] = round(peak_bytes(score_sparse) / 1e6, 3)
+            row[f'{name} dense ms'] = round(time_call(score_dense, repeat=3) * 1000., 3)
+            row[f'{name} csr ms'] = round(time_call(score_sparse, repeat=3) * 1000., 3)
+        rows.append(row)
+    columns = ['batch_size', 'dense MB', 'csr MB', 'encode dense ms', 'encode csr ms']
+    print_table(rows, columns)
+    for name in models:
+        print_table(rows, ['batch_size'] + [column for column in rows[0] if column.startswith(name)])
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the per-request latency of the patient readmission `CleanPipeline`, for
+batch sizes 1-100k of instances as they are served (object numpy arrays):
+
+- transform with the DataFrame path (a DataFrame of the instances, `replace`,
+  column drops, `map` of the age buckets and the encoder transform), as the
+  pipeline did before it compiled a plan at fit time,
+- transform with the compiled plan,
+- prediction through the served sklearn `Pipeline` (the cleaning pipeline and
+  an MLP), with each.
+
+The outputs of both paths are checked to be identical. Requires the Certifai
+toolkit, and the diagnostic mapped dataset written by
+`models/patient_readmission/train.py`.
+
+    python clean_pipeline_plan.py --batch-sizes 1 100 10000
+"""
+import argparse
+import copy
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+
+from bench_utils import DEFAULT_BATCH_SIZES, REPO_PATH, print_table, sample_rows, time_call, write_json
+
+EXAMPLE_PATH = os.path.join(REPO_PATH, 'models', 'patient_readmission')
+sys.path.insert(0, EXAMPLE_PATH)
+from clean_pipeline import CleanPipeline  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default=os.path.join(EXAMPLE_PATH, 'diabetic_data_diagnostic_mapped.csv'),
+                        help='diagnostic mapped dataset written by train.py')
+    parser.add_argument('--train-rows', type=int, default=5000, help='rows to fit the MLP on')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.dataset)
+    y = df.pop('readmitted')
+    compiled = CleanPipeline()
+    compiled.fit(df)
+    if compiled._plan is None:
+        sys.exit('the cleaning pipeline could not be compiled for this encoder')
+    frame = copy.copy(compiled)
+    frame._plan = None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model = MLPClassifier(random_state=0, hidden_layer_sizes=(20, 20), max_iter=50)
+        model.fit(compiled.transform(df.iloc[:args.train_rows]), y.iloc[:args.train_rows])
+    pipelines = {'frame': Pipeline(steps=[('encoder', frame), ('model', model)]),
+                 'compiled': Pipeline(steps=[('encoder', compiled), ('model', model)])}
+
+    instances = df.values.astype(object)
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = sample_rows(instances, batch_size)
+        np.testing.assert_array_equal(frame.transform(batch), compiled.transform(batch))
+        row = {'batch_size': batch_size}
+        for name, pipeline in pipelines.items():
+            row[f'{name} transform ms'] = round(time_call(pipeline.named_steps['encoder'].transform, batch) * 1000., 3)
+        for name, pipeline in pipelines.items():
+            row[f'{name} predict ms'] = round(time_call(pipeline.predict, batch) * 1000., 3)
+        row['transform speedup'] = round(row['frame transform ms'] / row['compiled transform ms'], 1)
+        row['predict speedup'] = round(row['frame predict ms'] / row['compiled predict ms'], 1)
+        rows.append(row)
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
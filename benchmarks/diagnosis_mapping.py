@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the patient readmission data preparation on the diabetic dataset:
+
+- the time to map the diagnosis codes of `diag_1`..`diag_3` to diagnosis groups
+  with per-condition masks (the hard-coded `str.contains` scans and masked
+  `.loc` assignments per group that `train.py` used) and with the single pass mapper of `train.py`
+  (distinct codes binned by a search of the sorted code intervals), for
+  increasing numbers of rows,
+- the time and peak memory of converting the dataset file as a whole, and in
+  chunks of rows, each in a forked process (the increase of its peak resident
+  memory, from `/proc/self/status`, Linux only).
+
+The mapped groups (also of codes at the bounds of each group), and the converted
+files, are checked to be identical.
+Requires the Certifai toolkit, and the Kaggle diabetic dataset in
+`notebooks/datasets` (see `models/patient_readmission/README.md`).
+
+    python diagnosis_mapping.py --rows 1000 100000 --chunk-rows 10000
+"""
+import argparse
+import filecmp
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import DATASETS_PATH, REPO_PATH, print_table, time_call, write_json
+
+sys.path.insert(0, os.path.join(REPO_PATH, 'models', 'patient_readmission'))
+import train  # noqa: E402
+
+
+def per_condition_map_diagnostics(df):
+    """
+    The diagnosis mapping `train.py` used, verbatim but for the chained in place `replace` and `fillna`
+    (ignored with pandas copy-on-write), assigned instead
+    """
+    diag_cols = ['diag_1','diag_2','diag_3']
+    for col in diag_cols:
+        df[col] = df[col].replace('?', np.nan)
+        df[col] = df[col].fillna('0')
+        # Anything with E or V will get mapped into 'Other' group, so set as '0'
+        df.loc[df[col].str.contains('E'), col] = '0'
+        df.loc[df[col].str.contains('V'), col] = '0'
+        # Any '250.xx' will be mapped to Diabetes
+        df.loc[df[col].str.contains('250'), col] = '250'
+
+    df[diag_cols] = df[diag_cols].astype(float)
+
+    # diagnosis grouping
+    for col in diag_cols:
+        df['temp']='Other'
+
+        condition = (df[col]>=390) & (df[col]<=458) | (df[col]==785)
+        df.loc[condition,'temp']='Circulatory'
+
+        condition = (df[col]>=460) & (df[col]<=519) | (df[col]==786)
+        df.loc[condition,'temp']='Respiratory'
+
+        condition = (df[col]>=520) & (df[col]<=579) | (df[col]==787)
+        df.loc[condition,'temp']='Digestive'
+
+        condition = df[col]==250
+        df.loc[condition,'temp']='Diabetes'
+
+        condition = (df[col]>=800) & (df[col]<=999)
+        df.loc[condition,'temp']='Injury'
+
+        condition = (df[col]>=710) & (df[col]<=739)
+        df.loc[condition,'temp']='Muscoloskeletal'
+
+        condition = (df[col]>=580) & (df[col]<=629) | (df[col]==788)
+        df.loc[condition,'temp']='Genitourinary'
+
+        condition = (df[col]>=140) & (df[col]<=239)
+        df.loc[condition,'temp']='Neoplasms'
+
+        df.loc[df[col].isnull(),'temp']='Unknown'
+        df[col]=df['temp']
+        df.drop('temp',axis=1,inplace=True)
+
+    return df
+
+
+# codes at and around the bounds of each diagnosis group, and the special codes
+EDGE_CODES = ['139.99', '140', '239', '239.01', '249.99', '250', '250.01', '250.83', '389.99', '390', '458',
+              '458.01', '459', '460', '519', '519.01', '520', '579', '579.01', '580', '629', '629.01', '709.99',
+              '710', '739', '739.01', '784', '785', '786', '787', '788', '789', '799.99', '800', '999', '999.01',
+              '1000', '0', 'V57', 'E885', '?', None]
+
+
+def convert_whole(dataset_filename, converted_filename):
+    """The conversion `train.py` used"""
+    df = pd.read_csv(dataset_filename)
+    df = per_condition_map_diagnostics(df)
+    df['readmitted'] = np.where(df['readmitted']!='NO',1,0)
+    df.to_csv(converted_filename, index=False)
+    return df
+
+
+def _memory_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+
+def _run_measured(fn, args, results):
+    start_kb = _memory_kb('VmRSS')
+    start = time.perf_counter()
+    fn(*args)
+    results.put((time.perf_counter() - start, (_memory_kb('VmHWM') - start_kb) * 1024))
+
+
+def measure(fn, *args):
+    """Runs `fn(*args)` in a forked process, returning its seconds and peak resident memory increase in bytes"""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    process = context.Process(target=_run_measured, args=(fn, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default=os.path.join(DATASETS_PATH, 'diabetic_data.csv'))
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--chunk-rows', type=int, default=train.CONVERSION_CHUNK_ROWS)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    full = pd.read_csv(args.dataset, dtype={col: str for col in train.DIAGNOSIS_COLUMNS})
+    edges = pd.DataFrame({col: np.roll(EDGE_CODES, shift).astype(object)
+                          for shift, col in enumerate(train.DIAGNOSIS_COLUMNS)})
+    edges = edges.where(edges.notnull(), None)
+    pd.testing.assert_frame_equal(per_condition_map_diagnostics(edges.copy()), train._map_diagnostics(edges.copy()),
+                                  check_dtype=False)
+    rows = []
+    for count in args.rows:
+        df = full.iloc[np.arange(count) % len(full)].reset_index(drop=True)
+        mapped = train._map_diagnostics(df.copy())
+        pd.testing.assert_frame_equal(per_condition_map_diagnostics(df.copy()), mapped, check_dtype=False)
+        per_condition_s = time_call(lambda: per_condition_map_diagnostics(df.copy()), repeat=3)
+        single_pass_s = time_call(lambda: train._map_diagnostics(df.copy()), repeat=3)
+        rows.append({'rows': count, 'per condition ms': round(per_condition_s * 1000., 1),
+                     'single pass ms': round(single_pass_s * 1000., 1),
+                     'speedup': round(per_condition_s / single_pass_s, 1)})
+    print_table(rows, list(rows[0].keys()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        whole_path, chunked_path = os.path.join(directory, 'whole.csv'), os.path.join(directory, 'chunked.csv')
+        whole_s, whole_bytes = measure(convert_whole, args.dataset, whole_path)
+        chunked_s, chunked_bytes = measure(train._convert_to_diagnostic_mapped, args.dataset, chunked_path,
+                                           args.chunk_rows)
+        if not filecmp.cmp(whole_path, chunked_path, shallow=False):
+            sys.exit('the chunked conversion differs from the whole file conversion')
+    conversion = [{'conversion': 'whole file, per condition', 'rows': len(full), 'seconds': round(whole_s, 2),
+                   'peak MB': round(whole_bytes / 1e6, 1)},
+                  {'conversion': f'chunks of {args.chunk_rows} rows, single pass', 'rows': len(full),
+                   'seconds': round(chunked_s, 2), 'peak MB': round(chunked_bytes / 1e6, 1)}]
+    print_table(conversion, list(conversion[0].keys()))
+    write_json({'mapping': rows, 'conversion': conversion}, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Compares the row-wise and columnar scoring paths of the H2O MOJO template
+`MojoModelWrapper.predict` across batch sizes.
+
+The row-wise path is the previous implementation: a `dt.Frame` built from a list
+of per-row tuples, mapped to labels with `pandas.DataFrame.apply(axis=1)`.
+The columnar path is the current template implementation.
+
+By default a stand-in for the MOJO is used, so that only the wrapper overhead is
+measured and no Driverless AI license is needed. Pass `--mojo` to use a real
+`pipeline.mojo` (requires `daimojo` and `DRIVERLESS_AI_LICENSE_FILE`).
+
+    python h2o_mojo_columnar.py --dataset german_credit_eval
+"""
+import argparse
+
+import datatable as dt
+import numpy as np
+
+from bench_utils import (DEFAULT_BATCH_SIZES, add_template_to_path, load_dataset,
+                         print_table, sample_rows, time_call, write_json)
+
+
+class StandInMojo:
+    """Mimics the parts of a `daimojo.model` used by the wrapper."""
+    output_names = ['outcome.1', 'outcome.2']
+
+    def predict(self, frame):
+        scores = np.random.RandomState(frame.nrows).random_sample(frame.nrows)
+        return dt.Frame({self.output_names[0]: scores, self.output_names[1]: 1. - scores})
+
+
+def row_wise_predict(wrapper, npinstances):
+    instances = [tuple(instance) for instance in npinstances]
+    input_dt = dt.Frame(instances, names=wrapper.columns)
+    predictions = wrapper.model.predict(input_dt).to_pandas()
+    outcomes = wrapper._get_outcomes()
+
+    def get_prediction(preds):
+        return outcomes[preds.values.argmax()]
+    return predictions.apply(get_prediction, axis=1).values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--mojo', help='path to a pipeline.mojo to use instead of the stand-in model')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    add_template_to_path('h2o_mojo')
+    from prediction_service import MojoModelWrapper
+
+    columns, instances = load_dataset(args.dataset)
+    if args.mojo:
+        wrapper = MojoModelWrapper(model_type='h2o_mojo', model_path=args.mojo,
+                                   metadata={'columns': columns})
+    else:
+        wrapper = MojoModelWrapper(model=StandInMojo(), metadata={'columns': columns})
+    wrapper.set_global_imports()
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = sample_rows(instances, batch_size)
+        np.testing.assert_array_equal(wrapper.predict(batch), row_wise_predict(wrapper, batch))
+        row_wise = time_call(row_wise_predict, wrapper, batch, repeat=3)
+        columnar = time_call(wrapper.predict, batch, repeat=3)
+        rows.append({
+            'batch_size': batch_size,
+            'row_wise_ms': row_wise * 1000.,
+            'columnar_ms': columnar * 1000.,
+            'row_wise_rows_per_s': batch_size / row_wise,
+            'columnar_rows_per_s': batch_size / columnar,
+            'speedup': row_wise / columnar,
+        })
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
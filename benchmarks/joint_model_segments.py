@@ -0,0 +1,92 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the throughput of the segmented model demo's `JointModel` as the number
+of segments grows, on a synthetic encoded dataset (numeric features and one-hot
+segment indicator columns) with a segment model per segment (alternately an SVM
+and a logistic regression, as in the demo):
+
+- per segment scan: a `np.where` over the batch per segment, and the segment
+  models called one after the other, as `JointModel.predict` did,
+- routed: segments from one argmax over the indicator columns and a stable
+  group-by, segment models called one after the other (`max_workers=1`),
+- routed, threads: as routed, with the segment models called concurrently on a
+  thread pool (the SVM and logistic regression release the GIL while predicting;
+  the speed up is bounded by the number of CPUs).
+
+It also times the routed `soft_predict`. Predictions are checked to be identical.
+
+    python joint_model_segments.py --segments 2 8 32 --batch-size 10000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import SVC
+
+from bench_utils import REPO_PATH, print_table, time_call, write_json
+
+sys.path.insert(0, os.path.join(REPO_PATH, 'notebooks', 'segmented_model_demo'))
+from joint_model import JointModel  # noqa: E402
+
+
+def per_segment_scan_predict(segment_models_idx_mapping, X):
+    """`JointModel.predict` before routing"""
+    result = np.empty(len(X), dtype='int')
+    for col_idx, model in segment_models_idx_mapping:
+        seg_idxs = np.where(X[:, col_idx] > 0.5)[0]
+        if len(seg_idxs) > 0:
+            result[seg_idxs] = model.predict(X[seg_idxs])
+    return result
+
+
+def segmented_data(rng, rows, features, segments):
+    X = np.zeros((rows, features + segments))
+    X[:, :features] = rng.randn(rows, features)
+    X[np.arange(rows), features + rng.randint(0, segments, rows)] = 1.
+    y = (X[:, :features].sum(axis=1) + rng.randn(rows) > 0).astype(int) + 1
+    return X, y
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--features', type=int, default=40)
+    parser.add_argument('--train-rows', type=int, default=500, help='training rows per segment model')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    rows = []
+    for segments in args.segments:
+        mapping = []
+        for segment in range(segments):
+            X_train, y_train = segmented_data(rng, args.train_rows, args.features, segments)
+            model = SVC(gamma='scale') if segment % 2 == 0 else LogisticRegression(max_iter=1000)
+            model.probability = isinstance(model, SVC)
+            mapping.append((args.features + segment, model.fit(X_train, y_train)))
+        X, _ = segmented_data(rng, args.batch_size, args.features, segments)
+        routed = JointModel(mapping, max_workers=1)
+        threaded = JointModel(mapping)
+        expected = per_segment_scan_predict(mapping, X)
+        np.testing.assert_array_equal(expected, routed.predict(X))
+        np.testing.assert_array_equal(expected, threaded.predict(X))
+        np.testing.assert_array_equal(routed.soft_predict(X), threaded.soft_predict(X))
+
+        row = {'segments': segments, 'batch_size': args.batch_size}
+        for name, fn in [('per segment scan', lambda: per_segment_scan_predict(mapping, X)),
+                         ('routed', lambda: routed.predict(X)), ('routed, threads', lambda: threaded.predict(X)),
+                         ('soft routed, threads', lambda: threaded.soft_predict(X))]:
+            row[f'{name} rows/s'] = round(args.batch_size / time_call(fn, repeat=3))
+        rows.append(row)
+    print(f'{os.cpu_count()} CPUs')
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
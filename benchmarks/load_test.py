@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Load test of a running prediction service: concurrent clients POST batches of rows
+sampled from the service's dataset for a fixed duration, for each combination of
+concurrency and batch size, and report throughput, latency percentiles and the
+error rate.
+
+Each client is a thread with its own keep-alive connection, sending requests back
+to back (a closed loop). Requests of the first `--warmup` seconds of each setting
+are not counted. The `--service` names the example (folder under `models`) whose
+dataset and columns the rows are sampled from; alternatively give a `--dataset`
+(a csv name in notebooks/datasets, or a path) and the `--drop` columns.
+
+    python load_test.py --service german_credit --concurrency 1 4 16 --batch-sizes 1 100 --duration 10
+    python load_test.py --service iris --url http://127.0.0.1:8551/predict --encoding npy --json iris.json
+
+`run_load` can also be used from other scripts.
+"""
+import argparse
+import http.client
+import os
+import threading
+import time
+import urllib.parse
+from itertools import product
+
+import numpy as np
+
+from bench_utils import REPO_PATH, add_template_to_path, load_dataset, percentiles, print_table, write_json
+
+add_template_to_path('python')
+import wire_formats  # noqa: E402
+
+# dataset (csv name in notebooks/datasets, or path) and non-input columns of each example service
+SERVICES = {
+    'german_credit': ('german_credit_eval', ['outcome']),
+    'german_credit_pandas': ('german_credit_eval', ['outcome']),
+    'h2o_dai_german_credit': ('german_credit_eval', ['outcome']),
+    'h2o_dai_regression_auto_insurance': ('auto_insurance_claims_dataset', ['Total Claim Amount']),
+    'income_prediction': ('adult_income_explan', ['income']),
+    'iris': (os.path.join(REPO_PATH, 'models', 'iris', 'iris_eval.csv'), ['species']),
+    # written by models/patient_readmission/train.py
+    'patient_readmission': (os.path.join(REPO_PATH, 'models', 'patient_readmission',
+                                         'diabetic_data_diagnostic_mapped.csv'), ['readmitted']),
+}
+CONTENT_TYPES = {
+    'json': wire_formats.JSON_CONTENT_TYPE,
+    'npy': wire_formats.NPY_CONTENT_TYPE,
+    'arrow': wire_formats.ARROW_CONTENT_TYPE,
+}
+# distinct request bodies per setting, so the clients do not spend their time encoding
+BODIES_PER_SETTING = 32
+
+
+def request_bodies(instances, batch_size, encoding, count=BODIES_PER_SETTING, seed=0):
+    """Returns `count` encoded request bodies of `batch_size` rows sampled from `instances`"""
+    rng = np.random.RandomState(seed)
+    return [wire_formats.encode_instances(instances[rng.randint(0, len(instances), size=batch_size)],
+                                          CONTENT_TYPES[encoding]) for _ in range(count)]
+
+
+def _client(url, bodies, content_type, start, stop, timeout, seed, results):
+    parsed = urllib.parse.urlsplit(url)
+    connection = None
+    rng = np.random.RandomState(seed)
+    latencies, errors = [], {}
+    while time.perf_counter() < stop:
+        body = bodies[rng.randint(len(bodies))]
+        call_start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+            connection.request('POST', parsed.path or '/', body=body,
+                               headers={'Content-Type': content_type, 'Accept': content_type})
+            response = connection.getresponse()
+            response.read()
+            status = str(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            if connection is not None:
+                connection.close()
+            connection = None
+        if call_start < start:
+            continue
+        if status == '200':
+            latencies.append(time.perf_counter() - call_start)
+        else:
+            errors[status] = errors.get(status, 0) + 1
+    if connection is not None:
+        connection.close()
+    results.append((latencies, errors))
+
+
+def run_load(url, bodies, batch_size, concurrency=1, duration=10., warmup=1., encoding='json', timeout=60.):
+    """
+    Sends the request bodies from `concurrency` clients for `warmup` + `duration` seconds.
+
+    :param str url: predict url of the service, e.g. http://127.0.0.1:8551/predict
+    :param list bodies: encoded request bodies, each of `batch_size` rows
+    :return: dict of throughput (requests and rows per second), latency percentiles of the successful
+        requests, and errors (count, rate and count by status or exception)
+    """
+    results = []
+    start = time.perf_counter() + warmup
+    stop = start + duration
+    clients = [threading.Thread(target=_client, args=(url, bodies, CONTENT_TYPES[encoding], start, stop,
+                                                      timeout, seed, results))
+               for seed in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    errors = {}
+    for _, client_errors in results:
+        for status, count in client_errors.items():
+            errors[status] = errors.get(status, 0) + count
+    requests = len(latencies) + sum(errors.values())
+    return {
+        'requests': requests,
+        'requests_per_s': round(len(latencies) / duration, 2),
+        'rows_per_s': round(len(latencies) * batch_size / duration, 1),
+        **percentiles(latencies),
+        'errors': sum(errors.values()),
+        'error_rate': round(sum(errors.values()) / requests, 4) if requests else 0.,
+        'errors_by_status': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--service', choices=sorted(SERVICES), help='example service, for its dataset')
+    parser.add_argument('--dataset', help='csv name in notebooks/datasets, or a path (instead of --service)')
+    parser.add_argument('--drop', nargs='*', default=None, help='non-input columns of --dataset')
+    parser.add_argument('--url', default='http://127.0.0.1:8551/predict')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--duration', type=float, default=10., help='measured seconds per setting')
+    parser.add_argument('--warmup', type=float, default=1., help='seconds per setting before measuring')
+    parser.add_argument('--encoding', choices=sorted(CONTENT_TYPES), default='json')
+    parser.add_argument('--timeout', type=float, default=60., help='request timeout in seconds')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    if args.service:
+        dataset, drop = SERVICES[args.service]
+    elif args.dataset:
+        dataset, drop = args.dataset, ('outcome', 'income', 'readmitted')
+    else:
+        parser.error('one of --service or --dataset is required')
+    _, instances = load_dataset(args.dataset or dataset, drop=args.drop if args.drop is not None else drop)
+
+    rows = []
+    for concurrency, batch_size in product(args.concurrency, args.batch_sizes):
+        bodies = request_bodies(instances, batch_size, args.encoding)
+        result = run_load(args.url, bodies, batch_size, concurrency=concurrency, duration=args.duration,
+                          warmup=args.warmup, encoding=args.encoding, timeout=args.timeout)
+        rows.append({'service': args.service or args.dataset, 'encoding': args.encoding,
+                     'concurrency': concurrency, 'batch_size': batch_size, **result,
+                     'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')})
+    print_table(rows, ['service', 'encoding', 'concurrency', 'batch_size', 'requests_per_s', 'rows_per_s',
+                       'p50_ms', 'p95_ms', 'p99_ms', 'error_rate'])
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
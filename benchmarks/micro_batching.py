@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures throughput and latency of batch-size-1 requests from concurrent
+clients, with and without request micro-batching, across batching windows.
+
+Clients call the `MicroBatcher` in-process (no HTTP), so the results show the
+effect of coalescing on the model's per-call overhead. With `--clients` threads,
+this is a threaded server worker (e.g. gunicorn gthread); with a single client,
+it is a worker serving one request at a time (e.g. gunicorn sync workers, as
+the templates run), where there is nothing to coalesce and batching must not
+add latency. The model is a scikit-learn MLP trained on the one-hot encoded
+german_credit dataset.
+
+    python micro_batching.py --clients 16 --windows 0.5 1 2 5
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.neural_network import MLPClassifier
+
+from bench_utils import add_template_to_path, load_dataset, percentiles, print_table, write_json
+
+add_template_to_path('python')
+from batching import MicroBatcher  # noqa: E402
+
+
+def run_clients(fn, instances, clients, duration):
+    latencies = [[] for _ in range(clients)]
+    stop = time.perf_counter() + duration
+
+    def client(index):
+        rng = np.random.RandomState(index)
+        while time.perf_counter() < stop:
+            row = instances[rng.randint(len(instances))][np.newaxis, :]
+            start = time.perf_counter()
+            fn(row)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [latency for client_latencies in latencies for latency in client_latencies]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16, help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=3., help='seconds per setting')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0.25, 0.5, 1., 2., 5.],
+                        help='batching windows (max_wait_ms) to measure')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, raw = load_dataset('german_credit_eval')
+    instances = pd.get_dummies(pd.DataFrame(raw).infer_objects()).values.astype(np.float64)
+    model = MLPClassifier(hidden_layer_sizes=(20, 20), max_iter=200, random_state=0)
+    model.fit(instances, np.random.RandomState(0).randint(2, size=len(instances)))
+
+    rows = []
+    for clients in sorted({1, args.clients}):
+        # a new batcher per setting, as a batcher only waits for others once it has seen concurrent calls
+        settings = [('off', model.predict_proba)]
+        settings += [(f'{window}ms', MicroBatcher(model.predict_proba, args.max_batch_size, window))
+                     for window in args.windows]
+        for name, fn in settings:
+            latencies = run_clients(fn, instances, clients, args.duration)
+            rows.append({
+                'batching_window': name,
+                'clients': clients,
+                'requests_per_s': len(latencies) / args.duration,
+                **percentiles(latencies),
+            })
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
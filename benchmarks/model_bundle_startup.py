@@ -0,0 +1,115 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the cold start of a prediction service loading its model from a pickled
+dict vs a model bundle (`model_bundle.py`): time to load the model, time to the
+first prediction (after the libraries are imported), peak memory, and private
+(unshared) memory, for scikit-learn models of increasing size.
+
+Each load runs in a fresh process, so that peak memory is that of the load. The
+model files are in the page cache in both cases (a warm node restarting a pod).
+
+    python model_bundle_startup.py --sizes 256 1024 4096
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+from bench_utils import TEMPLATES_PATH, print_table, write_json
+
+N_FEATURES = 100
+
+_CHILD = """
+import json, os, sys, time
+sys.path.insert(0, os.path.join(sys.argv[1], 'src'))
+import joblib, numpy as np, sklearn.ensemble, sklearn.neural_network
+from model_bundle import load_model
+
+
+def memory_mb(path, fields):
+    with open(path) as f:
+        values = dict(line.split(':', 1) for line in f if ':' in line)
+    return sum(int(values[field].split()[0]) for field in fields) / 1024.
+
+
+start = time.perf_counter()
+saved = load_model(sys.argv[2])
+model = saved.get('model')
+loaded = time.perf_counter()
+model.predict(np.random.rand(1, int(sys.argv[3])))
+print(json.dumps({'load_ms': (loaded - start) * 1000., 'first_prediction_ms': (time.perf_counter() - start) * 1000.,
+                  'peak_rss_mb': memory_mb('/proc/self/status', ['VmHWM']),
+                  'private_mb': memory_mb('/proc/self/smaps_rollup', ['Private_Clean', 'Private_Dirty'])}))
+"""
+
+
+def build_models(kind, size, tmp):
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.neural_network import MLPClassifier
+    add_path = os.path.join(TEMPLATES_PATH, 'src')
+    if add_path not in sys.path:
+        sys.path.insert(0, add_path)
+    from model_bundle import write_bundle
+
+    rng = np.random.RandomState(0)
+    if kind == 'mlp':
+        x = rng.rand(200, N_FEATURES)
+        y = (x[:, 0] > 0.5).astype(int)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', ConvergenceWarning)
+            model = MLPClassifier(hidden_layer_sizes=(size, size), max_iter=1).fit(x, y)
+    else:
+        x = rng.rand(size * 20, N_FEATURES)
+        y = (x[:, 0] + 0.1 * rng.rand(len(x)) > 0.5).astype(int)
+        model = RandomForestClassifier(n_estimators=50, random_state=0).fit(x, y)
+    model_obj = {'model': model, 'encoder': None, 'threshold': 0.5, 'name': kind}
+    pickle_path = os.path.join(tmp, f'{kind}_{size}.pkl')
+    with open(pickle_path, 'wb') as f:
+        pickle.dump(model_obj, f)
+    bundle_path = os.path.join(tmp, f'{kind}_{size}.bundle')
+    write_bundle(model_obj, bundle_path)
+    return pickle_path, bundle_path
+
+
+def run_load(path, repeat):
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _CHILD, TEMPLATES_PATH, path, str(N_FEATURES)])
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+    # best of the repeats, for each measure
+    return {key: round(min(r[key] for r in results), 1) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 1024, 4096],
+                        help='hidden layer width of the MLP models (the random forests are trained on 20x the rows)')
+    parser.add_argument('--kinds', nargs='+', default=['mlp', 'forest'], choices=['mlp', 'forest'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in args.kinds:
+            for size in args.sizes:
+                pickle_path, bundle_path = build_models(kind, size, tmp)
+                size_mb = round(os.path.getsize(pickle_path) / 1024. / 1024., 1)
+                for fmt, path in [('pickle', pickle_path), ('bundle', bundle_path)]:
+                    rows.append({'model': kind, 'size': size, 'file_mb': size_mb, 'format': fmt,
+                                 **run_load(path, args.repeat)})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
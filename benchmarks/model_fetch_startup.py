@@ -0,0 +1,84 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the time and peak memory of fetching a model artifact at container start
+up (`fetch_model` in the python template), for a large local stand-in artifact:
+
+- legacy: the previous implementation, reading the whole artifact into memory,
+- streaming: chunked copy, without a cache,
+- cold cache / warm cache: through `MODEL_CACHE_DIR` with `MODEL_SHA256` set, on
+  the first and a subsequent start.
+
+Each fetch runs in a fresh process, so that peak memory is that of the fetch.
+
+    python model_fetch_startup.py --size-mb 1024
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_utils import TEMPLATES_PATH, print_table, write_json
+
+_CHILD = """
+import json, os, resource, sys, time
+sys.path[:0] = [os.path.join(sys.argv[1], 'src'), os.path.join(sys.argv[1], 'python', 'src')]
+from utils import fetch_model
+mode, root_path = sys.argv[2], sys.argv[3]
+start = time.perf_counter()
+if mode == 'legacy':
+    with open(os.environ['MODEL_PATH'], 'rb') as f:
+        contents = f.read()
+    with open(os.path.join(root_path, 'model', os.path.basename(os.environ['MODEL_PATH'])), 'wb') as f:
+        f.write(contents)
+else:
+    fetch_model(root_path)
+print(json.dumps({'fetch_s': time.perf_counter() - start,
+                  'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.}))
+"""
+
+
+def run_fetch(mode, env, root_path):
+    output = subprocess.check_output([sys.executable, '-c', _CHILD, TEMPLATES_PATH, mode, root_path],
+                                     env=dict(os.environ, **env))
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=512, help='size of the stand-in model artifact')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_path = os.path.join(tmp, 'remote', 'model.pkl')
+        os.makedirs(os.path.dirname(artifact_path))
+        digest = hashlib.sha256()
+        with open(artifact_path, 'wb') as f:
+            for _ in range(args.size_mb):
+                chunk = os.urandom(1024 * 1024)
+                digest.update(chunk)
+                f.write(chunk)
+
+        root_path = os.path.join(tmp, 'container')
+        os.makedirs(os.path.join(root_path, 'model'))
+        base_env = {'MODEL_PATH': artifact_path}
+        cache_env = dict(base_env, MODEL_CACHE_DIR=os.path.join(tmp, 'cache'), MODEL_SHA256=digest.hexdigest())
+        runs = [('legacy', 'legacy', base_env), ('streaming', 'fetch', base_env),
+                ('cold cache', 'fetch', cache_env), ('warm cache', 'fetch', cache_env)]
+        rows = []
+        for name, mode, env in runs:
+            model_path = os.path.join(root_path, 'model', 'model.pkl')
+            if os.path.exists(model_path):
+                os.remove(model_path)  # a fresh container
+            rows.append({'run': name, 'size_mb': args.size_mb, **run_fetch(mode, env, root_path)})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
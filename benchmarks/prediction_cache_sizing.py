@@ -0,0 +1,77 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Estimates the hit rate, evictions and memory use of the prediction service
+prediction cache for a scan-like workload, across cache sizes.
+
+The workload mimics counterfactual search: for each explained row, batches of
+candidate rows are generated by changing one or two features of the row to
+other values observed in the dataset, so many candidates repeat.
+
+    python prediction_cache_sizing.py --dataset adult_income_explan --max-entries 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench_utils import add_template_to_path, load_dataset, print_table, write_json
+
+add_template_to_path('python')
+from prediction_cache import PredictionCache  # noqa: E402
+
+
+def scan_workload(instances, explained_rows, batches_per_row, batch_size, seed=0):
+    rng = np.random.RandomState(seed)
+    column_values = [np.unique(instances[:, index].astype(str)) for index in range(instances.shape[1])]
+    for row in instances[rng.choice(len(instances), explained_rows, replace=False)]:
+        for _ in range(batches_per_row):
+            batch = np.repeat(row[np.newaxis, :], batch_size, axis=0)
+            for candidate in batch:
+                for column in rng.choice(instances.shape[1], rng.randint(1, 3), replace=False):
+                    candidate[column] = rng.choice(column_values[column])
+            yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--explained-rows', type=int, default=200)
+    parser.add_argument('--batches-per-row', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-entries', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset(args.dataset)
+    workload = list(scan_workload(instances, args.explained_rows, args.batches_per_row, args.batch_size))
+
+    def model(batch):
+        return np.zeros(len(batch))
+
+    rows = []
+    for max_entries in args.max_entries:
+        cache = PredictionCache(model, max_entries=max_entries)
+        start = time.perf_counter()
+        for batch in workload:
+            cache(batch)
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        rows.append({
+            'dataset': args.dataset,
+            'max_entries': max_entries,
+            'rows_scored': len(workload) * args.batch_size,
+            'hit_rate': stats['hit_rate'],
+            'deduplicated': stats['deduplicated'],
+            'evictions': stats['evictions'],
+            'entries': stats['entries'],
+            'memory_mb': stats['memory_bytes'] / 1e6,
+            'cache_overhead_us_per_row': elapsed / (len(workload) * args.batch_size) * 1e6,
+        })
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
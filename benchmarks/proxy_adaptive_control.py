@@ -0,0 +1,92 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Simulates a scan through the `Proxy` against a rate limited stand-in hosted model,
+with fixed chunk size and concurrency settings and with adaptive (AIMD) control.
+
+The stand-in rejects requests with 429 beyond `--upstream-max-in-flight`
+concurrent requests or `--upstream-rows-per-second`, and with 413 beyond
+`--upstream-max-rows` instances. For each setting, the script checks that the
+predictions are complete and in order, and reports the scan time, hosted model
+requests and throttled responses, and (for adaptive control) the chunk size and
+in-flight limit the controller settled on.
+
+    python proxy_adaptive_control.py --batches 20 --batch-size 5000 --upstream-max-in-flight 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench_utils import add_template_to_path, load_dataset, print_table, sample_rows, write_json
+from standin_hosted_model import StandInHostedModel
+
+add_template_to_path('proxy')
+from adaptive_control import AIMDController  # noqa: E402
+from prediction_service import Proxy  # noqa: E402
+
+
+def run_scan(proxy, batches, hosted_model):
+    requests, throttled = hosted_model.requests, hosted_model.throttled
+    start = time.perf_counter()
+    error = None
+    try:
+        for batch in batches:
+            predictions = proxy.predict(batch)
+            np.testing.assert_array_equal(predictions, batch[:, 0].astype(int))
+    except Exception as e:
+        error = type(e).__name__
+    return {
+        'scan_s': time.perf_counter() - start,
+        'rows_per_s': sum(len(batch) for batch in batches) / (time.perf_counter() - start),
+        'hosted_requests': hosted_model.requests - requests,
+        'throttled': hosted_model.throttled - throttled,
+        'error': error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--base-latency-ms', type=float, default=30.)
+    parser.add_argument('--per-row-latency-us', type=float, default=50.)
+    parser.add_argument('--upstream-max-in-flight', type=int, default=4)
+    parser.add_argument('--upstream-rows-per-second', type=float, default=None)
+    parser.add_argument('--upstream-max-rows', type=int, default=2000)
+    parser.add_argument('--target-latency-ms', type=float, default=200.)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset(args.dataset)
+    batches = []
+    for seed in range(args.batches):
+        batch = sample_rows(instances, args.batch_size, seed=seed)
+        batch[:, 0] = np.arange(args.batch_size)  # the stand-in echoes the first feature
+        batches.append(batch)
+
+    static_settings = [(100, 1), (100, 4), (1000, 4), (1000, 16)]
+    rows = []
+    with StandInHostedModel(args.base_latency_ms, args.per_row_latency_us, max_rows=args.upstream_max_rows,
+                            max_in_flight=args.upstream_max_in_flight,
+                            rows_per_second=args.upstream_rows_per_second) as hosted_model:
+        for chunk_size, concurrency in static_settings:
+            proxy = Proxy(hosted_model_url=hosted_model.url, chunk_size=chunk_size, max_concurrency=concurrency)
+            rows.append({'control': 'fixed', 'chunk_size': chunk_size, 'limit': concurrency,
+                         **run_scan(proxy, batches, hosted_model)})
+        control = AIMDController(initial_chunk_size=100, max_chunk_size=args.batch_size, max_in_flight=16,
+                                 target_latency_ms=args.target_latency_ms)
+        proxy = Proxy(hosted_model_url=hosted_model.url, adaptive_control=control)
+        result = run_scan(proxy, batches, hosted_model)
+        metrics = control.metrics()
+        rows.append({'control': 'adaptive', 'chunk_size': metrics['chunk_size'], 'limit': metrics['limit'], **result,
+                     **{k: metrics[k] for k in ('limit_increases', 'limit_decreases',
+                                                'chunk_increases', 'chunk_decreases')}})
+    print_table(rows, list(rows[-1].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
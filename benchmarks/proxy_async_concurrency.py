@@ -0,0 +1,111 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures throughput and latency of the proxy prediction service, served in the
+default (sync) and asyncio (`PROXY_SERVING_MODE=async`) modes, for increasing
+numbers of concurrent clients, against a local stand-in hosted model.
+
+The proxy is run as a subprocess from the template `src` folder. Both the proxy
+and the clients require `aiohttp`.
+
+    python proxy_async_concurrency.py --clients 1 10 100 500 --base-latency-ms 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+
+from bench_utils import TEMPLATES_PATH, load_dataset, percentiles, print_table, sample_rows, write_json
+from standin_hosted_model import StandInHostedModel
+
+
+def start_proxy(mode, hosted_model_url, port):
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([os.path.join(TEMPLATES_PATH, 'src'),
+                                           os.path.join(TEMPLATES_PATH, 'proxy', 'src'),
+                                           os.environ.get('PYTHONPATH', '')]),
+               HOSTED_MODEL_URL=hosted_model_url,
+               PROXY_SERVING_MODE=mode,
+               PROXY_PORT=str(port))
+    process = subprocess.Popen([sys.executable, os.path.join(TEMPLATES_PATH, 'proxy', 'src', 'prediction_service.py')],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'proxy exited with code {process.returncode} in {mode} mode')
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'proxy did not start in {mode} mode')
+
+
+async def run_clients(url, body, clients, duration):
+    latencies = []
+    errors = 0
+    stop = time.perf_counter() + duration
+
+    async def client(session):
+        nonlocal errors
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers={'Content-Type': 'application/json'}) as resp:
+                await resp.read()
+                if resp.status == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=clients)) as session:
+        await asyncio.gather(*(client(session) for _ in range(clients)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--batch-size', type=int, default=10, help='instances per client request')
+    parser.add_argument('--duration', type=float, default=5., help='seconds per setting')
+    parser.add_argument('--base-latency-ms', type=float, default=100.)
+    parser.add_argument('--per-row-latency-us', type=float, default=10.)
+    parser.add_argument('--port', type=int, default=8551)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset('german_credit_eval')
+    body = json.dumps({'payload': {'instances': sample_rows(instances, args.batch_size).tolist()}})
+    url = f'http://127.0.0.1:{args.port}/predict'
+
+    rows = []
+    with StandInHostedModel(args.base_latency_ms, args.per_row_latency_us) as hosted_model:
+        for mode in args.modes:
+            process = start_proxy(mode, hosted_model.url, args.port)
+            try:
+                for clients in args.clients:
+                    latencies, errors = asyncio.run(run_clients(url, body, clients, args.duration))
+                    rows.append({
+                        'mode': mode,
+                        'clients': clients,
+                        'requests_per_s': len(latencies) / args.duration,
+                        'errors': errors,
+                        **percentiles(latencies),
+                    })
+            finally:
+                process.terminate()
+                process.wait()
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures `Proxy.predict` latency for a large batch against a local stand-in
+hosted model with injected latency, across chunk sizes and concurrency.
+
+    python proxy_fan_out.py --batch-size 10000 --chunk-sizes 500 1000 --concurrency 1 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from bench_utils import add_template_to_path, load_dataset, print_table, sample_rows, write_json
+from standin_hosted_model import StandInHostedModel
+
+add_template_to_path('proxy')
+from prediction_service import Proxy  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[250, 1000, 2500])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--base-latency-ms', type=float, default=50.)
+    parser.add_argument('--per-row-latency-us', type=float, default=20.)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset(args.dataset)
+    batch = sample_rows(instances, args.batch_size)
+    batch[:, 0] = np.arange(args.batch_size)  # the stand-in echoes the first feature
+
+    settings = [(None, 1)] + [(chunk_size, concurrency)
+                              for chunk_size in args.chunk_sizes for concurrency in args.concurrency]
+    rows = []
+    with StandInHostedModel(args.base_latency_ms, args.per_row_latency_us) as hosted_model:
+        for chunk_size, concurrency in settings:
+            proxy = Proxy(hosted_model_url=hosted_model.url, chunk_size=chunk_size, max_concurrency=concurrency)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                predictions = proxy.predict(batch)
+                timings.append(time.perf_counter() - start)
+                np.testing.assert_array_equal(predictions, np.arange(args.batch_size))
+            rows.append({
+                'chunk_size': chunk_size or args.batch_size,
+                'max_concurrency': concurrency,
+                'batch_ms': min(timings) * 1000.,
+                'rows_per_s': args.batch_size / min(timings),
+            })
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
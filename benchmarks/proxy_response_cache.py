@@ -0,0 +1,99 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures repeated scans through the `Proxy` with the persistent response cache,
+against a local stand-in hosted model with injected latency.
+
+A scan is a sequence of batches, each of which shares most of its rows with the
+rows already scored (as counterfactual and robustness scans do). The scan is run
+without the cache, then cold and warm with the cache, after re-opening the cache
+file (as after a proxy restart), and after the hosted model version changes.
+
+    python proxy_response_cache.py --batches 50 --batch-size 1000 --max-entries 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench_utils import add_template_to_path, load_dataset, print_table, sample_rows, write_json
+from standin_hosted_model import StandInHostedModel
+
+add_template_to_path('proxy')
+from prediction_service import Proxy  # noqa: E402
+from response_cache import DiskResponseCache  # noqa: E402
+
+
+def make_scan(instances, batches, batch_size, new_fraction, seed=0):
+    rng = np.random.RandomState(seed)
+    pool = sample_rows(instances, batch_size, seed=seed).copy()
+    scan = []
+    for _ in range(batches):
+        batch = pool[rng.randint(0, len(pool), size=batch_size)].copy()
+        new = rng.rand(batch_size) < new_fraction
+        # perturb a numeric feature to create rows that have not been scored yet
+        batch[new, 1] = rng.randint(1, 100, size=new.sum())
+        pool = np.concatenate([pool, batch[new]])
+        scan.append(batch)
+    return scan
+
+
+def run_scan(proxy, scan, hosted_model):
+    requests, rows = hosted_model.requests, hosted_model.rows
+    start = time.perf_counter()
+    for batch in scan:
+        proxy.predict(batch)
+    return {
+        'scan_s': time.perf_counter() - start,
+        'hosted_requests': hosted_model.requests - requests,
+        'hosted_rows': hosted_model.rows - rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--new-fraction', type=float, default=0.2, help='fraction of new rows in each batch')
+    parser.add_argument('--max-entries', type=int, default=1000000)
+    parser.add_argument('--base-latency-ms', type=float, default=50.)
+    parser.add_argument('--per-row-latency-us', type=float, default=100.)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset(args.dataset)
+    scan = make_scan(instances, args.batches, args.batch_size, args.new_fraction)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            StandInHostedModel(args.base_latency_ms, args.per_row_latency_us) as hosted_model:
+        path = os.path.join(tmp, 'responses.sqlite')
+
+        def open_cache():
+            return DiskResponseCache(path, hosted_model.url, max_entries=args.max_entries,
+                                     version_header='X-Model-Version')
+
+        rows.append({'run': 'no cache', **run_scan(Proxy(hosted_model_url=hosted_model.url), scan, hosted_model)})
+        cache = open_cache()
+        proxy = Proxy(hosted_model_url=hosted_model.url, response_cache=cache)
+        rows.append({'run': 'cold cache', **run_scan(proxy, scan, hosted_model), **cache.stats()})
+        cache = open_cache()
+        proxy = Proxy(hosted_model_url=hosted_model.url, response_cache=cache)
+        rows.append({'run': 'warm cache', **run_scan(proxy, scan, hosted_model), **cache.stats()})
+        hosted_model.version = '2'
+        cache = open_cache()
+        proxy = Proxy(hosted_model_url=hosted_model.url, response_cache=cache)
+        rows.append({'run': 'new version', **run_scan(proxy, scan, hosted_model), **cache.stats()})
+
+    columns = ['run', 'scan_s', 'hosted_requests', 'hosted_rows', 'hit_rate', 'deduplicated', 'evictions',
+               'invalidations', 'entries', 'file_bytes']
+    print_table(rows, columns)
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
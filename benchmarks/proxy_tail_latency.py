@@ -0,0 +1,90 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures `Proxy.predict` tail latency against a local stand-in hosted model with
+occasional slow replicas, without and with hedged requests, and with a request
+deadline.
+
+Reports latency percentiles, the number of hosted model requests (hedging adds
+load), hedged calls and those won by the hedge, and the requests that failed
+their deadline.
+
+    python proxy_tail_latency.py --requests 2000 --slow-fraction 0.02 --slow-latency-ms 500
+"""
+import argparse
+import threading
+import time
+
+from bench_utils import add_template_to_path, load_dataset, percentiles, print_table, sample_rows, write_json
+from standin_hosted_model import StandInHostedModel
+
+add_template_to_path('proxy')
+from prediction_service import Proxy  # noqa: E402
+from tail_latency import DeadlineExceeded, LatencyTracker  # noqa: E402
+
+
+def run_clients(proxy, batches, clients):
+    latencies, exceeded = [], []
+    lock = threading.Lock()
+    next_index = iter(range(len(batches)))
+
+    def client():
+        for index in iter(lambda: next(next_index, None), None):
+            start = time.perf_counter()
+            try:
+                proxy.predict(batches[index])
+            except DeadlineExceeded:
+                with lock:
+                    exceeded.append(index)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(exceeded)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='german_credit_eval', help='csv name in notebooks/datasets')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--base-latency-ms', type=float, default=20.)
+    parser.add_argument('--slow-fraction', type=float, default=0.02)
+    parser.add_argument('--slow-latency-ms', type=float, default=500.)
+    parser.add_argument('--deadline-ms', type=float, default=200.)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    _, instances = load_dataset(args.dataset)
+    batches = [sample_rows(instances, args.batch_size, seed=seed) for seed in range(args.requests)]
+
+    settings = [('baseline', None, None), ('hedged p95', 95, None), ('hedged p90', 90, None),
+                (f'deadline {args.deadline_ms:g}ms', None, args.deadline_ms),
+                (f'hedged p95 + deadline {args.deadline_ms:g}ms', 95, args.deadline_ms)]
+    rows = []
+    with StandInHostedModel(args.base_latency_ms, slow_fraction=args.slow_fraction,
+                            slow_latency_ms=args.slow_latency_ms) as hosted_model:
+        for name, percentile, deadline_ms in settings:
+            hedging = LatencyTracker(percentile=percentile) if percentile else None
+            proxy = Proxy(hosted_model_url=hosted_model.url, max_concurrency=args.clients,
+                          hedging=hedging, deadline_ms=deadline_ms)
+            requests = hosted_model.requests
+            latencies, exceeded = run_clients(proxy, batches, args.clients)
+            stats = hedging.stats() if hedging else {}
+            rows.append({'setting': name, **percentiles(latencies), 'max_ms': max(latencies) * 1000.,
+                         'hosted_requests': hosted_model.requests - requests,
+                         'hedged': stats.get('hedged'), 'hedges_won': stats.get('hedges_won'),
+                         'deadline_exceeded': exceeded})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Performance regression gate for a running prediction service: load tests it with
+`load_test.py` and compares throughput and latency to a stored baseline. Exits
+with status 1 if, for any setting, the throughput (rows/s) is lower, or the p50 or
+p95 latency higher, than the baseline by more than `--tolerance`, or the error
+rate is above `--max-error-rate`, and with status 2 (before load testing) if the
+service has no baseline.
+
+The baseline file holds the results of each named service. With `--update-baseline`,
+the results are recorded as the service's baseline (creating the file if needed),
+and the gate passes. Baselines are only comparable on the same machine, so record
+them on the machine that runs the gate.
+
+Used by `models/containerized_model/examples/run_test.sh benchmark`, or directly:
+
+    python regression_gate.py --name sklearn_german_credit --dataset german_credit_eval \
+        --baseline baseline.json --update-baseline   # record the baseline
+    python regression_gate.py --name sklearn_german_credit --dataset german_credit_eval \
+        --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.request
+
+from bench_utils import load_dataset, print_table, write_json
+from load_test import request_bodies, run_load
+
+GATED_MEASURES = {
+    # measure: direction in which it regresses
+    'rows_per_s': 'lower',
+    'p50_ms': 'higher',
+    'p95_ms': 'higher',
+}
+
+
+def wait_until_healthy(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f'service not healthy at {url} after {timeout}s')
+
+
+def compare(results, baseline, tolerance, max_error_rate):
+    """
+    Compares the results of each setting to the baseline result of the same setting.
+
+    :return: list of comparison rows, each with a `regressions` list (empty if the setting passes)
+    """
+    keys = ('encoding', 'concurrency', 'batch_size')
+    baseline_by_setting = {tuple(row[key] for key in keys): row for row in baseline}
+    comparisons = []
+    for result in results:
+        base = baseline_by_setting.get(tuple(result[key] for key in keys))
+        row = {key: result[key] for key in keys}
+        regressions = []
+        if result['error_rate'] > max_error_rate:
+            regressions.append(f'error rate {result["error_rate"]:.2%}')
+        for measure, direction in GATED_MEASURES.items():
+            value = result[measure]
+            base_value = base.get(measure) if base else None
+            row[measure] = value
+            row[f'baseline {measure}'] = base_value
+            if value is None or not base_value:
+                continue
+            change = value / base_value - 1.
+            row[f'{measure} change'] = f'{change:+.1%}'
+            if (direction == 'lower' and change < -tolerance) or (direction == 'higher' and change > tolerance):
+                regressions.append(f'{measure} {change:+.1%}')
+        row['regressions'] = regressions
+        comparisons.append(row)
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--name', required=True, help='name of the service in the baseline file')
+    parser.add_argument('--dataset', required=True, help='csv name in notebooks/datasets, or a path')
+    parser.add_argument('--drop', nargs='*', default=['outcome', 'income', 'readmitted'],
+                        help='non-input columns of the dataset')
+    parser.add_argument('--url', default='http://127.0.0.1:8551/predict')
+    parser.add_argument('--health-url', default='http://127.0.0.1:8551/health')
+    parser.add_argument('--start-timeout', type=float, default=120., help='seconds to wait for the service')
+    parser.add_argument('--baseline', required=True, help='baseline json file')
+    parser.add_argument('--update-baseline', action='store_true', help='record the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression, e.g. 0.2')
+    parser.add_argument('--max-error-rate', type=float, default=0.)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--duration', type=float, default=5., help='measured seconds per setting')
+    parser.add_argument('--warmup', type=float, default=2., help='seconds per setting before measuring')
+    parser.add_argument('--encoding', default='json')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    if not args.update_baseline and args.name not in baselines:
+        print(f'no baseline of {args.name} in {args.baseline}: record it with --update-baseline', file=sys.stderr)
+        sys.exit(2)
+
+    wait_until_healthy(args.health_url, args.start_timeout)
+    _, instances = load_dataset(args.dataset, drop=args.drop)
+    results = []
+    for concurrency in args.concurrency:
+        for batch_size in args.batch_sizes:
+            bodies = request_bodies(instances, batch_size, args.encoding)
+            result = run_load(args.url, bodies, batch_size, concurrency=concurrency, duration=args.duration,
+                              warmup=args.warmup, encoding=args.encoding)
+            results.append({'encoding': args.encoding, 'concurrency': concurrency, 'batch_size': batch_size,
+                            **result})
+    write_json(results, args.json)
+
+    if args.update_baseline:
+        baselines[args.name] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print_table(results, ['encoding', 'concurrency', 'batch_size', 'rows_per_s', 'p50_ms', 'p95_ms', 'error_rate'])
+        print(f'recorded the baseline of {args.name} in {args.baseline}')
+        return
+
+    comparisons = compare(results, baselines[args.name], args.tolerance, args.max_error_rate)
+    print_table([{**row, 'regressions': ', '.join(row['regressions']) or 'none'} for row in comparisons],
+                list(comparisons[0].keys()))
+    failed = [row for row in comparisons if row['regressions']]
+    if failed:
+        for row in failed:
+            print(f'REGRESSION in {args.name} (concurrency {row["concurrency"]}, batch size {row["batch_size"]}): '
+                  f'{", ".join(row["regressions"])}')
+        sys.exit(1)
+    print(f'{args.name} is within {args.tolerance:.0%} of its baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the time to convert a batch of model outputs to predictions with the
+per-row conversions the wrappers used, and with the vectorized
+`ScorePostprocessor` (`postprocessing.py`), for batch sizes 1-100k:
+
+- argmax: class scores to labels (the MOJO template, 3 classes), per row with
+  `np.argmax` and a list lookup,
+- binary: two-class scores to labels 1/2 (the H2O German Credit apps, where equal
+  scores map to 2), per row with `DataFrame.apply` as `app_h2o_python_scoring.py` did,
+- threshold: two-class scores thresholded at 0.5 to labels,
+- regression: a single output column to a 1-d array, per row.
+
+    python score_postprocessing.py --batch-sizes 1 100 10000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import DEFAULT_BATCH_SIZES, add_template_to_path, print_table, time_call, write_json
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    add_template_to_path('h2o_mojo')
+    from postprocessing import ScorePostprocessor
+
+    outcomes = ['Iris-setosa', 'Iris-versicolor', 'Iris-virginica']
+    to_outcomes = ScorePostprocessor(labels=outcomes)
+    to_labels = ScorePostprocessor(labels=[1, 2], ties='last')
+    to_thresholded = ScorePostprocessor(labels=[1, 2], threshold=0.5)
+
+    def per_row_argmax(scores):
+        return np.array([outcomes[int(np.argmax(row))] for row in scores])
+
+    def per_row_binary(scores):
+        frame = pd.DataFrame(scores, columns=['outcome.1', 'outcome.2'])
+        return frame.apply(lambda row: 1 if row.iloc[0] > row.iloc[1] else 2, axis=1).values
+
+    def per_row_threshold(scores):
+        return np.array([2 if row[1] > 0.5 else 1 for row in scores])
+
+    def per_row_regression(outputs):
+        return np.array([row[0] for row in outputs])
+
+    rng = np.random.RandomState(0)
+    rows = []
+    for batch_size in args.batch_sizes:
+        # random scores never tie, so the first rows are ties, which are checked but barely timed
+        multiclass = rng.dirichlet(np.ones(3), batch_size)
+        multiclass[:3] = [[0.4, 0.4, 0.2], [0.2, 0.4, 0.4], [1/3, 1/3, 1/3]][:batch_size]
+        binary = rng.dirichlet(np.ones(2), batch_size)
+        binary[:2] = [[0.5, 0.5], [0.7, 0.3]][:batch_size]
+        regression = rng.rand(batch_size, 1)
+        cases = {
+            'argmax': (multiclass, per_row_argmax, to_outcomes.argmax),
+            'binary': (binary, per_row_binary, to_labels.argmax),
+            'threshold': (binary, per_row_threshold, to_thresholded),
+            'regression': (regression, per_row_regression, ScorePostprocessor.regression),
+        }
+        row = {'batch_size': batch_size}
+        for name, (outputs, per_row, vectorized) in cases.items():
+            np.testing.assert_array_equal(per_row(outputs), vectorized(outputs))
+            row[f'{name} per row ms'] = round(time_call(per_row, outputs) * 1000., 3)
+            row[f'{name} vectorized ms'] = round(time_call(vectorized, outputs) * 1000., 3)
+        rows.append(row)
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
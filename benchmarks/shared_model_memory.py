@@ -0,0 +1,135 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the memory of prediction service worker processes as workers are added,
+for a large scikit-learn model (an MLP with wide hidden layers) loaded by the
+python template's `load_model_pickle`:
+
+- per-worker load: each worker loads the model itself (no preload before fork),
+- preload: the model is unpickled once, then the workers are forked,
+- preload shared: as preload, with `shared_memory` enabled (arrays memory-mapped
+  from a joblib sidecar file, and `gc.freeze` before the fork).
+
+The workers score requests for a while before their memory is read from
+`/proc/<pid>/smaps_rollup` (Linux only): the proportional set size (PSS, shared
+pages divided among the processes sharing them) summed over the parent and the
+workers, and the private (unshared) memory per worker.
+
+    python shared_model_memory.py --hidden-size 4096 --workers 1 2 4 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import warnings
+
+import numpy as np
+
+from bench_utils import add_template_to_path, print_table, write_json
+
+
+def smaps_rollup(pid):
+    """Returns the PSS and private memory in MB of a process"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024.
+    return values['Pss'], values.get('Private_Clean', 0.) + values.get('Private_Dirty', 0.)
+
+
+def build_model(path, n_features, hidden_size):
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPClassifier
+    rng = np.random.RandomState(0)
+    x = rng.rand(200, n_features)
+    y = (x[:, 0] > 0.5).astype(int)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        model = MLPClassifier(hidden_layer_sizes=(hidden_size, hidden_size), max_iter=1).fit(x, y)
+    with open(path, 'wb') as f:
+        pickle.dump({'model': model, 'encoder': None}, f)
+
+
+def worker(model_pickle, model_path, config, n_features, requests, ready, done):
+    if model_pickle is None:
+        from shared_memory import load_model_pickle
+        model_pickle = load_model_pickle(model_path, config)
+    model = model_pickle['model']
+    rng = np.random.RandomState(os.getpid())
+    for _ in range(requests):
+        model.predict(rng.rand(10, n_features))
+    ready.release()
+    done.wait()
+
+
+def run(mode, workers, model_path, n_features, requests):
+    config = {'enabled': mode == 'preload shared', 'sidecar_dir': os.path.dirname(model_path)}
+    context = multiprocessing.get_context('fork')
+    ready, done = context.Semaphore(0), context.Event()
+    # run each configuration in a fresh process, so that earlier runs do not affect its memory
+    parent = context.Process(target=run_parent, args=(mode, workers, model_path, config, n_features, requests,
+                                                      ready, done))
+    parent.start()
+    parent.join()
+    if parent.exitcode != 0:
+        raise RuntimeError(f'{mode} with {workers} workers failed')
+
+
+def run_parent(mode, workers, model_path, config, n_features, requests, ready, done):
+    from shared_memory import freeze_before_fork, load_model_pickle
+    model_pickle = None
+    if mode != 'per-worker load':
+        model_pickle = load_model_pickle(model_path, config)
+        freeze_before_fork(config)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=worker, args=(model_pickle, model_path, config, n_features, requests,
+                                                      ready, done))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.acquire()
+    memory = [smaps_rollup(process.pid) for process in processes]
+    parent_pss, _ = smaps_rollup(os.getpid())
+    done.set()
+    for process in processes:
+        process.join()
+    total_pss = parent_pss + sum(pss for pss, _ in memory)
+    row = {'mode': mode, 'workers': workers,
+           'total_pss_mb': round(total_pss, 1),
+           'pss_per_worker_mb': round(total_pss / workers, 1),
+           'private_per_worker_mb': round(sum(private for _, private in memory) / workers, 1)}
+    with open(os.path.join(os.path.dirname(model_path), 'results.jsonl'), 'a') as f:
+        f.write(json.dumps(row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hidden-size', type=int, default=4096, help='width of the two hidden MLP layers')
+    parser.add_argument('--n-features', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=50, help='requests scored by each worker')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    add_template_to_path('python')
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pkl')
+        build_model(model_path, args.n_features, args.hidden_size)
+        print(f'model file: {os.path.getsize(model_path) / 1024. / 1024.:.1f} MB')
+        for mode in ['per-worker load', 'preload', 'preload shared']:
+            for workers in args.workers:
+                run(mode, workers, model_path, args.n_features, args.requests)
+        with open(os.path.join(tmp, 'results.jsonl')) as f:
+            rows = [json.loads(line) for line in f]
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+A local stand-in for a hosted model webservice (e.g. SageMaker or AzureML), for
+benchmarking the proxy template against.
+
+It accepts the Certifai predict schema (`{"payload": {"instances": [[...]]}}`) and
+responds with `{"payload": {"predictions": [...]}}`, where each prediction is the
+first feature of the instance, so that callers can check the order of results.
+Latency is injected per request and per instance. The model version is returned
+in the `X-Model-Version` response header. Rate limits can be simulated by
+rejecting requests with 429 beyond a number of concurrent requests, or beyond a
+throughput of instances per second. Slow replicas can be simulated by adding
+latency to a random fraction of the requests.
+"""
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandInHostedModel:
+    def __init__(self, base_latency_ms=20., per_row_latency_us=10., max_rows=None, port=0, version='1',
+                 max_in_flight=None, rows_per_second=None, slow_fraction=0., slow_latency_ms=0.):
+        """
+        :param float base_latency_ms: latency added to every request
+        :param float per_row_latency_us: latency added per instance in the request
+        :param Optional[int] max_rows: requests with more instances are rejected with 413, like a payload limit
+        :param int port: port to listen on, defaults to any free port
+        :param str version: model version returned in the `X-Model-Version` header
+        :param Optional[int] max_in_flight: requests beyond this number of concurrent requests are rejected with 429
+        :param Optional[float] rows_per_second: requests beyond this throughput (with a burst of one second's worth
+            of instances) are rejected with 429
+        :param float slow_fraction: fraction of requests served by a slow replica
+        :param float slow_latency_ms: latency added to the requests served by a slow replica
+        """
+        self.base_latency = base_latency_ms / 1000.
+        self.per_row_latency = per_row_latency_us / 1e6
+        self.max_rows = max_rows
+        self.version = version
+        self.max_in_flight = max_in_flight
+        self.rows_per_second = rows_per_second
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency_ms / 1000.
+        self.requests = 0
+        self.rows = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._tokens = rows_per_second
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/predict'
+
+    def latency(self, rows):
+        """Returns the injected latency in seconds for a request with `rows` instances."""
+        slow = self.slow_latency if self.slow_fraction and random.random() < self.slow_fraction else 0.
+        return self.base_latency + rows * self.per_row_latency + slow
+
+    def respond(self, instances):
+        """Returns (status, response dict) for a request, after the injected latency."""
+        with self._lock:
+            self.requests += 1
+            self.rows += len(instances)
+            if self.max_rows is not None and len(instances) > self.max_rows:
+                return 413, {'error': 'payload too large'}
+            if self._throttle(len(instances)):
+                self.throttled += 1
+                return 429, {'error': 'too many requests'}
+            self._in_flight += 1
+        try:
+            time.sleep(self.latency(len(instances)))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        return 200, {'payload': {'predictions': [instance[0] for instance in instances]}}
+
+    def _throttle(self, rows):
+        # called with the lock held
+        if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+            return True
+        if self.rows_per_second is not None:
+            now = time.monotonic()
+            self._tokens = min(self.rows_per_second, self._tokens + (now - self._refilled) * self.rows_per_second)
+            self._refilled = now
+            if rows > self._tokens:
+                return True
+            self._tokens -= rows
+        return False
+
+    def _handler(self):
+        model = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # respond without waiting on the delayed ACK of the client
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, response = model.respond(json.loads(body)['payload']['instances'])
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Model-Version', model.version)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on the request (e.g. its deadline passed)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,106 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the latency of the first requests to a freshly started prediction service,
+without and with the start up warm-up pass (`warmup` in metadata.yml), for the
+python (scikit-learn random forest) and xgboost DMatrix templates on german_credit.
+
+Each service starts in a fresh process. After start up (and the warm-up pass, if
+enabled), batch size 1 requests are sent to its `/predict` endpoint, and the
+first request latency, steady state latency, and the number of requests and time
+until latency is within 1.5x of steady state are reported.
+
+    python startup_warmup.py --requests 50
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from bench_utils import DATASETS_PATH, TEMPLATES_PATH, print_table, write_json
+
+_CHILD = """
+import json, os, sys, time
+start = time.monotonic()
+templates_path, model_type, model_path, warmup, requests = sys.argv[1:6]
+sys.path[:0] = [os.path.join(templates_path, 'src'), os.path.join(templates_path, model_type, 'src')]
+import pickle
+import numpy as np
+import prediction_service
+from warmup import install_warmup, settling
+
+with open(model_path, 'rb') as f:
+    saved = pickle.load(f)
+rows = saved['rows']
+if model_type == 'python':
+    app = prediction_service.PythonModelWrapper(model=saved['model'], supports_soft_scores=False,
+                                                metadata={})
+else:
+    app = prediction_service.XgboostWrapper(model=saved['model'], supports_soft_scores=False,
+                                            metadata={'task_type': 'regression'})
+app.set_global_imports()
+config = {'enabled': True, 'rows': rows, 'batch_sizes': [1, 10, 100], 'rounds': 20} if warmup == 'on' else None
+install_warmup(app, config)
+started = time.monotonic()
+client = app.app.test_client()
+latencies = []
+for index in range(int(requests)):
+    body = json.dumps({'payload': {'instances': [rows[(index * 7) % len(rows)]]}})
+    call_start = time.monotonic()
+    response = client.post('/predict', data=body, content_type='application/json')
+    latencies.append(time.monotonic() - call_start)
+    assert response.status_code == 200, response.get_data(as_text=True)
+ready = client.get('/ready')
+result = {'startup_ms': (started - start) * 1000., 'ready_status': ready.status_code,
+          **settling(latencies, 1.5)}
+print(json.dumps(result))
+"""
+
+
+def build_models(tmp):
+    from sklearn.ensemble import RandomForestClassifier
+    import xgboost
+    df = pd.read_csv(os.path.join(DATASETS_PATH, 'german_credit_eval_multiclass_encoded.csv'))
+    y = df['outcome'].values
+    x = df.drop(columns=['outcome']).values.astype(float)
+    rows = x[:200].tolist()
+    paths = {}
+    models = {
+        'python': RandomForestClassifier(n_estimators=200, random_state=0).fit(x, y),
+        'python_xgboost_dmatrix': xgboost.train({'max_depth': 6}, xgboost.DMatrix(x, label=y), num_boost_round=200),
+    }
+    for model_type, model in models.items():
+        paths[model_type] = os.path.join(tmp, f'{model_type}.pkl')
+        with open(paths[model_type], 'wb') as f:
+            pickle.dump({'model': model, 'rows': rows}, f)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=50, help='requests sent after start up')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for model_type, model_path in build_models(tmp).items():
+            for warmup in ['off', 'on']:
+                output = subprocess.check_output([sys.executable, '-c', _CHILD, TEMPLATES_PATH, model_type,
+                                                  model_path, warmup, str(args.requests)])
+                result = json.loads(output.decode().strip().splitlines()[-1])
+                rows.append({'template': model_type, 'warmup': warmup,
+                             **{key: round(value, 2) if isinstance(value, float) else value
+                                for key, value in result.items()}})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
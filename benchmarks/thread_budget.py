@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the scoring throughput of forked worker processes for several splits of
+the CPUs between workers and native threads per worker (`thread_budget.py`), for
+an xgboost booster (OpenMP) and a scikit-learn MLP (BLAS) on german_credit.
+
+Each worker applies its thread budget, then scores batches in a loop for a fixed
+duration; all workers start together. The `unlimited` split is the default
+service (3 workers, native thread pools with a thread per core). Splits are
+derived from the CPUs available to the process, so run it on the machine size
+the service is deployed on.
+
+    python thread_budget.py --batch-size 100 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import DATASETS_PATH, add_template_to_path, print_table, write_json
+
+
+def build_models():
+    import xgboost as xgb
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPClassifier
+    df = pd.read_csv(os.path.join(DATASETS_PATH, 'german_credit_eval_multiclass_encoded.csv'))
+    y = df.pop('outcome').values
+    x = df.values.astype(np.float32)
+    booster = xgb.train({'max_depth': 6}, xgb.DMatrix(x, label=y), num_boost_round=200)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', ConvergenceWarning)
+        mlp = MLPClassifier(hidden_layer_sizes=(512, 512), max_iter=5, random_state=0).fit(x, y)
+    return {'xgboost': (booster, booster.inplace_predict), 'mlp': (mlp, mlp.predict_proba)}, x
+
+
+def _worker(budget, model, predict, batch, seconds, start, results):
+    if budget is not None:
+        budget.apply(model)
+    while time.time() < start:
+        time.sleep(0.001)
+    rows = 0
+    while time.time() < start + seconds:
+        predict(batch)
+        rows += len(batch)
+    results.put(rows)
+
+
+def throughput(budget, num_workers, model, predict, batch, seconds):
+    """Returns the total rows scored per second by `num_workers` forked workers"""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    # start together, after all the workers are forked
+    start = time.time() + 0.5
+    workers = [context.Process(target=_worker, args=(budget, model, predict, batch, seconds, start, results))
+               for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    total = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return total / seconds
+
+
+def splits(cpus):
+    """(workers, threads per worker) splits of the CPUs, and the unlimited default"""
+    candidates = [(cpus, 1), (max(1, cpus // 2), 2), (max(1, cpus // 4), 4), (1, cpus)]
+    result = []
+    for workers, threads in candidates:
+        if workers * threads <= cpus and (workers, threads) not in result:
+            result.append((workers, threads))
+    return result + [(3, None)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=5.)
+    parser.add_argument('--cpus', type=int, help='CPU budget, defaults to the CPUs available to the process')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    add_template_to_path('python')
+    from thread_budget import ThreadBudget, available_cpus
+
+    cpus = args.cpus or available_cpus()
+    models, x = build_models()
+    batch = x[np.random.RandomState(0).randint(0, len(x), args.batch_size)]
+    rows = []
+    for name, (model, predict) in models.items():
+        for workers, threads in splits(cpus):
+            budget = None if threads is None else ThreadBudget(num_workers=workers, threads_per_worker=threads,
+                                                                cpus=cpus)
+            rows_per_second = throughput(budget, workers, model, predict, batch, args.seconds)
+            rows.append({'model': name, 'cpus': cpus, 'workers': workers,
+                         'threads_per_worker': threads or 'unlimited', 'rows_per_s': round(rows_per_second)})
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
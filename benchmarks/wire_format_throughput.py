@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Compares the throughput of the JSON and binary columnar (npy, Arrow IPC)
+encodings of the prediction service `/predict` request and response.
+
+Without `--url`, measures the encoding work only (client encode, service decode,
+service encode of the response, client decode), excluding inference. With
+`--url`, POSTs each encoding to a running prediction service instead.
+
+    python wire_format_throughput.py --datasets german_credit_eval adult_income_explan
+
+Each dataset is measured both as raw (mixed type) rows, and one-hot encoded as a
+float64 matrix, as sent to services that score already encoded instances.
+"""
+import argparse
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import (DEFAULT_BATCH_SIZES, add_template_to_path, load_dataset,
+                         print_table, sample_rows, time_call, write_json)
+
+add_template_to_path('python')
+import wire_formats  # noqa: E402
+
+
+def json_service_decode(body):
+    # what the JSON endpoint does with a request body
+    import json
+    return np.array(json.loads(body)['payload']['instances'], dtype=object)
+
+
+def round_trip(batch, content_type):
+    body = wire_formats.encode_instances(batch, content_type)
+    if content_type == wire_formats.JSON_CONTENT_TYPE:
+        instances = json_service_decode(body)
+    else:
+        instances = wire_formats.decode_instances(body, content_type)
+    predictions = np.zeros(len(instances), dtype=np.int64)
+    response = wire_formats.encode_predictions(predictions, None, content_type)
+    wire_formats.decode_predictions(response, content_type)
+    return len(body)
+
+
+def post(session, url, batch, content_type):
+    body = wire_formats.encode_instances(batch, content_type)
+    response = session.post(url, data=body, headers={'Content-Type': content_type, 'Accept': content_type})
+    response.raise_for_status()
+    wire_formats.decode_predictions(response.content, content_type)
+    return len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datasets', nargs='+', default=['german_credit_eval', 'adult_income_explan'],
+                        help='csv names in notebooks/datasets')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES[:-1])
+    parser.add_argument('--encodings', nargs='+', default=['json', 'npy', 'arrow'])
+    parser.add_argument('--url', help='predict url of a running prediction service, e.g. http://127.0.0.1:8551/predict')
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    content_types = {
+        'json': wire_formats.JSON_CONTENT_TYPE,
+        'npy': wire_formats.NPY_CONTENT_TYPE,
+        'arrow': wire_formats.ARROW_CONTENT_TYPE,
+    }
+    if args.url:
+        import requests
+        session = requests.Session()
+
+    rows = []
+    for dataset in args.datasets:
+        _, raw = load_dataset(dataset)
+        encoded = pd.get_dummies(pd.DataFrame(raw).infer_objects()).values.astype(np.float64)
+        for (kind, instances), batch_size in product([('raw', raw), ('encoded', encoded)], args.batch_sizes):
+            batch = sample_rows(instances, batch_size)
+            for encoding in args.encodings:
+                content_type = content_types[encoding]
+                if args.url:
+                    fn, fn_args = post, (session, args.url, batch, content_type)
+                else:
+                    fn, fn_args = round_trip, (batch, content_type)
+                seconds = time_call(fn, *fn_args, repeat=3)
+                rows.append({
+                    'dataset': dataset,
+                    'instances': kind,
+                    'batch_size': batch_size,
+                    'encoding': encoding,
+                    'request_bytes': fn(*fn_args),
+                    'ms': seconds * 1000.,
+                    'rows_per_s': batch_size / seconds,
+                })
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Measures the latency of binary-classification `soft_predict` of the xgboost DMatrix
+template (`XgboostWrapper`) on german_credit, for batch sizes 1-100k:
+
+- dmatrix list: a DMatrix per request and a per-row list of scores (as the
+  income_prediction app did),
+- dmatrix: a DMatrix per request and `np.column_stack` of the scores (as the
+  template did),
+- inplace: in place prediction on a contiguous float32 copy of the instances,
+  into a preallocated (n, 2) score array, with the default and a single thread.
+
+    python xgboost_inplace_predict.py --batch-sizes 1 100 10000
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bench_utils import (DATASETS_PATH, DEFAULT_BATCH_SIZES, add_template_to_path, print_table, sample_rows,
+                         time_call, write_json)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--json', help='optional path to write the results as json')
+    args = parser.parse_args()
+
+    import xgboost as xgb
+    add_template_to_path('python_xgboost_dmatrix')
+    import prediction_service
+
+    df = pd.read_csv(os.path.join(DATASETS_PATH, 'german_credit_eval.csv'))
+    df = pd.get_dummies(df, dtype=float)
+    y = (df.pop('outcome').values == 2).astype(int)
+    x = df.values.astype(float)
+    booster = xgb.train({'objective': 'binary:logistic', 'max_depth': 6}, xgb.DMatrix(x, label=y),
+                        num_boost_round=100)
+
+    def wrapper(**inference):
+        app = prediction_service.XgboostWrapper(model=booster.copy(), supports_soft_scores=True,
+                                                metadata={'xgboost_inference': inference})
+        app.set_global_imports()
+        return app
+
+    def dmatrix_list(npinstances):
+        results = booster.predict(xgb.DMatrix(data=npinstances))
+        return np.array([[1. - r, r] for r in results])
+
+    def dmatrix(npinstances):
+        results = booster.predict(xgb.DMatrix(data=npinstances))
+        return np.column_stack((1. - results, results))
+
+    variants = {
+        'dmatrix list': dmatrix_list,
+        'dmatrix': dmatrix,
+        'inplace': wrapper().soft_predict,
+        'inplace nthread=1': wrapper(nthread=1).soft_predict,
+    }
+    # requests arrive as object arrays decoded from json
+    instances = x.astype(object)
+    expected = dmatrix(instances[:100])
+    for name, fn in variants.items():
+        np.testing.assert_allclose(fn(instances[:100]), expected, rtol=1e-6)
+
+    rows = []
+    for batch_size in args.batch_sizes:
+        batch = sample_rows(instances, batch_size)
+        row = {'batch_size': batch_size}
+        for name, fn in variants.items():
+            row[f'{name} ms'] = round(time_call(fn, batch) * 1000., 3)
+        rows.append(row)
+    print_table(rows, list(rows[0].keys()))
+    write_json(rows, args.json)
+
+
+if __name__ == '__main__':
+    main()
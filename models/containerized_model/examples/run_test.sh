@@ -12,6 +12,10 @@ THIS_DIR="$( cd "$(dirname "$0")" >/dev/null 2>&1 || exit ; pwd -P )"
 GEN_DIR="${THIS_DIR}/generated-container-model"
 PYTHON_VERSION=${PYTHON_VERSION:-3.8}  # or 3.7
 NAMESPACE=certifai-models
+BENCHMARKS_DIR="${THIS_DIR}/../../../benchmarks"
+BENCHMARK_BASELINE=${BENCHMARK_BASELINE:-${THIS_DIR}/benchmark_baseline.json}
+BENCHMARK_TOLERANCE=${BENCHMARK_TOLERANCE:-0.2}  # allowed relative regression of throughput and latency
+BENCHMARK_UPDATE_BASELINE=${BENCHMARK_UPDATE_BASELINE:-0}  # 1 to record the results as the baseline
 
 function base_setup() {
   model_type=$1
@@ -68,6 +72,8 @@ function end_prediction_service() {
     end_prediction_service_local
   elif [ $target == "minikube" ]; then
     end_prediction_service_minikube
+  elif [ $target == "benchmark" ]; then
+    end_prediction_service_benchmark
   fi
   result=failed # set for next test, until it explicitly succeeds
 }
@@ -95,6 +101,15 @@ function end_prediction_service_minikube() {
   kubectl delete deployment ${resource_name} --ignore-not-found --namespace $NAMESPACE
 }
 
+function end_prediction_service_benchmark() {
+  if [ -n "$service_pid" ]
+  then
+    kill ${service_pid} || true
+    wait ${service_pid} || true
+  fi
+  unset service_pid
+}
+
 function build() {
   image_name=$1
   echo "***Building ${image_name}***"
@@ -167,6 +182,31 @@ function run_and_test() {
   end_prediction_service succeeded
 }
 
+# Runs the generated prediction service directly (without docker), and fails if its
+# throughput or latency regressed from the baseline by more than the tolerance, or it
+# has no baseline (unless BENCHMARK_UPDATE_BASELINE=1, which records the baseline)
+function run_and_benchmark() {
+  local_name=$1
+  model_file=$2
+  dataset=$3
+  outcome_column=$4
+  echo "***Running ${local_name} locally***"
+  MODEL_PATH=${THIS_DIR}/${local_name}/model/${model_file} \
+    METADATA_PATH=${THIS_DIR}/${local_name}/model/metadata.yml \
+    H2O_LICENSE_PATH=${THIS_DIR}/license.txt \
+    python ${GEN_DIR}/src/prediction_service.py &
+  service_pid=$!
+  echo "***Benchmarking ${local_name}***"
+  update_baseline=""
+  if [ "${BENCHMARK_UPDATE_BASELINE}" = "1" ]; then
+    update_baseline="--update-baseline"
+  fi
+  (cd ${BENCHMARKS_DIR} && python regression_gate.py --name ${local_name} --dataset ${dataset} \
+    --drop "${outcome_column}" --baseline ${BENCHMARK_BASELINE} --tolerance ${BENCHMARK_TOLERANCE} \
+    ${update_baseline})
+  echo "***No performance regression in ${local_name}***"
+  end_prediction_service succeeded
+}
 
 # Install the toolkit, if its not already installed
 if ! command -v certifai &> /dev/null
@@ -184,6 +224,8 @@ if [ $target == "local" ]; then
 elif [ $target == "minikube" ]; then
   echo "Running minikube prediction service tests"
   minikube_setup
+elif [ $target == "benchmark" ]; then
+  echo "Running local prediction service benchmarks"
 else
   echo "Invalid target environment"
   exit 1
@@ -192,6 +234,29 @@ fi
 set -exv
 trap end_prediction_service EXIT
 
+if [ $target == "benchmark" ]; then
+  train_models
+  python_setup python sklearn_predict
+  run_and_benchmark sklearn_german_credit model.pkl ${THIS_DIR}/h2o_german_credit/explain.csv outcome
+  python_setup python xgboost_predict
+  run_and_benchmark xgboost_iris model.pkl ${THIS_DIR}/h2o_iris/explain.csv species
+  python_setup python_xgboost_dmatrix xgboost_dmatrix_predict
+  run_and_benchmark xgboost_dmatrix_income model.pkl ${THIS_DIR}/xgboost_dmatrix_income/explain.csv income
+  # The H2O MOJO services require the Driverless AI mojo runtime and license
+  if ls ${THIS_DIR}/daimojo*linux_x86_64.whl 1> /dev/null 2>&1 && [ -f ${THIS_DIR}/license.txt ]; then
+    pip install ${THIS_DIR}/daimojo*linux_x86_64.whl
+    h2o_setup h2o_mojo h2o_mojo_predict
+    run_and_benchmark h2o_auto_insurance pipeline.mojo ${THIS_DIR}/h2o_auto_insurance/explain.csv "Total Claim Amount"
+    run_and_benchmark h2o_german_credit pipeline.mojo ${THIS_DIR}/h2o_german_credit/explain.csv outcome
+    run_and_benchmark h2o_iris pipeline.mojo ${THIS_DIR}/h2o_iris/explain.csv species
+  else
+    echo "***Skipping the H2O MOJO benchmarks: no daimojo wheel or license.txt***"
+  fi
+  echo "***All benchmarks completed without regression***"
+  trap - EXIT
+  exit 0
+fi
+
 # Predict service for H2O MOJO
 h2o_setup h2o_mojo h2o_mojo_predict
 build h2o_mojo_predict
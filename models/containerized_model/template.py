@@ -33,6 +33,47 @@ def main():
         }
         return file_metadata
 
+    def generate_python_common_file_metadata():
+        file_metadata = {
+            'src/wire_formats.py': {
+                'exec_permission': False,
+            },
+            'src/batching.py': {
+                'exec_permission': False,
+            },
+            'src/prediction_cache.py': {
+                'exec_permission': False,
+            },
+            'src/artifact_cache.py': {
+                'exec_permission': False,
+            },
+            'src/shared_memory.py': {
+                'exec_permission': False,
+            },
+            'src/model_bundle.py': {
+                'exec_permission': False,
+            },
+            'src/warmup.py': {
+                'exec_permission': False,
+            },
+            'src/thread_budget.py': {
+                'exec_permission': False,
+            },
+            'src/postprocessing.py': {
+                'exec_permission': False,
+            },
+            'src/metrics.py': {
+                'exec_permission': False,
+            },
+            'src/profiling.py': {
+                'exec_permission': False,
+            },
+            'src/serving.py': {
+                'exec_permission': False,
+            },
+        }
+        return file_metadata
+
     def apply_template(env, filename, exec_permission=False, **kwargs):
         _template = env.get_template(filename)
         if kwargs is not None:
@@ -60,6 +101,7 @@ def main():
 
         # Common templates
         apply_templates('templates', generate_base_file_metadata())
+        apply_templates('templates', generate_python_common_file_metadata())
 
         # Model-specific templates
         file_metadata = {
@@ -93,6 +135,7 @@ def main():
 
         # Common templates
         apply_templates('templates', generate_base_file_metadata())
+        apply_templates('templates', generate_python_common_file_metadata())
 
         # Model-specific templates
         file_metadata = {
@@ -108,6 +151,18 @@ def main():
             'src/prediction_service.py': {
                 'exec_permission': False,
             },
+            'src/async_serving.py': {
+                'exec_permission': False,
+            },
+            'src/response_cache.py': {
+                'exec_permission': False,
+            },
+            'src/adaptive_control.py': {
+                'exec_permission': False,
+            },
+            'src/tail_latency.py': {
+                'exec_permission': False,
+            },
             'requirements.txt': {
                 'exec_permission': False,
             }
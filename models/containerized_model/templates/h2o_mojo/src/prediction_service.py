@@ -47,74 +47,110 @@ class MojoModelWrapper(SimpleModelWrapper):
         """
         global dt
         import datatable as dt
+        global np
+        import numpy as np
+        global ScorePostprocessor
+        from postprocessing import ScorePostprocessor
+
+    def _to_frame(self, npinstances):
+        """
+        Builds the datatable Frame column by column from the numpy batch, rather
+        than from a list of per-row tuples. Numeric columns are passed through
+        as numpy arrays; object columns are converted once per column so that
+        datatable infers the column type (e.g. str32, int32) as it would for rows.
+        """
+        frame_columns = {}
+        for index, name in enumerate(self.columns):
+            column = npinstances[:, index]
+            frame_columns[name] = column.tolist() if column.dtype == object else column
+        return dt.Frame(frame_columns)
 
     def soft_predict(self, npinstances):
-        instances = [tuple(instance) for instance in npinstances]
-        input_dt = dt.Frame(instances, names=self.columns)
+        input_dt = self._to_frame(npinstances)
         predictions = self.model.predict(input_dt).to_numpy()
         self.score_labels = self._get_outcomes()
         return predictions
 
     def predict(self, npinstances):
         """
-        Calls predict on the H2O Mojo model, applying the get_prediction
+        Calls predict on the H2O Mojo model, applying the get_predictions
         transform to map the H2O predictions to the expected format for the
         Certifai predict API.
         """
-        instances = [tuple(instance) for instance in npinstances]
-        input_dt = dt.Frame(instances, names=self.columns)
-        predictions = self.model.predict(input_dt).to_pandas()
-        outcomes = self._get_outcomes()
-        get_preds = lambda preds: self.get_prediction(preds, outcomes)
-        return predictions.apply(get_preds, axis=1).values
-
-    def get_prediction(self, preds, outcomes=None):
-        """
-        Given an array of soft output and the list of expected class labels,
-        get_prediction returns the appropriate class label based on the class
-        probabilities.
+        input_dt = self._to_frame(npinstances)
+        predictions = self.model.predict(input_dt).to_numpy()
+        return self.get_predictions(predictions, self._get_outcomes())
 
-        For a regression model, get_prediction returns the single probability.
+    def get_predictions(self, preds, outcomes=None):
         """
-        if len(preds) == 1:
-            return preds[0] # regression
-        if len(preds) > 1:
-            if outcomes is None or len(outcomes) == 0:
-                raise Exception('No outcome labels provided for classification' +
-                    ' model. Please update "outcomes" in metadata.yml.')
-            index = preds.argmax() # position of largest value
-            return outcomes[index]
+        Given a (n_samples, n_outputs) array of soft output and the list of
+        expected class labels, get_predictions returns the appropriate class
+        label for each row based on the class probabilities, using a single
+        argmax over the batch and a lookup into the labels.
 
-        raise Exception('No prediction returned by model')
+        For a regression model, get_predictions returns the single column of
+        predictions.
+        """
+        if preds.ndim != 2 or preds.shape[1] == 0:
+            raise Exception('No prediction returned by model')
+        if preds.shape[1] == 1:
+            return ScorePostprocessor.regression(preds)
+        if outcomes is None or len(outcomes) == 0:
+            raise Exception('No outcome labels provided for classification' +
+                ' model. Please update "outcomes" in metadata.yml.')
+        # the labels array is built once, on the first classification request
+        postprocessor = getattr(self, '_postprocessor', None)
+        if postprocessor is None or postprocessor.labels.tolist() != list(outcomes):
+            postprocessor = self._postprocessor = ScorePostprocessor(labels=outcomes)
+        return postprocessor.argmax(preds)
 
 
 # These imports are used in launching the prediction service. They are not
 # used within the prediction service
 import os
 import pickle
-from utils import fetch_model, load_metadata, setup_license_file
+from utils import fetch_artifacts
+from wire_formats import install_binary_protocol
+from warmup import install_warmup
+from metrics import install_metrics
+from profiling import install_profiler
+from thread_budget import ThreadBudget, install_thread_budget
+from serving import run_server
 
 if __name__ == "__main__":
     from pathlib import Path
     os.environ[
         "PYTHONPATH"] = str(Path.joinpath(Path(__file__).parent).resolve())
 
-    metadata = load_metadata()
-    local_model_path = fetch_model()
-    setup_license_file()
+    # fetches the metadata, model and license file concurrently
+    metadata, local_model_path = fetch_artifacts()
 
     # Host is set to 0.0.0.0 to allow this to be run in a docker container
+    # Regression models must set supports_soft_scores to False pending update to wrapper
+    supports_soft_scores = metadata.get('supports_soft_scoring', True)
+    budget = ThreadBudget.from_config(metadata.get('thread_budget'), model_bytes=os.path.getsize(local_model_path))
     app = MojoModelWrapper(
         host="0.0.0.0",
         model_type='h2o_mojo',
         model_path=local_model_path,
         metadata=metadata,
-        # Regression models must set supports_soft_scores to False pending update to wrapper
-        supports_soft_scores=metadata.get('supports_soft_scoring', True),
+        supports_soft_scores=supports_soft_scores,
         score_labels=metadata.get('outcomes')
     )
+    # Accept binary columnar (npy/Arrow) requests in addition to JSON
+    install_binary_protocol(app, supports_soft_scores=supports_soft_scores)
     app.set_global_imports() # needed if not running in production mode
-    # Production mode requires Certifai 1.3.6 or higher
-    app.run(production=True, log_level='warning', num_workers=3)
+    # Split the CPUs between the worker processes and their native thread pools, if enabled in metadata.yml
+    # (before the warm-up, so that it runs with the threads of a worker)
+    install_thread_budget(app, budget)
+    # Score sample rows before serving, and report ready on /ready after, if enabled in metadata.yml
+    install_warmup(app, metadata.get('warmup'), columns=metadata.get('columns'))
+    # Serve per-stage latency histograms and worker counters on /metrics, if enabled in metadata.yml
+    install_metrics(app, metadata.get('metrics'))
+    # Sample-profile slow requests when turned on (PREDICTION_PROFILING, or POST /admin/profiling if enabled)
+    install_profiler(app, metadata.get('profiling'))
+    # Serve with the SDK production server (requires Certifai 1.3.6 or higher), or the gunicorn worker class
+    # of metadata.yml (threaded workers when batching is enabled)
+    run_server(app, budget.num_workers, metadata.get('server'), metadata.get('batching'))
     # Replace above with following to run in development mode
     # app.run()
@@ -6,9 +6,12 @@ Licensed under CognitiveScale Example Code License https://github.com/CognitiveS
 import os
 import pickle
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from certifai.common.file.locaters import make_generic_locater
 from certifai.common.file.interface import FilePath
 
+from artifact_cache import fetch_file
+
 CURRENT_PATH = os.path.abspath(os.path.dirname(__file__))
 ROOT_PATH = os.path.normpath(os.path.join(CURRENT_PATH, '..'))
 
@@ -20,27 +23,28 @@ def _create_state_store():
     return _model_store_tmp_path
 
 
-def read_and_save_file(source_path, destination_path):
+def read_and_save_file(source_path, destination_path, sha256=None):
+    """
+    Streams the file at source_path to destination_path, through the
+    content-addressed cache in MODEL_CACHE_DIR if set (see artifact_cache.py).
+
+    :param str source_path: Path or url of the file
+    :param str destination_path: Local path to save the file to
+    :param str sha256: Optional expected sha256 hex digest of the file
+    :return: the path the file was saved to
+    """
     if source_path is None:
         return
-    # Fetch file as binary
-    locater = make_generic_locater(FilePath(source_path))
-    if locater.isfile():
-        with locater.reader() as f:
-            contents = f.read()
-        try:
-            with open(destination_path, 'wb') as f:
-                f.write(contents)
-        except PermissionError as e:
-            _model_store_tmp_path = _create_state_store()
-            print(
-                f"can't persist inside container; permission error \n{str(e)}\ndefaulting persist to "
-                f"{_model_store_tmp_path}")
-            destination_path = os.path.join(_model_store_tmp_path, os.path.basename(destination_path))
-            with open(destination_path, 'wb') as f:
-                f.write(contents)
-    else:
-        raise ValueError(f'{destination_path} is not a file object')
+    cache_dir = os.getenv('MODEL_CACHE_DIR')
+    try:
+        fetch_file(source_path, destination_path, sha256=sha256, cache_dir=cache_dir)
+    except PermissionError as e:
+        _model_store_tmp_path = _create_state_store()
+        print(
+            f"can't persist inside container; permission error \n{str(e)}\ndefaulting persist to "
+            f"{_model_store_tmp_path}")
+        destination_path = os.path.join(_model_store_tmp_path, os.path.basename(destination_path))
+        fetch_file(source_path, destination_path, sha256=sha256, cache_dir=cache_dir)
 
     return destination_path
 
@@ -79,6 +83,9 @@ def fetch_model(root_path=ROOT_PATH):
     """
     Fetches the file at the location specified by MODEL_PATH, and saves
     it in the 'model' folder relative to root_path, with the same filename.
+    If MODEL_SHA256 is set, the model is verified against it. A model already
+    in the MODEL_CACHE_DIR cache is not fetched again if MODEL_SHA256 is set, or
+    if its size and modification time (or ETag) are unchanged.
 
     :param str root_path: Path to local folder (must be writable)
     :return: the path to the model saved locally
@@ -88,7 +95,8 @@ def fetch_model(root_path=ROOT_PATH):
         # Copy files from remote path to local
         local_model_path = os.path.normpath(os.path.join(root_path,
                                                          'model', os.path.basename(model_path)))
-        local_model_path = read_and_save_file(model_path, local_model_path)
+        local_model_path = read_and_save_file(model_path, local_model_path,
+                                              sha256=os.getenv('MODEL_SHA256'))
     else:
         # allows local testing
         local_model_path = os.path.normpath(os.path.join(root_path,
@@ -114,3 +122,17 @@ def setup_license_file(root_path=ROOT_PATH):
         default_license_path = os.path.normpath(os.path.join(root_path,
                                                              'license/license.txt'))
     os.environ['DRIVERLESS_AI_LICENSE_FILE'] = default_license_path
+
+
+def fetch_artifacts(root_path=ROOT_PATH):
+    """
+    Loads the metadata and fetches the model and license file concurrently.
+
+    :param str root_path: Path to local folder (must be writable)
+    :return: (metadata object, the path to the model saved locally)
+    """
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        metadata = executor.submit(load_metadata, root_path)
+        local_model_path = executor.submit(fetch_model, root_path)
+        executor.submit(setup_license_file, root_path).result()
+        return metadata.result(), local_model_path.result()
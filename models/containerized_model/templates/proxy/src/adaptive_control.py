@@ -0,0 +1,177 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Adaptive chunk size and concurrency control for the `Proxy` wrapper.
+
+The best chunk size and number of concurrent requests depend on the hosted model
+endpoint. `AIMDController` learns them at run time with additive-increase /
+multiplicative-decrease (as TCP congestion control does):
+
+- the in-flight limit grows by one request per window of successful responses,
+  and is multiplied by `decrease_factor` when the hosted model throttles (429) or
+  is unavailable (502, 503, 504). Other errors (e.g. 500) are not a congestion
+  signal, and are not retried,
+- the chunk size grows by `increase_rows` while responses are faster than
+  `target_latency_ms`, and is multiplied by `decrease_factor` when they are slower,
+  or when a request is rejected as too large (413). Until the first decrease, the
+  chunk size doubles instead (slow start), to find the right scale quickly.
+
+The controller is shared by the concurrent requests of a process, so that they
+share the hosted model capacity. Its decisions are available from `metrics()`, and
+on `/metrics` if the proxy serves metrics.
+"""
+import threading
+import time
+from collections import deque
+
+from tail_latency import DeadlineExceeded
+
+# responses that signal the hosted model is overloaded
+THROTTLE_STATUSES = (429, 502, 503, 504)
+PAYLOAD_TOO_LARGE_STATUS = 413
+
+
+class AIMDController:
+    def __init__(self,
+                 initial_chunk_size=100,
+                 min_chunk_size=1,
+                 max_chunk_size=10000,
+                 initial_in_flight=1,
+                 max_in_flight=16,
+                 target_latency_ms=1000.,
+                 increase_rows=None,
+                 decrease_factor=0.5,
+                 history_size=100):
+        """
+        :param int initial_chunk_size: chunk size to start with
+        :param int min_chunk_size: minimum number of instances per hosted model request
+        :param int max_chunk_size: maximum number of instances per hosted model request
+        :param int initial_in_flight: in-flight limit to start with
+        :param int max_in_flight: maximum number of concurrent hosted model requests
+        :param float target_latency_ms: hosted model request latency above which the chunk size is decreased
+        :param Optional[int] increase_rows: chunk size increase per fast response, defaults to 10% of the initial
+            chunk size
+        :param float decrease_factor: factor the chunk size or in-flight limit is multiplied by on a decrease
+        :param int history_size: number of recent decisions kept for `metrics()`
+        """
+        self.min_chunk_size = max(1, int(min_chunk_size))
+        self.max_chunk_size = max(self.min_chunk_size, int(max_chunk_size))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.target_latency = float(target_latency_ms) / 1000.
+        self.increase_rows = int(increase_rows or max(1, int(initial_chunk_size) // 10))
+        self.decrease_factor = float(decrease_factor)
+        self._chunk_size = float(min(max(int(initial_chunk_size), self.min_chunk_size), self.max_chunk_size))
+        self._limit = float(min(max(int(initial_in_flight), 1), self.max_in_flight))
+        self._in_flight = 0
+        self._latency = None
+        self._last_decrease = 0.
+        self._slow_start = True
+        self._cond = threading.Condition()
+        self._counters = dict.fromkeys(['requests', 'throttled', 'too_large', 'slow', 'retries',
+                                        'limit_increases', 'limit_decreases',
+                                        'chunk_increases', 'chunk_decreases'], 0)
+        self._history = deque(maxlen=history_size)
+
+    @property
+    def chunk_size(self) -> int:
+        """Number of instances to send in the next hosted model request"""
+        return int(self._chunk_size)
+
+    @property
+    def limit(self) -> int:
+        """Current maximum number of concurrent hosted model requests"""
+        return max(1, int(self._limit))
+
+    def acquire(self, blocking=True, deadline=None) -> bool:
+        """Takes an in-flight slot, waiting for one to be released if `blocking`
+
+        :param bool blocking: whether to wait for a slot
+        :param Optional[float] deadline: absolute (`time.monotonic`) time after which to stop waiting
+        :return: whether a slot was taken
+        :raises DeadlineExceeded: if the deadline passes while waiting
+        """
+        with self._cond:
+            while self._in_flight >= self.limit:
+                if not blocking:
+                    return False
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise DeadlineExceeded('request deadline exceeded waiting for a hosted model request slot')
+                self._cond.wait(timeout)
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        """Releases an in-flight slot"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_response(self, rows, latency, status) -> None:
+        """Updates the chunk size and in-flight limit from a hosted model response
+
+        :param int rows: number of instances in the request
+        :param float latency: request latency in seconds
+        :param int status: the response http status
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._counters['requests'] += 1
+            if status == PAYLOAD_TOO_LARGE_STATUS:
+                self._counters['too_large'] += 1
+                self._decrease_chunk_size(min(self._chunk_size, rows), 'too_large', now)
+            elif status in THROTTLE_STATUSES:
+                self._counters['throttled'] += 1
+                # a burst of throttled responses to requests sent together counts as a single congestion signal
+                if now - self._last_decrease > (self._latency or 0.):
+                    self._last_decrease = now
+                    self._limit = max(1., self._limit * self.decrease_factor)
+                    self._counters['limit_decreases'] += 1
+                    self._record(now, 'limit_decrease', status)
+            elif status < 400:
+                self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+                if latency > self.target_latency:
+                    self._counters['slow'] += 1
+                    if rows >= self.chunk_size:
+                        self._decrease_chunk_size(self._chunk_size, 'slow', now)
+                elif rows >= self.chunk_size and self._chunk_size < self.max_chunk_size:
+                    increase = self._chunk_size if self._slow_start else self.increase_rows
+                    self._chunk_size = min(float(self.max_chunk_size), self._chunk_size + increase)
+                    self._counters['chunk_increases'] += 1
+                    self._record(now, 'chunk_increase', status)
+                if self._limit < self.max_in_flight and self._in_flight >= self.limit:
+                    # additive increase: one request per window of `limit` successful responses
+                    previous = self.limit
+                    self._limit = min(float(self.max_in_flight), self._limit + 1. / self._limit)
+                    if self.limit > previous:
+                        self._counters['limit_increases'] += 1
+                        self._record(now, 'limit_increase', status)
+            self._cond.notify_all()
+
+    def on_retry(self) -> None:
+        """Counts a hosted model request that is sent again (throttled, or split as too large)"""
+        with self._cond:
+            self._counters['retries'] += 1
+
+    def _decrease_chunk_size(self, chunk_size, reason, now):
+        self._slow_start = False
+        self._chunk_size = max(float(self.min_chunk_size), chunk_size * self.decrease_factor)
+        self._counters['chunk_decreases'] += 1
+        self._record(now, f'chunk_decrease_{reason}', None)
+
+    def _record(self, now, decision, status):
+        self._history.append({'time': now, 'decision': decision, 'status': status,
+                              'chunk_size': self.chunk_size, 'limit': self.limit})
+
+    def metrics(self) -> dict:
+        """
+        :return: dict of the current chunk size, in-flight limit and requests, smoothed request latency,
+            counters of responses and decisions, and the most recent decisions
+        """
+        with self._cond:
+            metrics = dict(self._counters)
+            metrics.update(chunk_size=self.chunk_size, limit=self.limit, in_flight=self._in_flight,
+                           latency_ms=None if self._latency is None else self._latency * 1000.,
+                           history=list(self._history))
+        return metrics
@@ -0,0 +1,181 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Asyncio serving mode for the `Proxy` wrapper (requires `aiohttp`).
+
+The proxy only waits on the hosted model, so instead of blocking a server worker
+per in-flight request, this mode serves the predict endpoint from an event loop
+and calls the hosted model with a non-blocking HTTP client. A single process can
+then hold hundreds of concurrent hosted model requests.
+
+The `Proxy` request/response transformation hooks, chunking (`chunk_size`,
+`max_concurrency`), retry policy and response cache are used as in the
+synchronous mode, as are request deadlines and hedging (the losing call of a
+hedged pair is cancelled). Adaptive control (`adaptive_control`) is not applied in this
+mode: batches are split by the fixed `chunk_size`.
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from tail_latency import DEADLINE_HEADER, DeadlineExceeded, deadline_from_headers, remaining
+from wire_formats import (BINARY_CONTENT_TYPES, JSON_CONTENT_TYPE, UnsupportedEncoding,
+                          decode_instances, encode_predictions)
+
+
+class AsyncProxyServer:
+    def __init__(self, proxy, max_connections=1000, timeout_seconds=300):
+        """
+        :param Proxy proxy: the proxy wrapper, providing the hosted model url, transformation hooks and chunking
+        :param int max_connections: maximum number of concurrent connections to the hosted model
+        :param float timeout_seconds: total timeout for each hosted model request
+        """
+        self.proxy = proxy
+        self.max_connections = max_connections
+        self.timeout = ClientTimeout(total=timeout_seconds)
+        self._session = None
+
+    async def _post_chunk(self, npinstances, deadline=None) -> np.ndarray:
+        proxy = self.proxy
+        transformed_request = proxy.transform_request_to_hosted_model_schema(npinstances, **proxy.optional_args)
+        for attempt in range(proxy.retry_total + 1):
+            kwargs = {}
+            headers = proxy.optional_args.get('headers')
+            if deadline is not None:
+                # time out at the deadline, and pass the remaining budget on to the hosted model
+                budget = remaining(deadline)
+                kwargs['timeout'] = ClientTimeout(total=budget)
+                headers = dict(headers or {}, **{DEADLINE_HEADER: str(int(budget * 1000))})
+            try:
+                async with self._session.post(proxy.hosted_model_url, data=transformed_request,
+                                              headers=headers, **kwargs) as resp:
+                    if resp.status not in proxy.retry_status_forcelist or attempt == proxy.retry_total:
+                        resp.raise_for_status()
+                        if proxy.response_cache is not None:
+                            proxy.response_cache.observe_response(resp.headers)
+                        resp_json = json.loads(await resp.text())
+                        return proxy.transform_response_to_certifai_predict_schema(resp_json, **proxy.optional_args)
+            except asyncio.TimeoutError:
+                if deadline is None:
+                    raise
+                raise DeadlineExceeded('request deadline exceeded calling the hosted model')
+            await asyncio.sleep(proxy.retry_backoff_factor * (2 ** attempt))
+
+    async def _predict_chunk(self, npinstances, deadline=None) -> np.ndarray:
+        """Asynchronous equivalent of `Proxy._predict_chunk`"""
+        tracker = self.proxy.hedging
+        if tracker is None:
+            return await self._post_chunk(npinstances, deadline)
+
+        async def timed_call():
+            start = time.monotonic()
+            result = await self._post_chunk(npinstances, deadline)
+            tracker.observe(time.monotonic() - start)
+            return result
+
+        delay = tracker.hedge_delay()
+        primary = asyncio.ensure_future(timed_call())
+        if delay is None:
+            return await primary
+        left = remaining(deadline)
+        done, _ = await asyncio.wait({primary}, timeout=delay if left is None else min(delay, left))
+        if done:
+            return primary.result()
+        tracker.count('hedged')
+        hedge = asyncio.ensure_future(timed_call())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        tracker.count('hedges_won')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def predict(self, npinstances, deadline=None) -> np.ndarray:
+        """Asynchronous equivalent of `Proxy.predict`"""
+        cache = self.proxy.response_cache
+        if cache is None:
+            return await self._predict_batch(npinstances, deadline)
+        # the cache is a (blocking) sqlite database, accessed from the default thread pool
+        loop = asyncio.get_running_loop()
+        keys, cached = await loop.run_in_executor(None, cache.lookup, npinstances)
+        missing_keys, rows = cache.missing_rows(keys, cached)
+        predictions = None
+        if rows:
+            predictions = await self._predict_batch(npinstances[rows], deadline)
+            await loop.run_in_executor(None, cache.store, missing_keys, predictions)
+        return cache.merge(keys, cached, missing_keys, predictions)
+
+    async def _predict_batch(self, npinstances, deadline=None) -> np.ndarray:
+        chunks = self.proxy.split_chunks(npinstances)
+        if len(chunks) == 1:
+            return await self._predict_chunk(chunks[0], deadline)
+        semaphore = asyncio.Semaphore(self.proxy.max_concurrency)
+
+        async def post_limited(chunk):
+            async with semaphore:
+                return await self._predict_chunk(chunk, deadline)
+        return np.concatenate(await asyncio.gather(*(post_limited(chunk) for chunk in chunks)))
+
+    async def handle_predict(self, request):
+        content_type = request.content_type
+        try:
+            deadline = deadline_from_headers(request.headers, self.proxy.deadline_ms)
+            if content_type in BINARY_CONTENT_TYPES:
+                instances = decode_instances(await request.read(), content_type)
+            else:
+                content_type = JSON_CONTENT_TYPE
+                instances = np.array(json.loads(await request.read())['payload']['instances'], dtype=object)
+            predictions = await self.predict(instances, deadline)
+        except DeadlineExceeded as e:
+            return web.json_response({'error': str(e)}, status=504)
+        except (UnsupportedEncoding, ImportError) as e:
+            return web.json_response({'error': str(e)}, status=415)
+        except (ValueError, KeyError) as e:
+            return web.json_response({'error': str(e)}, status=400)
+        accept = request.headers.get('Accept', '').split(';')[0].strip().lower()
+        if accept not in BINARY_CONTENT_TYPES + (JSON_CONTENT_TYPE,):
+            accept = content_type
+        return web.Response(body=encode_predictions(predictions, None, accept), content_type=accept)
+
+    async def handle_health(self, request):
+        return web.json_response({'status': 'up'})
+
+    async def _on_startup(self, app):
+        self._session = ClientSession(connector=TCPConnector(limit=self.max_connections), timeout=self.timeout)
+
+    async def _on_cleanup(self, app):
+        await self._session.close()
+
+    def make_app(self, endpoint_url='/predict'):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post(endpoint_url, self.handle_predict)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/ready', self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+def serve_async(proxy, host='0.0.0.0', port=8551, endpoint_url='/predict', max_connections=1000):
+    """
+    Serves the proxy predict endpoint from an asyncio event loop (blocks until stopped).
+
+    :param Proxy proxy: the proxy wrapper
+    :param str host: hostname to listen on
+    :param int port: port to listen on
+    :param str endpoint_url: the predict endpoint url
+    :param int max_connections: maximum number of concurrent connections to the hosted model
+    """
+    server = AsyncProxyServer(proxy, max_connections=max_connections)
+    web.run_app(server.make_app(endpoint_url), host=host, port=port, access_log=None)
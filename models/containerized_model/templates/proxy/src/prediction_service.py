@@ -5,14 +5,29 @@ Licensed under CognitiveScale Example Code License https://github.com/CognitiveS
 
 import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
 from typing import Optional
 
 import requests
 from certifai.model.sdk import SimpleModelWrapper
+from flask import has_request_context, request
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 import numpy as np
 
+from adaptive_control import AIMDController, PAYLOAD_TOO_LARGE_STATUS, THROTTLE_STATUSES
+from metrics import install_metrics
+from profiling import install_profiler
+from response_cache import DiskResponseCache
+from tail_latency import (DEADLINE_HEADER, DeadlineExceeded, LatencyTracker, deadline_from_headers, hedged_call,
+                          remaining)
+from warmup import install_warmup
+from wire_formats import install_binary_protocol
+
 
 class Proxy(SimpleModelWrapper):
     """
@@ -23,25 +38,72 @@ class Proxy(SimpleModelWrapper):
     - receives prediction POST request from Certifai,
     - transforms (`transform_request_to_hosted_model_schema`) to hosted model service endpoint schema,
     - invokes ('predict`) the hosted model service endpoint (`hosted_model_url`) with the correct json schema,
+      splitting large batches into chunks of `chunk_size` rows sent concurrently (up to `max_concurrency` at a time),
     - transforms (`transform_response_to_certifai_predict_schema`) received response from above to Certifai `predict` schema
     - returns the formatted response to Certifai
+
+    Alternatively, the chunk size and number of concurrent requests can be learnt at run time from the hosted model
+    latency and throttling responses (`adaptive_control`, see `adaptive_control.py`).
+
+    Requests may carry a time budget (`X-Request-Deadline-Ms` header, or `deadline_ms`) that bounds the hosted model
+    calls made for them, and slow hosted model calls may be hedged with a duplicate call (`hedging`), see
+    `tail_latency.py`.
+
+    Predictions of a deterministic hosted model can be cached on local disk (`response_cache`), so that rows
+    already scored are not sent to the hosted model again (see `response_cache.py`).
+
+    Set `PROXY_SERVING_MODE=async` to serve with an asyncio event loop instead (see `async_serving.py`),
+    so that a single process can hold many concurrent hosted model requests.
     """
+    # retry policy for failed hosted model requests
+    retry_total = 5
+    retry_backoff_factor = 0.2
+    retry_status_forcelist = (500, 502, 503, 504)
 
     def __init__(self,
                  hosted_model_url: str,
                  host: Optional[str] = '0.0.0.0',
                  port: Optional[int] = 8551,
                  endpoint_url: Optional[str] = '/predict',
+                 chunk_size: Optional[int] = None,
+                 max_concurrency: Optional[int] = 1,
+                 response_cache: Optional[DiskResponseCache] = None,
+                 adaptive_control: Optional[AIMDController] = None,
+                 deadline_ms: Optional[float] = None,
+                 hedging: Optional[LatencyTracker] = None,
                  **optional_args):
         """
         :param Optional[str] host: hostname proxy class service listens on, defaults to `0.0.0.0`
         :param Optional[int] port: port proxy class service listens on, defaults to `8551`
         :param Optional[str] endpoint_url: endpoint url for the proxy class service. defaults to `/predict`
         :param str hosted_model_url: hosted model webservice url to invoke using http/s /POST
+        :param Optional[int] chunk_size: maximum number of instances per hosted model request. defaults to `None`
+            (all instances in a single request)
+        :param Optional[int] max_concurrency: maximum number of concurrent hosted model requests for a batch.
+            defaults to `1`
+        :param Optional[DiskResponseCache] response_cache: persistent cache of hosted model predictions.
+            defaults to `None` (no caching)
+        :param Optional[AIMDController] adaptive_control: controller of the chunk size and number of concurrent
+            hosted model requests, replacing `chunk_size` and `max_concurrency`. defaults to `None`
+        :param Optional[float] deadline_ms: time budget of requests without a `X-Request-Deadline-Ms` header.
+            defaults to `None` (no deadline)
+        :param Optional[LatencyTracker] hedging: latency tracker deciding when to hedge slow hosted model calls.
+            defaults to `None` (no hedging)
         :param Optional[dict] optional_args: python dict holding any additional configuration (key/value) that maybe be required for
             - model webservice url invoke like service http headers (may have auth tokens), or
             - request/response transformation like column names etc.
         """
+        self.chunk_size = int(chunk_size) if chunk_size else None
+        self.max_concurrency = max(1, int(max_concurrency or 1))
+        self.response_cache = response_cache
+        self.adaptive_control = adaptive_control
+        self.deadline_ms = deadline_ms
+        self.hedging = hedging
+        if adaptive_control is not None:
+            self.max_concurrency = adaptive_control.max_in_flight
+        self._executors = {}
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
         self._create_session()
         self.hosted_model_url = hosted_model_url
         self.optional_args = optional_args
@@ -57,14 +119,40 @@ class Proxy(SimpleModelWrapper):
         """
         self._session = requests.Session()
         max_retries = Retry(
-            total=5,
-            backoff_factor=0.2,
-            status_forcelist=[500, 502, 503, 504],
+            total=self.retry_total,
+            backoff_factor=self.retry_backoff_factor,
+            # with adaptive control, failed requests are retried by `_predict_adaptive`, so that the
+            # controller sees the hosted model responses
+            status_forcelist=[] if self.adaptive_control is not None else list(self.retry_status_forcelist),
             method_whitelist=frozenset(['GET', 'POST']),
             raise_on_status=False)
 
-        self._session.mount('http://', HTTPAdapter(max_retries=max_retries))
-        self._session.mount('https://', HTTPAdapter(max_retries=max_retries))
+        # connection pool sized to the number of concurrent chunk requests
+        pool_size = max(10, self.max_concurrency)
+        self._session.mount('http://', HTTPAdapter(max_retries=max_retries, pool_maxsize=pool_size))
+        self._session.mount('https://', HTTPAdapter(max_retries=max_retries, pool_maxsize=pool_size))
+
+        # requests with a deadline are retried by `_post_chunk` instead, only while the deadline allows
+        self._deadline_session = requests.Session()
+        self._deadline_session.mount('http://', HTTPAdapter(pool_maxsize=pool_size))
+        self._deadline_session.mount('https://', HTTPAdapter(pool_maxsize=pool_size))
+
+    def _get_executor(self, pool='chunks') -> ThreadPoolExecutor:
+        """Returns the thread pool for concurrent chunk requests (or for hedged calls, which are made from the chunk
+        threads), creating it in the current process if needed (threads do not survive the fork of server worker
+        processes)
+
+        :param str pool: `chunks` or `hedges`
+        :rtype: ThreadPoolExecutor
+        """
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._executors = {}
+                self._executor_pid = os.getpid()
+            if pool not in self._executors:
+                max_workers = max(16, 2 * self.max_concurrency) if pool == 'hedges' else self.max_concurrency
+                self._executors[pool] = ThreadPoolExecutor(max_workers=max_workers)
+            return self._executors[pool]
 
     @staticmethod
     def transform_request_to_hosted_model_schema(instances: np.ndarray, **kwargs) -> json:
@@ -110,24 +198,174 @@ class Proxy(SimpleModelWrapper):
         #
         return np.array(data['payload']['predictions'])
 
-    def predict(self, npinstances) -> np.ndarray:
-        """Certifai SimpleModelWrapper.predict (overridden method). Invokes the hosted model service using http/s /POST
+    def split_chunks(self, npinstances) -> list:
+        """Splits instances into chunks of at most `chunk_size` rows
 
-        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features) to predict on
-        :return: numpy array of model predictions of shape (n_samples,)
+        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features)
+        :rtype: list
+        """
+        if self.chunk_size is None or len(npinstances) <= self.chunk_size:
+            return [npinstances]
+        return [npinstances[start:start + self.chunk_size]
+                for start in range(0, len(npinstances), self.chunk_size)]
+
+    def _predict_chunk(self, npinstances, deadline=None) -> np.ndarray:
+        """Invokes the hosted model service for a single chunk of instances. Failed requests are retried per
+        chunk by the session `Retry` configuration, so a failure does not re-send the rest of the batch.
+        With `hedging`, a call outstanding past the observed p95 latency is sent again, and the first response wins.
+
+        :param np.ndarray npinstances: numpy array of shape (n_chunk_samples, n_features) to predict on
+        :param Optional[float] deadline: absolute (`time.monotonic`) deadline of the call
+        :return: numpy array of model predictions of shape (n_chunk_samples,)
         :rtype: np.ndarray
         """
+        if self.hedging is not None:
+            call = partial(self._call_chunk, npinstances)
+            return hedged_call(self._get_executor('hedges'), call, self.hedging, deadline)
+        return self._call_chunk(npinstances, deadline)
+
+    def _call_chunk(self, npinstances, deadline=None) -> np.ndarray:
+        return self._parse_response(self._post_chunk(npinstances, deadline))
+
+    def _post_chunk(self, npinstances, deadline=None) -> requests.Response:
         kwargs = {}
         transformed_request = self.transform_request_to_hosted_model_schema(npinstances, **self.optional_args)
-        resp = self._session.post(
+        if deadline is not None:
+            return self._post_with_deadline(transformed_request, deadline)
+        return self._session.post(
             self.hosted_model_url,
             data=transformed_request,
             headers=self.optional_args.get('headers'),
             **kwargs
         )
+
+    def _post_with_deadline(self, transformed_request, deadline) -> requests.Response:
+        """Invokes the hosted model service, timing out at the deadline and passing the remaining budget on in the
+        `X-Request-Deadline-Ms` header. Failed requests are retried while the deadline allows.
+
+        :raises DeadlineExceeded: if the deadline passes before a response
+        :rtype: requests.Response
+        """
+        # with adaptive control, failed requests are retried by `_predict_adaptive`
+        retry_statuses = () if self.adaptive_control is not None else self.retry_status_forcelist
+        for attempt in range(self.retry_total + 1):
+            budget = remaining(deadline)
+            headers = dict(self.optional_args.get('headers') or {}, **{DEADLINE_HEADER: str(int(budget * 1000))})
+            try:
+                resp = self._deadline_session.post(self.hosted_model_url, data=transformed_request,
+                                                   headers=headers, timeout=budget)
+            except requests.Timeout as e:
+                raise DeadlineExceeded(f'request deadline exceeded calling the hosted model: {e}')
+            if resp.status_code not in retry_statuses or attempt == self.retry_total:
+                return resp
+            time.sleep(min(self.retry_backoff_factor * (2 ** attempt), remaining(deadline)))
+
+    def _parse_response(self, resp) -> np.ndarray:
+        resp.raise_for_status()
+        if self.response_cache is not None:
+            self.response_cache.observe_response(resp.headers)
         resp_json = json.loads(resp.text)
         return self.transform_response_to_certifai_predict_schema(resp_json, **self.optional_args)
 
+    def predict(self, npinstances, headers=None) -> np.ndarray:
+        """Certifai SimpleModelWrapper.predict (overridden method). Invokes the hosted model service using http/s /POST.
+        Batches larger than `chunk_size` are split into chunks that are sent concurrently, and the predictions are
+        reassembled in order. With a `response_cache`, only rows that are not cached are sent.
+
+        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features) to predict on
+        :param Optional[dict] headers: request headers (for the `X-Request-Deadline-Ms` header), defaults to those
+            of the Flask request (binary encoded requests are served outside of it, and pass their headers)
+        :return: numpy array of model predictions of shape (n_samples,)
+        :rtype: np.ndarray
+        """
+        if headers is None and has_request_context():
+            headers = request.headers
+        predict_batch = partial(self._predict_batch, deadline=deadline_from_headers(headers, self.deadline_ms))
+        if self.response_cache is not None:
+            return self.response_cache.predict(predict_batch, npinstances)
+        return predict_batch(npinstances)
+
+    def _predict_batch(self, npinstances, deadline=None) -> np.ndarray:
+        if self.adaptive_control is not None:
+            return self._predict_adaptive(npinstances, deadline)
+        chunks = self.split_chunks(npinstances)
+        if len(chunks) == 1:
+            return self._predict_chunk(chunks[0], deadline)
+        return np.concatenate(list(self._get_executor().map(partial(self._predict_chunk, deadline=deadline), chunks)))
+
+    def _predict_adaptive(self, npinstances, deadline=None) -> np.ndarray:
+        """Sends the instances in chunks sized by the adaptive controller, keeping up to its in-flight limit of
+        requests outstanding. Throttled (429) and unavailable (502, 503, 504) chunks are retried up to `retry_total`
+        times, and chunks rejected as too large (413) are split in two. With a deadline, waiting for a request slot
+        and backing off before a retry stop at the deadline. With `hedging`, slow chunk requests are hedged as
+        without adaptive control; the hedges do not take in-flight slots, and are bounded by the hedging ratio.
+
+        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features) to predict on
+        :param Optional[float] deadline: absolute (`time.monotonic`) deadline of the hosted model calls
+        :return: numpy array of model predictions of shape (n_samples,)
+        :rtype: np.ndarray
+        """
+        if len(npinstances) == 0:
+            # sent as a single (empty) chunk, as without adaptive control
+            return self._predict_chunk(npinstances, deadline)
+        control = self.adaptive_control
+        executor = self._get_executor()
+        results, futures, retries = {}, {}, deque()
+        next_start = 0
+        while next_start < len(npinstances) or retries or futures:
+            while retries or next_start < len(npinstances):
+                # only block for a slot when none of this batch's requests are outstanding
+                if not control.acquire(blocking=not futures, deadline=deadline):
+                    break
+                if retries:
+                    start, end, attempt = retries.popleft()
+                else:
+                    start, end, attempt = next_start, min(len(npinstances), next_start + control.chunk_size), 0
+                    next_start = end
+                future = executor.submit(self._predict_chunk_adaptive, npinstances[start:end], attempt, deadline)
+                future.add_done_callback(lambda _: control.release())
+                futures[future] = (start, end, attempt)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, attempt = futures.pop(future)
+                predictions, status = future.result()
+                if predictions is not None:
+                    results[start] = predictions
+                elif status == PAYLOAD_TOO_LARGE_STATUS:
+                    middle = (start + end) // 2
+                    retries.extend([(start, middle, attempt), (middle, end, attempt)])
+                    control.on_retry()
+                else:
+                    retries.append((start, end, attempt + 1))
+                    control.on_retry()
+        return np.concatenate([results[start] for start in sorted(results)])
+
+    def _predict_chunk_adaptive(self, npinstances, attempt, deadline=None) -> tuple:
+        """Invokes the hosted model service for a chunk, reporting the response to the adaptive controller.
+
+        :return: (predictions, status), where predictions is None if the chunk should be retried
+        :rtype: tuple
+        """
+        start = time.monotonic()
+        if self.hedging is not None:
+            post = partial(self._post_chunk, npinstances)
+            resp = hedged_call(self._get_executor('hedges'), post, self.hedging, deadline)
+        else:
+            resp = self._post_chunk(npinstances, deadline)
+        status = resp.status_code
+        self.adaptive_control.on_response(len(npinstances), time.monotonic() - start, status)
+        if status == PAYLOAD_TOO_LARGE_STATUS and len(npinstances) > 1:
+            return None, status
+        if status in THROTTLE_STATUSES and attempt < self.retry_total:
+            retry_after = resp.headers.get('Retry-After', '')
+            backoff = float(retry_after) if retry_after.isdigit() else self.retry_backoff_factor * (2 ** attempt)
+            if deadline is not None:
+                # a retry after the deadline could not be used
+                backoff = min(backoff, remaining(deadline))
+            time.sleep(backoff)
+            return None, status
+        return self._parse_response(resp), status
+
 
 if __name__ == "__main__":
     # add any additional headers that maybe required in `opt_args.headers`.
@@ -157,7 +395,58 @@ if __name__ == "__main__":
     if not hosted_model_url:
         raise ValueError('either `HOSTED_MODEL_URL` env variable is not set or `default_hosted_model_url` is empty')
 
+    # optional chunking of large batches into concurrent hosted model requests
+    chunk_size = os.getenv('HOSTED_MODEL_CHUNK_SIZE')
+    max_concurrency = os.getenv('HOSTED_MODEL_MAX_CONCURRENCY', 1)
+    port = int(os.getenv('PROXY_PORT', 8551))
+
+    # optional time budget of requests without a `X-Request-Deadline-Ms` header, and hedging of slow hosted model calls
+    deadline_ms = os.getenv('HOSTED_MODEL_DEADLINE_MS')
+    hedging = None
+    if os.getenv('HOSTED_MODEL_HEDGING', 'false').lower() == 'true':
+        hedging = LatencyTracker(percentile=float(os.getenv('HOSTED_MODEL_HEDGING_PERCENTILE', 95)),
+                                 max_hedge_ratio=float(os.getenv('HOSTED_MODEL_HEDGING_MAX_RATIO', 0.1)))
+
+    # optional run time control of the chunk size and number of concurrent requests, from the hosted model
+    # latency and throttling responses
+    adaptive_control = None
+    if os.getenv('HOSTED_MODEL_ADAPTIVE_CONTROL', 'false').lower() == 'true':
+        adaptive_control = AIMDController(initial_chunk_size=int(chunk_size or 100),
+                                          max_chunk_size=int(os.getenv('HOSTED_MODEL_MAX_CHUNK_SIZE', 10000)),
+                                          max_in_flight=int(os.getenv('HOSTED_MODEL_MAX_CONCURRENCY', 16)),
+                                          target_latency_ms=float(os.getenv('HOSTED_MODEL_TARGET_LATENCY_MS', 1000)))
+
+    # optional persistent cache of the hosted model predictions, for deterministic hosted models
+    response_cache = None
+    if os.getenv('HOSTED_MODEL_CACHE_PATH'):
+        response_cache = DiskResponseCache(os.getenv('HOSTED_MODEL_CACHE_PATH'),
+                                           url=hosted_model_url,
+                                           max_entries=int(os.getenv('HOSTED_MODEL_CACHE_MAX_ENTRIES', 1000000)),
+                                           version=os.getenv('HOSTED_MODEL_VERSION'),
+                                           version_header=os.getenv('HOSTED_MODEL_VERSION_HEADER'))
+
     app = Proxy(hosted_model_url=hosted_model_url,
                 host="0.0.0.0",
+                port=port,
+                chunk_size=chunk_size,
+                max_concurrency=max_concurrency,
+                response_cache=response_cache,
+                adaptive_control=adaptive_control,
+                deadline_ms=float(deadline_ms) if deadline_ms else None,
+                hedging=hedging,
                 **opt_args)
-    app.run(log_level='Warning')
+    if os.getenv('PROXY_SERVING_MODE', 'sync') == 'async':
+        # event loop server - requires aiohttp
+        from async_serving import serve_async
+        serve_async(app, host="0.0.0.0", port=port)
+    else:
+        # Readiness endpoint (the proxy has no warm-up pass, so it is ready once serving)
+        install_warmup(app, None)
+        # Accept binary columnar (npy/Arrow) requests in addition to JSON, with their deadline header
+        install_binary_protocol(app, pass_headers=True)
+        # Serve per-stage latency histograms, worker counters and adaptive control decisions on /metrics
+        if os.getenv('PROXY_METRICS', 'false').lower() == 'true':
+            install_metrics(app, {'enabled': True, 'multiproc_dir': os.getenv('PROMETHEUS_MULTIPROC_DIR')})
+        # Sample-profile slow requests when turned on (PREDICTION_PROFILING, or POST /admin/profiling if enabled)
+        install_profiler(app)
+        app.run(log_level='Warning')
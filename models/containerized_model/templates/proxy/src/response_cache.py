@@ -0,0 +1,258 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Persistent (SQLite) cache of hosted model predictions for the `Proxy` wrapper.
+
+Scans re-run against the same deterministic hosted model query it with the same
+rows again and again. The cache stores the prediction for each row on local disk,
+keyed by the hosted model url, the model version and a hash of the row, so that
+repeated scans only send new rows to the hosted model. It persists across proxy
+restarts (when `path` is on a persistent volume), and is shared by the server
+worker processes.
+
+The model version is either fixed (`version`), or read from a response header of
+the hosted model (`version_header`). In the latter case, the first batch scored
+by each process is sent to the hosted model in full to read the current version.
+When the version changes, the entries of the previous versions are deleted.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from prediction_cache import row_keys
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    url TEXT NOT NULL,
+    version TEXT NOT NULL,
+    key BLOB NOT NULL,
+    value TEXT NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (url, version, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed);
+CREATE TABLE IF NOT EXISTS versions (
+    url TEXT PRIMARY KEY,
+    version TEXT NOT NULL
+);
+"""
+
+# maximum number of bound parameters per sqlite statement
+_MAX_VARIABLES = 900
+
+
+class DiskResponseCache:
+    """
+    Size-bounded, least recently used, on-disk cache of per-row hosted model predictions.
+    """
+
+    def __init__(self, path, url, max_entries=1000000, version=None, version_header=None):
+        """
+        :param str path: path of the SQLite database file
+        :param str url: the hosted model url, part of the cache key
+        :param int max_entries: maximum number of cached rows (over all urls and versions)
+        :param Optional[str] version: fixed hosted model version, part of the cache key
+        :param Optional[str] version_header: hosted model response header holding the model version
+        """
+        self.path = path
+        self.url = url
+        self.max_entries = int(max_entries)
+        self.version_header = version_header
+        self._version = None if version_header else str(version or '')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(['hits', 'misses', 'deduplicated', 'evictions', 'invalidations'], 0)
+        self._inserted = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+        if self._version is not None:
+            self.set_version(self._version)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the sqlite connection of the current thread (connections are not shared across threads or
+        forked processes)"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @property
+    def version(self):
+        """The current hosted model version, or None if it is not known yet"""
+        return self._version
+
+    def set_version(self, version) -> None:
+        """Sets the current hosted model version, deleting the entries of any other version of the hosted model
+
+        :param str version: the hosted model version
+        """
+        version = str(version or '')
+        connection = self._connection()
+        with self._lock:
+            self._version = version
+            current = connection.execute('SELECT version FROM versions WHERE url = ?', (self.url,)).fetchone()
+            if current is not None and current[0] == version:
+                return
+            with self._transaction():
+                deleted = connection.execute('DELETE FROM predictions WHERE url = ? AND version != ?',
+                                             (self.url, version)).rowcount
+                connection.execute('INSERT OR REPLACE INTO versions (url, version) VALUES (?, ?)',
+                                   (self.url, version))
+            self._counters['invalidations'] += deleted
+
+    def observe_response(self, headers) -> None:
+        """Updates the hosted model version from the response headers, if read from a header
+
+        :param headers: the hosted model response headers
+        """
+        if self.version_header:
+            version = headers.get(self.version_header)
+            if version is not None and version != self._version:
+                self.set_version(version)
+
+    def lookup(self, npinstances):
+        """Looks up the cached predictions of the rows of `npinstances`
+
+        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features)
+        :return: (row keys, dict of row key to cached prediction), where duplicate rows share a key
+        :rtype: tuple
+        """
+        keys = row_keys(npinstances)
+        unique = list(dict.fromkeys(keys))
+        cached = {}
+        version = self._version
+        if version is not None:
+            connection = self._connection()
+            for start in range(0, len(unique), _MAX_VARIABLES):
+                batch = unique[start:start + _MAX_VARIABLES]
+                cursor = connection.execute(
+                    f'SELECT key, value FROM predictions WHERE url = ? AND version = ? '
+                    f'AND key IN ({",".join("?" * len(batch))})', [self.url, version] + batch)
+                cached.update((key, json.loads(value)) for key, value in cursor)
+            if cached:
+                now = time.time()
+                with self._transaction():
+                    connection.executemany('UPDATE predictions SET accessed = ? '
+                                           'WHERE url = ? AND version = ? AND key = ?',
+                                           [(now, self.url, version, key) for key in cached])
+        with self._lock:
+            self._counters['deduplicated'] += len(keys) - len(unique)
+            self._counters['hits'] += len(cached)
+            self._counters['misses'] += len(unique) - len(cached)
+        return keys, cached
+
+    def store(self, keys, predictions) -> None:
+        """Stores the predictions of rows, evicting the least recently used rows beyond `max_entries`
+
+        :param list keys: the row keys, from `lookup`
+        :param predictions: the predictions for the rows, in the same order
+        """
+        version = self._version
+        if version is None or len(keys) == 0:
+            return
+        now = time.time()
+        values = np.asarray(predictions).tolist()
+        with self._transaction() as connection:
+            connection.executemany('INSERT OR REPLACE INTO predictions (url, version, key, value, accessed) '
+                                   'VALUES (?, ?, ?, ?, ?)',
+                                   [(self.url, version, key, json.dumps(value), now)
+                                    for key, value in zip(keys, values)])
+        with self._lock:
+            self._inserted += len(keys)
+            check = self._inserted >= max(1, self.max_entries // 100)
+            if check:
+                self._inserted = 0
+        if check:
+            self._evict(connection)
+
+    def _evict(self, connection) -> None:
+        excess = connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0] - self.max_entries
+        if excess > 0:
+            # rows stored by the same batch share an access time, and are evicted together
+            evicted = connection.execute('DELETE FROM predictions WHERE accessed <= '
+                                         '(SELECT accessed FROM predictions ORDER BY accessed LIMIT 1 OFFSET ?)',
+                                         (excess - 1,)).rowcount
+            with self._lock:
+                self._counters['evictions'] += evicted
+
+    @staticmethod
+    def missing_rows(keys, cached):
+        """Returns the keys of the rows that are not cached, and the index of the first row with each of them
+
+        :param list keys: the row keys, from `lookup`
+        :param dict cached: the cached predictions, from `lookup`
+        :return: (list of keys, list of row indices)
+        :rtype: tuple
+        """
+        first_rows = {}
+        for row, key in enumerate(keys):
+            if key not in cached and key not in first_rows:
+                first_rows[key] = row
+        return list(first_rows), list(first_rows.values())
+
+    @staticmethod
+    def merge(keys, cached, missing_keys, predictions) -> np.ndarray:
+        """Assembles the predictions of all rows from the cached predictions and those of the missing rows
+
+        :rtype: np.ndarray
+        """
+        if not cached and len(missing_keys) == len(keys):
+            return np.asarray(predictions)
+        results = dict(zip(missing_keys, np.asarray(predictions).tolist())) if missing_keys else {}
+        results.update(cached)
+        return np.array([results[key] for key in keys])
+
+    def predict(self, fn, npinstances) -> np.ndarray:
+        """Returns the predictions for `npinstances`, calling `fn` only on the rows that are not cached (once per
+        distinct row)
+
+        :param fn: function of a 2-D instances array returning an array of predictions, one per instance
+        :param np.ndarray npinstances: numpy array of shape (n_samples, n_features)
+        :rtype: np.ndarray
+        """
+        keys, cached = self.lookup(npinstances)
+        missing_keys, rows = self.missing_rows(keys, cached)
+        predictions = None
+        if rows:
+            predictions = fn(npinstances[rows])
+            self.store(missing_keys, predictions)
+        return self.merge(keys, cached, missing_keys, predictions)
+
+    def clear(self) -> None:
+        """Deletes all cached predictions of the hosted model"""
+        self._connection().execute('DELETE FROM predictions WHERE url = ?', (self.url,))
+
+    def stats(self) -> dict:
+        """
+        :return: dict of the counters of this process (hits, misses, de-duplicated rows, evictions and
+            invalidated rows), the hit rate, and the number of cached rows and size of the cache file in bytes
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.
+        stats['entries'] = self._connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        stats['file_bytes'] = sum(os.path.getsize(self.path + suffix)
+                                  for suffix in ('', '-wal') if os.path.exists(self.path + suffix))
+        return stats
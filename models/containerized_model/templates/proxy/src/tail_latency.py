@@ -0,0 +1,155 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Deadlines and hedged requests for the `Proxy` wrapper.
+
+Deadlines: a request to the proxy may carry a time budget in milliseconds in the
+`X-Request-Deadline-Ms` header (or the proxy may have a default budget). The
+budget becomes an absolute deadline for the hosted model calls made on behalf of
+the request: each call times out at the deadline, and the remaining budget is
+passed on to the hosted model in the same header. Calls that can not finish in
+time fail with `DeadlineExceeded`, rather than holding the request.
+
+Hedging: a hosted model call that is still outstanding after the observed p95
+latency of recent calls is sent again (e.g. to another replica behind the hosted
+model url), and the first response wins. At most `max_hedge_ratio` of the calls
+are hedged, bounding the extra load on the hosted model.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def deadline_from_headers(headers, default_ms=None):
+    """
+    Returns the absolute (`time.monotonic`) deadline of a request, from its budget in the
+    `X-Request-Deadline-Ms` header or the default budget.
+
+    :param headers: the request headers, or None
+    :param Optional[float] default_ms: budget of requests without the header, or None for no deadline
+    :return: the deadline, or None
+    """
+    budget_ms = headers.get(DEADLINE_HEADER) if headers is not None else None
+    if budget_ms is None:
+        budget_ms = default_ms
+    if budget_ms is None:
+        return None
+    try:
+        return time.monotonic() + float(budget_ms) / 1000.
+    except ValueError:
+        raise ValueError(f'invalid {DEADLINE_HEADER} header {budget_ms}')
+
+
+def remaining(deadline):
+    """
+    Returns the seconds left until the deadline, or None if there is no deadline.
+
+    :raises DeadlineExceeded: if the deadline has passed
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded('request deadline exceeded')
+    return left
+
+
+class LatencyTracker:
+    """
+    Tracks the latency of recent hosted model calls, and decides when to hedge a call.
+    """
+
+    def __init__(self, window=1000, percentile=95, min_samples=20, max_hedge_ratio=0.1):
+        """
+        :param int window: number of recent calls the latency percentile is computed over
+        :param float percentile: latency percentile after which an outstanding call is hedged
+        :param int min_samples: number of calls observed before hedging starts
+        :param float max_hedge_ratio: maximum fraction of calls that are hedged
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._hedge_delay = None
+        self._counters = dict.fromkeys(['calls', 'hedged', 'hedges_won'], 0)
+
+    def observe(self, latency) -> None:
+        """Records the latency in seconds of a (primary or hedge) call"""
+        with self._lock:
+            self._latencies.append(latency)
+            if len(self._latencies) >= self.min_samples and len(self._latencies) % 10 == 0:
+                self._hedge_delay = float(np.percentile(self._latencies, self.percentile))
+
+    def hedge_delay(self):
+        """Returns the seconds to wait for a call before hedging it, or None if it should not be hedged"""
+        with self._lock:
+            self._counters['calls'] += 1
+            if self._hedge_delay is None or self._counters['hedged'] >= self.max_hedge_ratio * self._counters['calls']:
+                return None
+            return self._hedge_delay
+
+    def count(self, counter) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> dict:
+        """
+        :return: dict of the counters of calls, hedged calls and hedges that returned first, and the
+            current hedge delay in milliseconds
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['hedge_delay_ms'] = None if self._hedge_delay is None else self._hedge_delay * 1000.
+        return stats
+
+
+def hedged_call(executor, fn, tracker, deadline=None):
+    """
+    Calls `fn(deadline)` in the executor, calling it again if the first call is still outstanding
+    after the tracker's hedge delay, and returns the first result. If the first call to finish
+    fails, the result of the other is used.
+
+    :param concurrent.futures.Executor executor: executor for the calls (not the caller's own executor,
+        to avoid waiting on a full pool)
+    :param fn: function of the deadline making the hosted model call
+    :param LatencyTracker tracker: latency tracker deciding the hedge delay
+    :param Optional[float] deadline: absolute deadline of the call, or None
+    """
+    def timed_call():
+        start = time.monotonic()
+        result = fn(deadline)
+        tracker.observe(time.monotonic() - start)
+        return result
+
+    delay = tracker.hedge_delay()
+    primary = executor.submit(timed_call)
+    if delay is None:
+        return primary.result()
+    left = remaining(deadline)
+    done, _ = wait([primary], timeout=delay if left is None else min(delay, left))
+    if done:
+        return primary.result()
+    tracker.count('hedged')
+    hedge = executor.submit(timed_call)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    tracker.count('hedges_won')
+                return future.result()
+            error = future.exception()
+    raise error
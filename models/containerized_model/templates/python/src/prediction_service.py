@@ -55,27 +55,58 @@ class PythonModelWrapper(SimpleModelWrapper):
 # These imports are used in launching the prediction service. They are not
 # used within the prediction service
 import os
-import pickle
-from utils import fetch_model, load_metadata
+from utils import fetch_artifacts
+from shared_memory import load_model_pickle, freeze_before_fork
+from wire_formats import install_binary_protocol
+from batching import install_micro_batching
+from prediction_cache import install_prediction_cache
+from warmup import install_warmup
+from metrics import install_metrics
+from profiling import install_profiler
+from thread_budget import ThreadBudget, install_thread_budget, resident_memory
+from serving import run_server
 
 def main():
-    metadata = load_metadata()
-    local_model_path = fetch_model()
-    model_pickle = pickle.load(open(local_model_path, 'rb'))
+    metadata, local_model_path = fetch_artifacts()
+    # Memory-map the model arrays, to share them across the worker processes, if enabled in metadata.yml
+    rss = resident_memory()
+    model_pickle = load_model_pickle(local_model_path, metadata.get('shared_memory'))
     model = model_pickle.get('model')
     encoder = model_pickle.get('encoder')
     threshold = model_pickle.get('threshold')
+    # the memory of a copy of the model is measured once its members are loaded (bundles load them on access)
+    budget = ThreadBudget.from_config(metadata.get('thread_budget'), model_bytes=resident_memory() - rss)
+    supports_soft_scores = metadata.get('supports_soft_scoring', False)
     app = PythonModelWrapper(model=model,
                   encoder=encoder,
                   host='0.0.0.0',
-                  supports_soft_scores=metadata.get('supports_soft_scoring', False),
+                  supports_soft_scores=supports_soft_scores,
                   score_labels=metadata.get('outcomes', None),
                   threshold=model_pickle.get('threshold'),
                   metadata=metadata
                   )
     app.set_global_imports() # needed if not running in production mode
-    # Production mode requires Certifai 1.3.6 or higher
-    app.run(production=True, log_level='warning', num_workers=3)
+    # Split the CPUs between the worker processes and their native thread pools, if enabled in metadata.yml
+    # (before the warm-up, so that it runs with the threads of a worker)
+    install_thread_budget(app, budget)
+    # Score sample rows before serving, and report ready on /ready after, if enabled in metadata.yml
+    install_warmup(app, metadata.get('warmup'), columns=metadata.get('columns'))
+    # Coalesce concurrent small requests, if enabled in metadata.yml
+    install_micro_batching(app, metadata.get('batching'))
+    # Score only rows that have not been scored before, if enabled in metadata.yml
+    install_prediction_cache(app, metadata.get('prediction_cache'))
+    # Accept binary columnar (npy/Arrow) requests in addition to JSON
+    install_binary_protocol(app, encoder=encoder, supports_soft_scores=supports_soft_scores,
+                            score_labels=metadata.get('outcomes', None), threshold=threshold)
+    # Serve per-stage latency histograms and worker counters on /metrics, if enabled in metadata.yml
+    install_metrics(app, metadata.get('metrics'))
+    # Sample-profile slow requests when turned on (PREDICTION_PROFILING, or POST /admin/profiling if enabled)
+    install_profiler(app, metadata.get('profiling'))
+    # Keep the model objects out of garbage collection in the forked workers, if enabled in metadata.yml
+    freeze_before_fork(metadata.get('shared_memory'))
+    # Serve with the SDK production server (requires Certifai 1.3.6 or higher), or the gunicorn worker class
+    # of metadata.yml (threaded workers when batching is enabled)
+    run_server(app, budget.num_workers, metadata.get('server'), metadata.get('batching'))
     # Replace above with following to run in development mode
     # app.run()
 
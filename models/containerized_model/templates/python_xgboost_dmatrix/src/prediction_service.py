@@ -13,7 +13,18 @@ class XgboostWrapper(SimpleModelWrapper):
     def __init__(self, *args, **kwargs):
         self.metadata = kwargs.pop('metadata', {})
         self.task_type = self.metadata.get('task_type', 'binary-classification')
+        inference = self.metadata.get('xgboost_inference') or {}
+        # predict in place on the instances, rather than building a DMatrix for every request
+        self.inplace_predict = inference.get('inplace_predict', True)
         SimpleModelWrapper.__init__(self, *args, **kwargs)
+        nthread = inference.get('nthread')
+        if nthread:
+            # threads per worker process - the default (all cores) oversubscribes the cores with several workers
+            if hasattr(self.model, 'set_param'):
+                self.model.set_param({'nthread': int(nthread)})
+            elif hasattr(self.model, 'get_booster'):
+                # XGBClassifier / XGBRegressor
+                self.model.set_params(n_jobs=int(nthread))
 
     def set_global_imports(self):
         """Override this method to make external global imports
@@ -28,17 +39,30 @@ class XgboostWrapper(SimpleModelWrapper):
         global np
         import numpy as np
 
+    def _predict_scores(self, npinstances):
+        """Predicts with the booster, in place on a contiguous float32 copy of the instances if possible
+
+        :param npinstances: np.ndarray
+        :return: np.ndarray
+        """
+        if self.inplace_predict and hasattr(self.model, 'inplace_predict'):
+            return self.model.inplace_predict(np.ascontiguousarray(npinstances, dtype=np.float32))
+        return self.model.predict(xgb.DMatrix(data=npinstances))
+
     def soft_predict(self, npinstances):
         """Override this method for custom soft scoring model predictions (binary/multiclass)
 
         :param npinstances: np.ndarray
         :return: np.ndarray
         """
-        results = self.model.predict(xgb.DMatrix(data=npinstances))
+        results = self._predict_scores(npinstances)
         if self.task_type == 'binary-classification':
             # certifai needs scores for both classes to create `score -> outcome label` mappings, whereas
             # XGBoost-DMatrix predict returns a single score for binary-classification
-            return np.column_stack((1. - results, results))
+            scores = np.empty((len(results), 2), dtype=results.dtype)
+            np.subtract(1., results, out=scores[:, 0])
+            scores[:, 1] = results
+            return scores
         else:
             # multiclass-classification case (XGBoost DMatrix returns scores for all classes)
             return results
@@ -50,24 +74,32 @@ class XgboostWrapper(SimpleModelWrapper):
         :return: np.ndarray
         """
         # regression uses `predict`(hard models) as compared to `soft_predict`(soft scoring models)
-        results = self.model.predict(xgb.DMatrix(data=npinstances))
+        results = self._predict_scores(npinstances)
         return results
 
-
 # These imports are used in launching the prediction service. They are not
 # used within the prediction service
 import os
-import pickle
-from utils import fetch_model, load_metadata
+from utils import fetch_artifacts
+from shared_memory import load_model_pickle, freeze_before_fork
+from wire_formats import install_binary_protocol
+from warmup import install_warmup
+from metrics import install_metrics
+from profiling import install_profiler
+from thread_budget import ThreadBudget, install_thread_budget, resident_memory
+from serving import run_server
 
 
 def main():
-    metadata = load_metadata()
-    local_model_path = fetch_model()
-    model_pickle = pickle.load(open(local_model_path, 'rb'))
+    metadata, local_model_path = fetch_artifacts()
+    # Memory-map the model arrays, to share them across the worker processes, if enabled in metadata.yml
+    rss = resident_memory()
+    model_pickle = load_model_pickle(local_model_path, metadata.get('shared_memory'))
     model = model_pickle.get('model')
     encoder = model_pickle.get('encoder')
     threshold = model_pickle.get('threshold')
+    # the memory of a copy of the model is measured once its members are loaded (bundles load them on access)
+    budget = ThreadBudget.from_config(metadata.get('thread_budget'), model_bytes=resident_memory() - rss)
 
     # soft-scoring by design is intended to be used with classification
     # regression is represented as hard-scoring model
@@ -82,9 +114,24 @@ def main():
                          score_labels=metadata.get('outcomes', None),
                          metadata=metadata
                          )
+    # Accept binary columnar (npy/Arrow) requests in addition to JSON
+    install_binary_protocol(app, encoder=encoder, supports_soft_scores=supports_soft_scores,
+                            score_labels=metadata.get('outcomes', None), threshold=threshold)
     app.set_global_imports()  # needed if not running in production mode
-    # Production mode requires Certifai 1.3.6 or higher
-    app.run(production=True, log_level='warning', num_workers=3)
+    # Split the CPUs between the worker processes and their native thread pools, if enabled in metadata.yml
+    # (before the warm-up, so that it runs with the threads of a worker)
+    install_thread_budget(app, budget)
+    # Score sample rows before serving, and report ready on /ready after, if enabled in metadata.yml
+    install_warmup(app, metadata.get('warmup'), columns=metadata.get('columns'))
+    # Serve per-stage latency histograms and worker counters on /metrics, if enabled in metadata.yml
+    install_metrics(app, metadata.get('metrics'))
+    # Sample-profile slow requests when turned on (PREDICTION_PROFILING, or POST /admin/profiling if enabled)
+    install_profiler(app, metadata.get('profiling'))
+    # Keep the model objects out of garbage collection in the forked workers, if enabled in metadata.yml
+    freeze_before_fork(metadata.get('shared_memory'))
+    # Serve with the SDK production server (requires Certifai 1.3.6 or higher), or the gunicorn worker class
+    # of metadata.yml (threaded workers when batching is enabled)
+    run_server(app, budget.num_workers, metadata.get('server'), metadata.get('batching'))
     # Replace above with following to run in development mode
     # app.run()
 
@@ -3,12 +3,17 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import json
 import os
 import pickle
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from certifai.common.file.locaters import make_generic_locater
 from certifai.common.file.interface import FilePath
 
+from artifact_cache import fetch_file
+from model_bundle import MANIFEST, is_bundle
+
 CURRENT_PATH = os.path.abspath(os.path.dirname(__file__))
 ROOT_PATH = os.path.normpath(os.path.join(CURRENT_PATH, '..'))
 
@@ -20,27 +25,28 @@ def _create_state_store():
     return _model_store_tmp_path
 
 
-def read_and_save_file(source_path, destination_path):
+def read_and_save_file(source_path, destination_path, sha256=None):
+    """
+    Streams the file at source_path to destination_path, through the
+    content-addressed cache in MODEL_CACHE_DIR if set (see artifact_cache.py).
+
+    :param str source_path: Path or url of the file
+    :param str destination_path: Local path to save the file to
+    :param str sha256: Optional expected sha256 hex digest of the file
+    :return: the path the file was saved to
+    """
     if source_path is None:
         return
-    # Fetch file as binary
-    locater = make_generic_locater(FilePath(source_path))
-    if locater.isfile():
-        with locater.reader() as f:
-            contents = f.read()
-        try:
-            with open(destination_path, 'wb') as f:
-                f.write(contents)
-        except PermissionError as e:
-            _model_store_tmp_path = _create_state_store()
-            print(
-                f"can't persist model to container permission error \n{str(e)}\ndefaulting persist to "
-                f"{_model_store_tmp_path}")
-            destination_path = os.path.join(_model_store_tmp_path, os.path.basename(destination_path))
-            with open(destination_path, 'wb') as f:
-                f.write(contents)
-    else:
-        raise ValueError(f'{destination_path} is not a file object')
+    cache_dir = os.getenv('MODEL_CACHE_DIR')
+    try:
+        fetch_file(source_path, destination_path, sha256=sha256, cache_dir=cache_dir)
+    except PermissionError as e:
+        _model_store_tmp_path = _create_state_store()
+        print(
+            f"can't persist model to container permission error \n{str(e)}\ndefaulting persist to "
+            f"{_model_store_tmp_path}")
+        destination_path = os.path.join(_model_store_tmp_path, os.path.basename(destination_path))
+        fetch_file(source_path, destination_path, sha256=sha256, cache_dir=cache_dir)
 
     return destination_path
 
@@ -75,10 +81,52 @@ def load_metadata(root_path=ROOT_PATH):
     return metadata
 
 
+def fetch_bundle(source_path, destination_path):
+    """
+    Fetches the model bundle folder at source_path (see model_bundle.py) to
+    destination_path: its member files concurrently, each verified against
+    (and cached by) its sha256 in the manifest, then the manifest.
+
+    :param str source_path: Path or url of the bundle folder
+    :param str destination_path: Local path of the bundle folder
+    :return: the path the bundle was saved to
+    """
+    source_path = source_path.rstrip('/')
+    locater = make_generic_locater(FilePath(f'{source_path}/{MANIFEST}'))
+    with locater.text_reader() as f:
+        manifest = f.read()
+    files = [(entry['file'], entry.get('sha256')) for entry in json.loads(manifest)['members'].values()
+             if 'file' in entry]
+
+    def fetch(destination):
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(files)))) as executor:
+            for future in [executor.submit(fetch_file, f'{source_path}/{filename}',
+                                           os.path.join(destination, filename),
+                                           sha256=sha256, cache_dir=os.getenv('MODEL_CACHE_DIR'))
+                           for filename, sha256 in files]:
+                future.result()
+        # the manifest is written last, so that a partially fetched bundle is not loaded
+        with open(os.path.join(destination, MANIFEST), 'w') as f:
+            f.write(manifest)
+
+    try:
+        fetch(destination_path)
+    except PermissionError as e:
+        destination_path = os.path.join(_create_state_store(), os.path.basename(destination_path))
+        print(f"can't persist model to container permission error \n{str(e)}\ndefaulting persist to "
+              f"{destination_path}")
+        fetch(destination_path)
+    return destination_path
+
+
 def fetch_model(root_path=ROOT_PATH):
     """
     Fetches the file at the url specified by MODEL_PATH, and saves
     it in the 'model' folder relative to root_path, with the same filename.
+    MODEL_PATH may also be a model bundle folder (ending in '.bundle').
+    If MODEL_SHA256 is set, the model is verified against it. A model already
+    in the MODEL_CACHE_DIR cache is not fetched again if MODEL_SHA256 is set, or
+    if its size and modification time (or ETag) are unchanged.
 
     :param str root_path: Path to local folder (must be writable)
     :return: the path to the model saved locally
@@ -88,10 +136,30 @@ def fetch_model(root_path=ROOT_PATH):
         # Copy files from remote path to local
 
         local_model_path = os.path.normpath(os.path.join(root_path,
-                                                         'model', os.path.basename(model_path)))
-        local_model_path = read_and_save_file(model_path, local_model_path)
+                                                         'model', os.path.basename(model_path.rstrip('/'))))
+        if model_path.rstrip('/').endswith('.bundle'):
+            local_model_path = fetch_bundle(model_path, local_model_path)
+        else:
+            local_model_path = read_and_save_file(model_path, local_model_path,
+                                                  sha256=os.getenv('MODEL_SHA256'))
     else:
         # allows local testing
         local_model_path = os.path.normpath(os.path.join(root_path,
-                                                         'model/model.pkl'))
+                                                         'model/model.bundle'))
+        if not is_bundle(local_model_path):
+            local_model_path = os.path.normpath(os.path.join(root_path,
+                                                             'model/model.pkl'))
     return local_model_path
+
+
+def fetch_artifacts(root_path=ROOT_PATH):
+    """
+    Loads the metadata and fetches the model concurrently.
+
+    :param str root_path: Path to local folder (must be writable)
+    :return: (metadata object, the path to the model saved locally)
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        metadata = executor.submit(load_metadata, root_path)
+        local_model_path = executor.submit(fetch_model, root_path)
+        return metadata.result(), local_model_path.result()
@@ -0,0 +1,203 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Streaming fetch of model artifacts into a content-addressed local cache.
+
+Artifacts are copied from their (local or remote) location in fixed size chunks,
+so that memory use does not grow with the artifact size, and written atomically.
+
+If `cache_dir` is set (`MODEL_CACHE_DIR`, ideally a persistent volume), fetched
+artifacts are also stored under their sha256 digest:
+
+    <cache_dir>/blobs/<sha256>   artifact contents
+    <cache_dir>/index/<key>      sha256 of the artifact with a given fingerprint
+
+An artifact is found in the cache without reading it from its location when its
+fingerprint is known: the expected sha256 of its contents (e.g. `MODEL_SHA256`),
+the size and modification time of a local file, or the size, last modified time
+and ETag the storage service reports for a cloud storage object (with `fsspec` and
+the filesystem of the url, e.g. `s3fs`, `gcsfs` or `adlfs`). The cached artifact
+is then hard linked (or copied) to its destination.
+
+The cache is best effort: if it can not be written (e.g. a read-only volume),
+artifacts are fetched without being cached.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from certifai.common.file.interface import FilePath
+from certifai.common.file.locaters import make_generic_locater
+
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+# object metadata that identifies a version of a cloud storage object, by filesystem (s3fs, gcsfs, adlfs)
+MODIFIED_KEYS = ('LastModified', 'updated', 'last_modified', 'mtime')
+ETAG_KEYS = ('ETag', 'etag', 'md5Hash', 'generation')
+
+
+def fingerprint(source_path, sha256=None):
+    """
+    Identifies the contents of an artifact without reading it.
+
+    :param str source_path: the artifact location
+    :param Optional[str] sha256: the expected sha256 hex digest of the artifact, if known
+    :return: the fingerprint, or None if the contents can not be identified without reading them
+    """
+    if sha256:
+        return f'sha256:{sha256.lower()}'
+    if os.path.isfile(source_path):
+        stat = os.stat(source_path)
+        return f'file:{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return _object_fingerprint(source_path)
+
+
+def _object_fingerprint(source_path):
+    """
+    :return: the fingerprint of a cloud storage object from its size, last modified time and ETag (as
+        reported by the storage service), or None if they are not available
+    """
+    if '://' not in source_path:
+        return None
+    try:
+        import fsspec
+    except ImportError:
+        return None
+    try:
+        fs, path = fsspec.core.url_to_fs(source_path)
+        info = fs.info(path)
+    except Exception:
+        # no filesystem for the url, or no access to the object metadata: the artifact is fetched
+        return None
+    modified = next((info[key] for key in MODIFIED_KEYS if info.get(key) is not None), None)
+    etag = next((info[key] for key in ETAG_KEYS if info.get(key) is not None), None)
+    if info.get('type') != 'file' or info.get('size') is None or (modified is None and etag is None):
+        return None
+    return f'object:{source_path}:{info["size"]}:{modified}:{etag}'
+
+
+def _index_path(cache_dir, source_fingerprint):
+    return os.path.join(cache_dir, 'index', hashlib.sha256(source_fingerprint.encode()).hexdigest())
+
+
+def _blob_path(cache_dir, digest):
+    return os.path.join(cache_dir, 'blobs', digest)
+
+
+def _atomic_write(destination_path, write):
+    """Calls `write(file)` on a temporary file next to the destination, then moves it to the destination"""
+    directory = os.path.dirname(os.path.abspath(destination_path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.fetch-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            result = write(f)
+        os.replace(tmp_path, destination_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return result
+
+
+def _link_or_copy(source_path, destination_path):
+    """Hard links the file to the destination, copying it if a link is not possible (e.g. across devices)"""
+    directory = os.path.dirname(os.path.abspath(destination_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f'.link-{os.getpid()}-{os.path.basename(destination_path)}')
+    try:
+        os.link(source_path, tmp_path)
+        os.replace(tmp_path, destination_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with open(source_path, 'rb') as src:
+            _atomic_write(destination_path, lambda dst: shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE))
+
+
+def stream_copy(reader, writer, with_digest=True):
+    """
+    Copies a file object to another in chunks, returning the sha256 hex digest of the contents
+    (or None if not `with_digest`).
+    """
+    if not with_digest:
+        shutil.copyfileobj(reader, writer, COPY_BUFFER_SIZE)
+        return None
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: reader.read(COPY_BUFFER_SIZE), b''):
+        digest.update(chunk)
+        writer.write(chunk)
+    return digest.hexdigest()
+
+
+def lookup(cache_dir, source_fingerprint):
+    """
+    :return: path of the cached artifact with the fingerprint, or None
+    """
+    if not cache_dir or not source_fingerprint:
+        return None
+    if source_fingerprint.startswith('sha256:'):
+        digest = source_fingerprint[len('sha256:'):]
+    else:
+        try:
+            with open(_index_path(cache_dir, source_fingerprint)) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+    blob_path = _blob_path(cache_dir, digest)
+    return blob_path if os.path.isfile(blob_path) else None
+
+
+def store(cache_dir, source_fingerprint, digest, local_path):
+    """
+    Adds a fetched artifact to the cache, under its digest and fingerprint.
+    """
+    blob_path = _blob_path(cache_dir, digest)
+    if not os.path.isfile(blob_path):
+        _link_or_copy(local_path, blob_path)
+    if source_fingerprint and not source_fingerprint.startswith('sha256:'):
+        index_path = _index_path(cache_dir, source_fingerprint)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, 'w') as f:
+            f.write(digest)
+
+
+def fetch_file(source_path, destination_path, sha256=None, cache_dir=None):
+    """
+    Fetches the file at `source_path` to `destination_path`, from the cache if possible.
+
+    :param str source_path: the artifact location (local path or cloud storage url)
+    :param str destination_path: the local path to save the artifact to
+    :param Optional[str] sha256: the expected sha256 hex digest of the artifact, verified after fetching
+    :param Optional[str] cache_dir: the cache directory, or None to not cache the artifact
+    :return: destination_path
+    """
+    if os.path.isfile(source_path) and os.path.isfile(destination_path) \
+            and os.path.samefile(source_path, destination_path):
+        return destination_path
+    source_fingerprint = fingerprint(source_path, sha256)
+    cached_path = lookup(cache_dir, source_fingerprint)
+    if cached_path is not None:
+        _link_or_copy(cached_path, destination_path)
+        return destination_path
+
+    locater = make_generic_locater(FilePath(source_path))
+    if not locater.isfile():
+        raise ValueError(f'{destination_path} is not a file object')
+
+    def write(f):
+        with locater.reader() as reader:
+            # the digest is only needed to verify or cache the artifact
+            return stream_copy(reader, f, with_digest=bool(sha256 or cache_dir))
+    digest = _atomic_write(destination_path, write)
+    if sha256 and digest != sha256.lower():
+        os.remove(destination_path)
+        raise ValueError(f'sha256 of {source_path} is {digest}, expected {sha256}')
+    if cache_dir:
+        try:
+            store(cache_dir, source_fingerprint, digest, destination_path)
+        except OSError as e:
+            # e.g. a read-only cache volume: the artifact is fetched again next time
+            print(f"can't cache {source_path} in {cache_dir}, not caching it\n{str(e)}")
+    return destination_path
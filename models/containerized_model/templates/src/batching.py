@@ -0,0 +1,180 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Request micro-batching for prediction services.
+
+Concurrent calls to `predict`/`soft_predict` that arrive within a short window
+are coalesced into a single call on the stacked instances, and the results are
+split back out to each caller. This amortizes the per-call overhead of the model
+framework over many small requests.
+
+Coalescing only happens between requests served concurrently by the same process
+(i.e. by a threaded server, or a threaded gunicorn worker class such as gthread,
+which the templates serve with when batching is enabled, see `serving.py`).
+Worker processes serving one request at a time (e.g. gunicorn sync workers) have
+nothing to coalesce: until a batcher sees concurrent calls, requests are scored
+without waiting for others, and it logs a warning after `SERIAL_CALLS_REPORTED`
+calls that it has not coalesced any. Instances may be numpy arrays, or scipy sparse
+matrices (e.g. the output of a sparse encoder), which are stacked as CSR. Enable it in `model/metadata.yml`:
+
+    batching:
+      enabled: true
+      max_batch_size: 64  # maximum number of rows in a coalesced call
+      max_wait_ms: 1      # maximum time a request waits for others to arrive
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+# calls of a process without concurrent calls after which the batcher reports that it is not coalescing
+SERIAL_CALLS_REPORTED = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def _stack(instances):
+    if hasattr(instances[0], 'tocsr'):
+        from scipy import sparse
+        return sparse.vstack(instances, format='csr')
+    return np.concatenate(instances)
+
+
+class _Pending:
+    __slots__ = ('instances', 'result', 'error', 'done')
+
+    def __init__(self, instances):
+        self.instances = instances
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls to `fn` into calls on batches of up to
+    `max_batch_size` rows.
+
+    There is no background thread: the first caller to arrive leads the batch,
+    waiting up to `max_wait_ms` for other callers to join it, then calls `fn` on
+    behalf of all of them. This keeps the batcher safe to create before forking
+    server worker processes. The leader only waits once the batcher has seen a
+    call arrive while another was in progress, so that serving one request at a
+    time does not add `max_wait_ms` to every request.
+    """
+
+    def __init__(self, fn, max_batch_size=64, max_wait_ms=1.):
+        """
+        :param fn: function of a 2-D instances array returning an array with one entry (or row) per instance
+        :param int max_batch_size: maximum number of rows in a coalesced call
+        :param float max_wait_ms: maximum time a caller waits for a batch to fill
+        """
+        self.fn = fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000.
+        self._cond = threading.Condition()
+        self._queue = []
+        self._queued_rows = 0
+        self._leading = False
+        self._in_flight = 0
+        self._concurrent = False
+        self._serial_calls = 0
+
+    def __call__(self, npinstances):
+        pending = _Pending(npinstances)
+        with self._cond:
+            self._in_flight += 1
+            if self._in_flight > 1:
+                self._concurrent = True
+            elif not self._concurrent:
+                self._serial_calls += 1
+                if self._serial_calls == SERIAL_CALLS_REPORTED:
+                    logger.warning('micro-batching has not coalesced any of %d requests: the server serves one '
+                                   'request at a time per worker process (use a threaded worker class)',
+                                   SERIAL_CALLS_REPORTED)
+            self._queue.append(pending)
+            self._queued_rows += npinstances.shape[0]
+            self._cond.notify_all()
+            try:
+                while not pending.done:
+                    if self._leading:
+                        self._cond.wait()
+                    else:
+                        self._lead()
+            finally:
+                self._in_flight -= 1
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _lead(self):
+        # Called with the lock held. Waits for the batch to fill (or the window
+        # to close), then runs `fn` on as many queued rows as fit in a batch.
+        self._leading = True
+        deadline = time.monotonic() + (self.max_wait if self._concurrent else 0.)
+        while self._queued_rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+
+        batch, rows = [], 0
+        while self._queue and (not batch or rows + self._queue[0].instances.shape[0] <= self.max_batch_size):
+            pending = self._queue.pop(0)
+            batch.append(pending)
+            rows += pending.instances.shape[0]
+        self._queued_rows -= rows
+
+        self._cond.release()
+        try:
+            self._run(batch)
+        finally:
+            self._cond.acquire()
+            self._leading = False
+            self._cond.notify_all()
+
+    def _run(self, batch):
+        if len(batch) == 1:
+            self._run_single(batch[0])
+            return
+        try:
+            results = np.asarray(self.fn(_stack([p.instances for p in batch])))
+        except Exception:
+            # run the requests separately, so that only the failing request errors
+            for pending in batch:
+                self._run_single(pending)
+            return
+        start = 0
+        for pending in batch:
+            end = start + pending.instances.shape[0]
+            pending.result = results[start:end]
+            pending.done = True
+            start = end
+
+    def _run_single(self, pending):
+        try:
+            pending.result = self.fn(pending.instances)
+        except Exception as e:
+            pending.error = e
+        pending.done = True
+
+
+def install_micro_batching(wrapper, config, methods=('predict', 'soft_predict')):
+    """
+    Coalesces concurrent calls to the wrapper's `predict` and `soft_predict`,
+    if enabled in the `batching` section of the metadata.
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param dict config: the `batching` section of the metadata, or None
+    :param tuple methods: the wrapper methods to coalesce
+    """
+    config = config or {}
+    if not config.get('enabled', False):
+        return
+    for method in methods:
+        batcher = MicroBatcher(getattr(wrapper, method),
+                               max_batch_size=config.get('max_batch_size', 64),
+                               max_wait_ms=config.get('max_wait_ms', 1.))
+        setattr(wrapper, method, batcher)
@@ -0,0 +1,262 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Prometheus `/metrics` endpoint for prediction services, with latency histograms
+for the stages of a prediction request:
+
+- `decode`: reading and decoding the request, up to the first stage below,
+- `encode`: the model encoder transform,
+- `predict` / `soft_predict`: the model (including micro-batching and prediction
+  cache, if enabled),
+- `postprocess`: conversion of model outputs to predictions, where the wrapper
+  does it (e.g. the H2O MOJO template's `get_predictions`, binary requests),
+- `serialize`: from the end of the last stage to the end of the response (for
+  JSON requests, this includes the Certifai SDK's conversion of soft scores to
+  labels).
+
+It also has the total request latency, the distribution of request batch sizes,
+per-worker request and row counters, and the counters (hits, misses, evictions...),
+entries and memory use of the prediction caches, if enabled. For the proxy with
+adaptive control, it has the controller's chunk size, in-flight limit and requests,
+and counters of its responses and decisions. The metrics are kept
+in prometheus_client multiprocess mode (files in a directory shared by the server
+worker processes), so that `/metrics` returns the histograms and counters of all the
+workers, whichever worker serves it. Requires `prometheus_client`. Enable it in `model/metadata.yml`:
+
+    metrics:
+      enabled: true
+      multiproc_dir: /tmp/prometheus   # defaults to a new temporary directory
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_URL = '/metrics'
+STAGES = ('decode', 'encode', 'predict', 'soft_predict', 'postprocess', 'serialize')
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000)
+# counters of `PredictionCache.stats`
+CACHE_COUNTERS = ('hits', 'misses', 'deduplicated', 'evictions', 'expirations')
+# counters of `AIMDController.metrics` (proxy)
+ADAPTIVE_CONTROL_COUNTERS = ('requests', 'throttled', 'too_large', 'slow', 'retries', 'limit_increases',
+                             'limit_decreases', 'chunk_increases', 'chunk_decreases')
+
+_local = threading.local()
+
+
+class _Timeline:
+    """Durations of the stages of the request being served by a thread"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = {}
+        # time spent in nested stages, for each stage being timed
+        self.nested = []
+        self.first_start = None
+        self.last_end = None
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the request being served by the calling thread (a no-op outside of a timed
+    request). Time in nested stages is only counted for the nested stage.
+    """
+    timeline = getattr(_local, 'timeline', None)
+    if timeline is None:
+        yield
+        return
+    start = time.perf_counter()
+    timeline.nested.append(0.)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = timeline.nested.pop()
+        timeline.durations[name] = timeline.durations.get(name, 0.) + elapsed - nested
+        if timeline.nested:
+            timeline.nested[-1] += elapsed
+        else:
+            if timeline.first_start is None:
+                timeline.first_start = start
+            timeline.last_end = start + elapsed
+
+
+def timed(name, fn):
+    """Returns `fn` timed as the named stage"""
+    def timed_fn(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return timed_fn
+
+
+class PredictionMetrics:
+    """
+    The prediction service metrics, in prometheus_client multiprocess mode.
+    """
+
+    def __init__(self, multiproc_dir=None, adaptive_control=False):
+        """
+        :param Optional[str] multiproc_dir: directory of the metric files shared by the worker processes;
+            it is emptied of the files of previous runs
+        :param bool adaptive_control: whether to add the metrics of the proxy's adaptive controller
+        """
+        self.multiproc_dir = multiproc_dir or tempfile.mkdtemp(prefix='prometheus_')
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        for name in os.listdir(self.multiproc_dir):
+            if name.endswith('.db'):
+                os.remove(os.path.join(self.multiproc_dir, name))
+        # read by prometheus_client when it is imported, to keep metric values in per-process files
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = self.multiproc_dir
+        os.environ['prometheus_multiproc_dir'] = self.multiproc_dir
+        from prometheus_client import Counter, Gauge, Histogram
+        self.stage_seconds = Histogram('certifai_prediction_stage_seconds', 'Latency of the prediction request stages',
+                                       ['stage'], buckets=LATENCY_BUCKETS)
+        self.request_seconds = Histogram('certifai_prediction_request_seconds', 'Latency of prediction requests',
+                                         buckets=LATENCY_BUCKETS)
+        self.batch_size = Histogram('certifai_prediction_batch_size', 'Number of instances per prediction request',
+                                    ['method'], buckets=BATCH_SIZE_BUCKETS)
+        self.requests = Counter('certifai_prediction_requests', 'Prediction requests served, per worker process',
+                                ['worker', 'status'])
+        self.rows = Counter('certifai_prediction_rows', 'Instances scored, per worker process', ['worker', 'method'])
+        self.cache_rows = Counter('certifai_prediction_cache_rows', 'Prediction cache lookups by outcome, and '
+                                  'evictions and expirations of cached rows', ['method', 'event'])
+        # the gauges of each worker process, labelled with its pid
+        self.cache_entries = Gauge('certifai_prediction_cache_entries', 'Rows in the prediction cache', ['method'],
+                                   multiprocess_mode='all')
+        self.cache_memory = Gauge('certifai_prediction_cache_memory_bytes',
+                                  'Approximate memory of the prediction cache', ['method'], multiprocess_mode='all')
+        if adaptive_control:
+            self.control_events = Counter('certifai_proxy_adaptive_control_events',
+                                          'Hosted model responses and decisions of the adaptive controller', ['event'])
+            self.control_values = Gauge('certifai_proxy_adaptive_control', 'Chunk size, in-flight limit and requests '
+                                        'in flight of the adaptive controller', ['value'], multiprocess_mode='all')
+        self._last_counters = {}
+        self._counters_lock = threading.Lock()
+
+    def observe_request(self, timeline, end, status):
+        durations = dict(timeline.durations)
+        if timeline.first_start is not None:
+            durations.setdefault('decode', timeline.first_start - timeline.start)
+            durations.setdefault('serialize', end - timeline.last_end)
+        for name, seconds in durations.items():
+            self.stage_seconds.labels(name).observe(seconds)
+        self.request_seconds.observe(end - timeline.start)
+        self.requests.labels(str(os.getpid()), status.split(' ', 1)[0]).inc()
+
+    def observe_batch(self, method, rows):
+        self.batch_size.labels(method).observe(rows)
+        self.rows.labels(str(os.getpid()), method).inc(rows)
+
+    def _increment(self, source, stats, names, counter, *labels):
+        """Increments the counter by the increase of the named `stats` counters since the last call for the source"""
+        with self._counters_lock:
+            last = self._last_counters.get(source, {})
+            for name in names:
+                increment = stats[name] - last.get(name, 0)
+                if increment > 0:
+                    counter.labels(*labels, name).inc(increment)
+            self._last_counters[source] = stats
+
+    def observe_cache(self, method, stats):
+        """Exports the `stats` of a prediction cache"""
+        self._increment(('cache', method), stats, CACHE_COUNTERS, self.cache_rows, method)
+        self.cache_entries.labels(method).set(stats['entries'])
+        self.cache_memory.labels(method).set(stats['memory_bytes'])
+
+    def observe_adaptive_control(self, stats):
+        """Exports the `metrics()` of the proxy's adaptive controller"""
+        self._increment('adaptive_control', stats, ADAPTIVE_CONTROL_COUNTERS, self.control_events)
+        for name in ('chunk_size', 'limit', 'in_flight'):
+            self.control_values.labels(name).set(stats[name])
+
+    def render(self):
+        """Returns the metrics of all the worker processes, in the Prometheus text format"""
+        from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+        from prometheus_client.multiprocess import MultiProcessCollector
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, path=self.multiproc_dir)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that times the requests to the predict endpoint, and the stages within them.
+    """
+
+    def __init__(self, wsgi_app, endpoint_url, metrics):
+        self.wsgi_app = wsgi_app
+        self.endpoint_url = endpoint_url
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST' or environ.get('PATH_INFO') != self.endpoint_url:
+            return self.wsgi_app(environ, start_response)
+        status = []
+
+        def recording_start_response(response_status, headers, *args):
+            status.append(response_status)
+            return start_response(response_status, headers, *args)
+
+        _local.timeline = timeline = _Timeline()
+        try:
+            result = self.wsgi_app(environ, recording_start_response)
+            # the prediction service responses are built in memory, so this only joins the chunks
+            try:
+                body = [b''.join(result)]
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            _local.timeline = None
+        self.metrics.observe_request(timeline, time.perf_counter(), status[0] if status else '500')
+        return body
+
+
+def install_metrics(wrapper, config, endpoint_url='/predict', methods=('predict', 'soft_predict')):
+    """
+    Adds the `/metrics` endpoint to the wrapper's application, and times its prediction requests, if
+    enabled in the `metrics` section of the metadata. Call it after installing the other features, so
+    that the request and model stages include them. The metrics are available as `wrapper.metrics`
+    (None if not enabled).
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param dict config: the `metrics` section of the metadata, or None
+    :param str endpoint_url: the predict endpoint of the wrapper
+    :param tuple methods: the wrapper methods to time as model stages
+    """
+    config = config or {}
+    wrapper.metrics = None
+    if not config.get('enabled', False):
+        return
+    control = getattr(wrapper, 'adaptive_control', None)
+    metrics = wrapper.metrics = PredictionMetrics(config.get('multiproc_dir'), adaptive_control=control is not None)
+
+    caches = getattr(wrapper, 'prediction_caches', {})
+    for method in methods:
+        fn = timed(method, getattr(wrapper, method))
+
+        def observed(npinstances, fn=fn, method=method, **kwargs):
+            metrics.observe_batch(method, npinstances.shape[0])
+            try:
+                return fn(npinstances, **kwargs)
+            finally:
+                if method in caches:
+                    metrics.observe_cache(method, caches[method].stats())
+                if control is not None:
+                    metrics.observe_adaptive_control(control.metrics())
+        setattr(wrapper, method, observed)
+    if callable(getattr(wrapper, 'encoder', None)):
+        wrapper.encoder = timed('encode', wrapper.encoder)
+    if callable(getattr(wrapper, 'get_predictions', None)):
+        wrapper.get_predictions = timed('postprocess', wrapper.get_predictions)
+
+    def render_metrics():
+        body, content_type = metrics.render()
+        return body, 200, {'Content-Type': content_type}
+    wrapper.app.add_url_rule(METRICS_URL, 'metrics', render_metrics, methods=['GET'])
+    app = wrapper.app
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, endpoint_url, metrics)
@@ -0,0 +1,202 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Versioned model bundle format, an alternative to a single pickled dict of
+`{'model': ..., 'encoder': ..., 'threshold': ..., ...}`.
+
+A bundle is a folder (named `<name>.bundle` by convention) holding a manifest and
+one file per member of the dict:
+
+    manifest.json    format version, creation time, library versions, and the members
+    model.joblib     objects, saved with joblib (numpy arrays are stored raw)
+    weights.npy      numpy arrays, saved with numpy
+                     (json values such as the threshold are kept in the manifest)
+
+Members are loaded lazily, on first access, and their numpy arrays are memory-mapped
+read-only rather than read into memory, so that loading a bundle is fast, only pays
+for the members that are used, and shares the array memory between processes.
+The manifest records the sha256 of each file, to verify (and cache) fetched bundles.
+
+    write_bundle({'model': model, 'encoder': encoder, 'threshold': 0.5}, 'model.bundle')
+    saved = load_model('model.bundle')  # also loads pickled dicts, e.g. model.pkl if there is no bundle
+    model = saved.get('model')
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+FORMAT = 'certifai-model-bundle'
+FORMAT_VERSION = 1
+# libraries whose version is recorded in the manifest, if loaded when the bundle is written
+_LIBRARIES = ('numpy', 'pandas', 'sklearn', 'xgboost', 'joblib')
+
+
+def is_bundle(path):
+    """Returns whether `path` is a local model bundle folder"""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, list):
+        return all(_is_json_value(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_value(v) for k, v in value.items())
+    return False
+
+
+def write_bundle(members, path):
+    """
+    Saves a dict of model members as a bundle folder, replacing any existing bundle at `path`.
+
+    :param dict members: the members, e.g. `{'model': model, 'encoder': encoder, 'threshold': 0.5}`
+    :param str path: path of the bundle folder
+    :return: the manifest
+    """
+    import joblib
+    tmp_path = f'{path.rstrip(os.sep)}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    entries = {}
+    for name, value in members.items():
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            filename = f'{name}.npy'
+            np.save(os.path.join(tmp_path, filename), value, allow_pickle=False)
+            entries[name] = {'type': 'npy', 'file': filename}
+        elif _is_json_value(value):
+            entries[name] = {'type': 'value', 'value': value}
+            continue
+        else:
+            filename = f'{name}.joblib'
+            joblib.dump(value, os.path.join(tmp_path, filename))
+            entries[name] = {'type': 'joblib', 'file': filename}
+        file_path = os.path.join(tmp_path, entries[name]['file'])
+        entries[name].update(bytes=os.path.getsize(file_path), sha256=file_sha256(file_path))
+    manifest = {
+        'format': FORMAT,
+        'format_version': FORMAT_VERSION,
+        'created': int(time.time()),
+        'python': '.'.join(str(v) for v in sys.version_info[:3]),
+        'libraries': {lib: getattr(sys.modules[lib], '__version__', None)
+                      for lib in _LIBRARIES if lib in sys.modules},
+        'members': entries,
+    }
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path):
+    """
+    Reads and checks the manifest of a bundle folder.
+
+    :raises ValueError: if the manifest is not that of a supported bundle
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f'{path} is not a model bundle')
+    if manifest.get('format_version', 0) > FORMAT_VERSION:
+        raise ValueError(f'model bundle {path} has format version {manifest.get("format_version")}, '
+                         f'only versions up to {FORMAT_VERSION} are supported')
+    return manifest
+
+
+class ModelBundle:
+    """
+    Read-only, lazily loaded view of a bundle folder, with the `dict` interface of the pickled
+    model dicts (`saved.get('model')`, `saved['encoder']`, `'threshold' in saved`).
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+        :param str path: path of the bundle folder
+        :param Optional[str] mmap_mode: numpy memory-map mode of the arrays, or None to read them into memory
+        """
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.manifest = read_manifest(path)
+        self._members = self.manifest['members']
+        self._loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            entry = self._members[name]
+            if entry['type'] == 'value':
+                value = entry['value']
+            elif entry['type'] == 'npy':
+                value = np.load(os.path.join(self.path, entry['file']), mmap_mode=self.mmap_mode,
+                                allow_pickle=False)
+            elif entry['type'] == 'joblib':
+                import joblib
+                value = joblib.load(os.path.join(self.path, entry['file']), mmap_mode=self.mmap_mode)
+            else:
+                raise ValueError(f'unknown member type {entry["type"]} in model bundle {self.path}')
+            self._loaded[name] = value
+        return self._loaded[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self._members else default
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def keys(self):
+        return self._members.keys()
+
+    def verify(self):
+        """
+        Checks the files of the bundle against the sha256 digests in the manifest.
+
+        :raises ValueError: if a file does not match
+        """
+        for name, entry in self._members.items():
+            if 'file' in entry and file_sha256(os.path.join(self.path, entry['file'])) != entry['sha256']:
+                raise ValueError(f'member {name} of model bundle {self.path} does not match its sha256')
+
+
+def load_model(path, mmap_mode='r'):
+    """
+    Loads a saved model, from a bundle folder (lazily) or a pickled dict. If there is no model at
+    the path, the model saved in the other format under the same name is loaded instead (e.g.
+    `model.pkl` for `model.bundle`, for models trained before bundles were written).
+
+    :param str path: path of the bundle folder or pickle file
+    :param Optional[str] mmap_mode: numpy memory-map mode of the bundle arrays
+    :return: a `ModelBundle` or the unpickled dict
+    """
+    if not os.path.exists(path):
+        stem, extension = os.path.splitext(path)
+        alternative = {'.bundle': '.pkl', '.pkl': '.bundle'}.get(extension)
+        if alternative is None or not os.path.exists(stem + alternative):
+            raise FileNotFoundError(f'no saved model at {path}')
+        path = stem + alternative
+    if is_bundle(path):
+        return ModelBundle(path, mmap_mode=mmap_mode)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
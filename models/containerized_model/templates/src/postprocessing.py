@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Vectorized conversion of model outputs to the predictions expected by Certifai.
+
+Model outputs are converted for the whole batch with numpy operations, rather than
+row by row in Python:
+
+- class scores (n_samples, n_classes): the label of the highest score in each row
+  (the first or the last of equal highest scores, with `ties`),
+- binary scores with a threshold: the second label where the score of the second
+  class is above the threshold, the first label otherwise,
+- regression (a single output column): the output values,
+- class indices (e.g. from `model.predict`): the labels at the indices.
+
+For example, in a wrapper's `predict`:
+
+    to_labels = ScorePostprocessor(labels=['Iris-setosa', 'Iris-versicolor', 'Iris-virginica'])
+    return to_labels(self.model.predict_proba(npinstances))
+"""
+import numpy as np
+
+
+class ScorePostprocessor:
+    """
+    Converts batches of model outputs to predictions.
+    """
+
+    def __init__(self, labels=None, threshold=None, ties='first'):
+        """
+        :param Optional[list] labels: class labels, in the order of the score columns (or class indices);
+            if None, class indices are returned
+        :param Optional[float] threshold: threshold of the second class score, for binary classification
+        :param str ties: 'first' or 'last', the label returned by `argmax` for rows with several equal
+            highest scores, e.g. 'last' for `1 if scores[0] > scores[1] else 2`
+        """
+        if ties not in ('first', 'last'):
+            raise ValueError(f"ties must be 'first' or 'last', got {ties!r}")
+        self.labels = None if labels is None else np.asarray(labels)
+        self.threshold = threshold
+        self.ties = ties
+
+    def classes(self, indices):
+        """Returns the labels of an array of class indices"""
+        indices = np.asarray(indices)
+        return indices if self.labels is None else self.labels[indices]
+
+    def argmax(self, scores):
+        """Returns the label of the highest score in each row (the first or last of equal scores, with `ties`)"""
+        scores = np.asarray(scores)
+        if self.ties == 'last':
+            return self.classes(scores.shape[1] - 1 - scores[:, ::-1].argmax(axis=1))
+        return self.classes(scores.argmax(axis=1))
+
+    def thresholded(self, scores):
+        """Returns the second label where the second class score is above the threshold, the first otherwise"""
+        scores = np.asarray(scores)
+        positive = scores if scores.ndim == 1 else scores[:, 1]
+        return self.classes((positive > self.threshold).astype(np.intp))
+
+    @staticmethod
+    def regression(outputs):
+        """Returns the single output column of a regression model"""
+        outputs = np.asarray(outputs)
+        return outputs if outputs.ndim == 1 else outputs[:, 0]
+
+    def __call__(self, outputs):
+        """
+        Converts model outputs to predictions: thresholded binary scores if a threshold is set, the
+        output values of a single column (regression), or the label of the highest score otherwise.
+
+        :param outputs: (n_samples, n_outputs) array of model outputs, or (n_samples,) for a single output
+        :return: (n_samples,) array of predictions
+        """
+        outputs = np.asarray(outputs)
+        if outputs.ndim not in (1, 2) or (outputs.ndim == 2 and outputs.shape[1] == 0):
+            raise ValueError(f'expected model outputs of shape (n_samples, n_outputs), got {outputs.shape}')
+        if self.threshold is not None and (outputs.ndim == 1 or outputs.shape[1] == 2):
+            return self.thresholded(outputs)
+        if outputs.ndim == 1 or outputs.shape[1] == 1:
+            return self.regression(outputs)
+        return self.argmax(outputs)
@@ -0,0 +1,182 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Row-level prediction cache for prediction services.
+
+Scans (e.g. counterfactual explanations and robustness) query the model with
+many rows that are identical to rows already scored. The cache keys each row by
+a stable hash of its values, and only calls the model for rows that are not
+cached. Duplicate rows within a batch are scored once.
+
+Each server worker process has its own cache. Its counters, entries and memory
+use are exported on `/metrics` if metrics are enabled (see `metrics.py`). Enable it
+in `model/metadata.yml`:
+
+    prediction_cache:
+      enabled: true
+      max_entries: 100000  # least recently used rows are evicted beyond this
+      ttl_seconds: 3600    # optional, rows expire after this time
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# approximate per-entry overhead of the key, OrderedDict node and tuple
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def row_keys(npinstances):
+    """
+    Returns a stable 128 bit digest of each row of a 2-D array.
+    Rows of numeric arrays are hashed by their bytes, rows of object arrays
+    by the representation of their values, and rows of sparse matrices by the
+    bytes of their column indices and values.
+
+    :param npinstances: array or scipy sparse matrix of shape (n_samples, n_features)
+    :return: list of bytes
+    """
+    if hasattr(npinstances, 'tocsr'):
+        csr = npinstances.tocsr()
+        if not csr.has_canonical_format:
+            csr = csr.copy()
+            csr.sum_duplicates()
+        prefix = f'{csr.dtype.str}{csr.indices.dtype.str}{csr.shape[1]}'.encode()
+        bounds = zip(csr.indptr[:-1], csr.indptr[1:])
+        rows = (prefix + csr.indices[start:end].tobytes() + csr.data[start:end].tobytes() for start, end in bounds)
+    elif npinstances.dtype == object:
+        rows = (repr(row).encode() for row in npinstances.tolist())
+    else:
+        contiguous = np.ascontiguousarray(npinstances)
+        prefix = contiguous.dtype.str.encode()
+        rows = (prefix + row.tobytes() for row in contiguous)
+    return [hashlib.blake2b(row, digest_size=16).digest() for row in rows]
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache, with optional expiry, of the per-row results of `fn`.
+    """
+
+    def __init__(self, fn, max_entries=100000, ttl_seconds=None):
+        """
+        :param fn: function of a 2-D instances array returning an array with one entry (or row) per instance
+        :param int max_entries: maximum number of cached rows
+        :param Optional[float] ttl_seconds: time after which a cached row expires, or None
+        """
+        self.fn = fn
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(['hits', 'misses', 'deduplicated', 'evictions', 'expirations'], 0)
+        self._memory_bytes = 0
+
+    def __call__(self, npinstances):
+        keys = row_keys(npinstances)
+        unique, first_rows = {}, []
+        for row, key in enumerate(keys):
+            if key not in unique:
+                unique[key] = len(unique)
+                first_rows.append(row)
+        inverse = np.fromiter((unique[key] for key in keys), dtype=np.intp, count=len(keys))
+
+        now = time.monotonic()
+        unique_results = [None] * len(unique)
+        with self._lock:
+            for key, index in unique.items():
+                unique_results[index] = self._get(key, now)
+            missing = [index for index, value in enumerate(unique_results) if value is None]
+            self._counters['deduplicated'] += len(keys) - len(unique)
+            self._counters['hits'] += len(unique) - len(missing)
+            self._counters['misses'] += len(missing)
+
+        if len(missing) > 0:
+            results = np.asarray(self.fn(npinstances[[first_rows[index] for index in missing]]))
+            if len(missing) == len(keys):
+                # nothing cached or duplicated - store the results and return them as they are
+                with self._lock:
+                    for key, result in zip(keys, results):
+                        self._put(key, result, now)
+                return results
+            with self._lock:
+                for index, result in zip(missing, results):
+                    self._put(keys[first_rows[index]], result, now)
+                    unique_results[index] = result
+        return np.asarray(unique_results)[inverse]
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+            self._remove(key)
+            self._counters['expirations'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, now):
+        if isinstance(value, np.ndarray):
+            # a row of the batch results would keep the whole batch array alive
+            value = value.copy()
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, now)
+        self._memory_bytes += self._entry_bytes(value)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._memory_bytes -= self._entry_bytes(value)
+
+    @staticmethod
+    def _entry_bytes(value):
+        return _ENTRY_OVERHEAD_BYTES + getattr(value, 'nbytes', 8)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self):
+        """
+        :return: dict of the cache counters (hits, misses, deduplicated rows,
+            evictions and expirations), the hit rate, the number of entries and
+            their approximate memory use in bytes
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.
+            stats['entries'] = len(self._entries)
+            stats['memory_bytes'] = self._memory_bytes
+        return stats
+
+
+def install_prediction_cache(wrapper, config, methods=('predict', 'soft_predict')):
+    """
+    Caches the per-row results of the wrapper's `predict` and `soft_predict`,
+    if enabled in the `prediction_cache` section of the metadata. The caches are
+    available as `wrapper.prediction_caches`, keyed by method name.
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param dict config: the `prediction_cache` section of the metadata, or None
+    :param tuple methods: the wrapper methods to cache
+    """
+    config = config or {}
+    wrapper.prediction_caches = {}
+    if not config.get('enabled', False):
+        return
+    for method in methods:
+        cache = PredictionCache(getattr(wrapper, method),
+                                max_entries=config.get('max_entries', 100000),
+                                ttl_seconds=config.get('ttl_seconds'))
+        wrapper.prediction_caches[method] = cache
+        setattr(wrapper, method, cache)
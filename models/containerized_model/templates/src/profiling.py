@@ -0,0 +1,302 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+On-demand sampling profiler for slow prediction requests.
+
+While profiling is on, a background thread in each server worker process samples
+the Python stacks of the threads serving prediction requests (`sys._current_frames`)
+every `interval_ms`. When a request takes longer than `threshold_ms`, its samples
+are written to the profile directory in the collapsed stack format (one line per
+distinct stack, `frame;frame;... count`, for flamegraph.pl, speedscope or
+inferno), with a json file of the request duration, and the shapes and dtypes of
+the batches it scored. Only the `max_profiles` most recent profiles are kept.
+
+Profiling is turned on and off, and its threshold changed, for all the worker
+processes at once, with the environment variables below (at start up), or with the
+admin endpoint. The admin endpoint is not authenticated, so it is only served when
+enabled (`PREDICTION_PROFILING_ADMIN_ENDPOINT=true`), on services whose port is not
+exposed to untrusted clients:
+
+    curl -X POST localhost:8551/admin/profiling -H 'Content-Type: application/json' \
+      -d '{"enabled": true, "threshold_ms": 200}'
+    curl localhost:8551/admin/profiling  # state, and the retained profiles
+
+While profiling is off, the cost is a check of a shared flag per request.
+
+    PREDICTION_PROFILING=true                 # turn profiling on at start up
+    PREDICTION_PROFILING_THRESHOLD_MS=500     # profile requests slower than this
+    PREDICTION_PROFILING_INTERVAL_MS=5        # sampling interval
+    PREDICTION_PROFILING_DIR=/tmp/prediction_profiles
+    PREDICTION_PROFILING_MAX_PROFILES=20
+    PREDICTION_PROFILING_ADMIN_ENDPOINT=true  # serve the admin endpoint
+
+The same settings can be given in a `profiling` section of `model/metadata.yml`
+(`enabled`, `threshold_ms`, `interval_ms`, `dir`, `max_profiles`, and
+`admin_endpoint` to serve the admin endpoint); the environment variables take
+precedence.
+"""
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+ADMIN_URL = '/admin/profiling'
+COLLAPSED_SUFFIX = '.collapsed'
+# maximum samples kept for a single request, to bound the profiler memory
+MAX_SAMPLES_PER_REQUEST = 20000
+
+_ENV_SETTINGS = {
+    'enabled': ('PREDICTION_PROFILING', lambda value: value.lower() == 'true'),
+    'threshold_ms': ('PREDICTION_PROFILING_THRESHOLD_MS', float),
+    'interval_ms': ('PREDICTION_PROFILING_INTERVAL_MS', float),
+    'dir': ('PREDICTION_PROFILING_DIR', str),
+    'max_profiles': ('PREDICTION_PROFILING_MAX_PROFILES', int),
+    'admin_endpoint': ('PREDICTION_PROFILING_ADMIN_ENDPOINT', lambda value: value.lower() == 'true'),
+}
+
+_local = threading.local()
+
+
+def profiling_settings(config=None):
+    """Returns the profiling settings of the `profiling` section of the metadata, overridden by the environment"""
+    settings = {'enabled': False, 'threshold_ms': 500., 'interval_ms': 5., 'dir': '/tmp/prediction_profiles',
+                'max_profiles': 20, 'admin_endpoint': False}
+    settings.update(config or {})
+    for key, (name, parse) in _ENV_SETTINGS.items():
+        if os.getenv(name):
+            settings[key] = parse(os.getenv(name))
+    return settings
+
+
+def collapse_stack(frame):
+    """Returns the stack of a frame in the collapsed format, outermost frame first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _Request:
+    __slots__ = ('start', 'samples', 'sample_count', 'batches')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.samples = {}
+        self.sample_count = 0
+        self.batches = []
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads serving requests, and writes the samples of slow requests.
+    The on/off flag and threshold are shared with the worker processes forked after it is created.
+    """
+
+    def __init__(self, directory, threshold_ms=500., interval_ms=5., max_profiles=20, enabled=False):
+        """
+        :param str directory: directory of the profiles
+        :param float threshold_ms: requests slower than this are written
+        :param float interval_ms: sampling interval
+        :param int max_profiles: number of most recent profiles kept
+        :param bool enabled: whether profiling is on
+        """
+        self.directory = directory
+        self.interval = float(interval_ms) / 1000.
+        self.max_profiles = int(max_profiles)
+        # raw (lock-free) shared values: single value reads and writes
+        self._enabled = multiprocessing.RawValue('b', bool(enabled))
+        self._threshold_ms = multiprocessing.RawValue('d', float(threshold_ms))
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._sampler_pid = None
+        self._written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._enabled.value)
+
+    @property
+    def threshold_ms(self) -> float:
+        return self._threshold_ms.value
+
+    def configure(self, enabled=None, threshold_ms=None):
+        if threshold_ms is not None:
+            self._threshold_ms.value = float(threshold_ms)
+        if enabled is not None:
+            self._enabled.value = bool(enabled)
+
+    def _ensure_sampler(self):
+        pid = os.getpid()
+        with self._lock:
+            # the sampler thread stops when profiling is turned off, and does not survive a fork
+            if self._sampler_pid != pid or not self._sampler.is_alive():
+                self._sampler_pid = pid
+                self._sampler = threading.Thread(target=self._sample, name='prediction-profiler', daemon=True)
+                self._sampler.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while self.enabled:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.items())
+            for thread_id, request in active:
+                frame = frames.get(thread_id)
+                if thread_id == own or frame is None or request.sample_count >= MAX_SAMPLES_PER_REQUEST:
+                    continue
+                stack = collapse_stack(frame)
+                request.samples[stack] = request.samples.get(stack, 0) + 1
+                request.sample_count += 1
+
+    def begin(self):
+        """Starts sampling the calling thread's request, if profiling is on; returns the request or None"""
+        if not self._enabled.value:
+            return None
+        self._ensure_sampler()
+        request = _Request()
+        with self._lock:
+            self._active[threading.get_ident()] = request
+        _local.request = request
+        return request
+
+    def end(self, request, status):
+        """Stops sampling the request, and writes its profile if it was slower than the threshold"""
+        duration_ms = (time.perf_counter() - request.start) * 1000.
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        _local.request = None
+        if duration_ms >= self.threshold_ms and request.samples:
+            self.write(request, duration_ms, status)
+
+    def write(self, request, duration_ms, status):
+        os.makedirs(self.directory, exist_ok=True)
+        self._written += 1
+        name = f'profile-{time.strftime("%Y%m%dT%H%M%S")}-{os.getpid()}-{self._written}-{int(duration_ms)}ms'
+        path = os.path.join(self.directory, name)
+        with open(path + COLLAPSED_SUFFIX, 'w') as f:
+            for stack, count in sorted(request.samples.items(), key=lambda item: -item[1]):
+                f.write(f'{stack} {count}\n')
+        with open(path + '.json', 'w') as f:
+            json.dump({'duration_ms': duration_ms, 'status': status, 'pid': os.getpid(),
+                       'samples': request.sample_count, 'interval_ms': self.interval * 1000.,
+                       'threshold_ms': self.threshold_ms, 'batches': request.batches}, f, indent=2)
+        self._prune()
+
+    def profiles(self):
+        """Returns the profile names in the directory, most recent first"""
+        try:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith(COLLAPSED_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        paths = sorted(paths, key=_mtime, reverse=True)
+        return [os.path.basename(path)[:-len(COLLAPSED_SUFFIX)] for path in paths]
+
+    def _prune(self):
+        for name in self.profiles()[self.max_profiles:]:
+            for suffix in (COLLAPSED_SUFFIX, '.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except FileNotFoundError:
+                    # removed by another worker process
+                    pass
+
+    def state(self) -> dict:
+        return {'enabled': self.enabled, 'threshold_ms': self.threshold_ms, 'interval_ms': self.interval * 1000.,
+                'dir': self.directory, 'max_profiles': self.max_profiles, 'profiles': self.profiles()}
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.
+
+
+def record_batch(npinstances):
+    """Records the shape and dtypes of a batch scored for the calling thread's request, if it is profiled"""
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        dtypes = sorted({type(value).__name__ for value in npinstances[0]}) \
+            if npinstances.dtype == object and len(npinstances) else []
+        request.batches.append({'shape': list(npinstances.shape), 'dtype': str(npinstances.dtype),
+                                'value_types': dtypes})
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that profiles the requests to the predict endpoint while profiling is on.
+    """
+
+    def __init__(self, wsgi_app, endpoint_url, profiler):
+        self.wsgi_app = wsgi_app
+        self.endpoint_url = endpoint_url
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') != self.endpoint_url:
+            return self.wsgi_app(environ, start_response)
+        request = self.profiler.begin()
+        if request is None:
+            return self.wsgi_app(environ, start_response)
+        status = []
+
+        def recording_start_response(response_status, headers, *args):
+            status.append(response_status)
+            return start_response(response_status, headers, *args)
+        try:
+            result = self.wsgi_app(environ, recording_start_response)
+            try:
+                body = [b''.join(result)]
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            self.profiler.end(request, status[0] if status else '500')
+        return body
+
+
+def install_profiler(wrapper, config=None, endpoint_url='/predict', methods=('predict', 'soft_predict')):
+    """
+    Adds the sampling profiler of slow requests, and its admin endpoint if enabled, to the wrapper's
+    application. Profiling is off unless turned on by the settings or the admin endpoint. The profiler is
+    available as `wrapper.profiler`.
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param dict config: the `profiling` section of the metadata, or None
+    :param str endpoint_url: the predict endpoint of the wrapper
+    :param tuple methods: the wrapper methods to record the batch shapes of
+    """
+    settings = profiling_settings(config)
+    profiler = wrapper.profiler = SamplingProfiler(settings['dir'], threshold_ms=settings['threshold_ms'],
+                                                   interval_ms=settings['interval_ms'],
+                                                   max_profiles=settings['max_profiles'],
+                                                   enabled=settings['enabled'])
+    for method in methods:
+        fn = getattr(wrapper, method)
+
+        def recorded(npinstances, fn=fn, **kwargs):
+            record_batch(npinstances)
+            return fn(npinstances, **kwargs)
+        setattr(wrapper, method, recorded)
+
+    if settings['admin_endpoint']:
+        from flask import request
+
+        def admin():
+            if request.method == 'POST':
+                body = request.get_json(force=True, silent=True) or {}
+                profiler.configure(enabled=body.get('enabled'), threshold_ms=body.get('threshold_ms'))
+            return json.dumps(profiler.state()), 200, {'Content-Type': 'application/json'}
+        wrapper.app.add_url_rule(ADMIN_URL, 'profiling', admin, methods=['GET', 'POST'])
+    app = wrapper.app
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, endpoint_url, profiler)
+    if profiler.enabled:
+        print(f'profiling requests slower than {profiler.threshold_ms:.0f}ms to {profiler.directory}')
@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Gunicorn worker settings of the prediction services.
+
+`app.run(production=True)` serves with the Certifai SDK's gunicorn server, whose
+(sync) worker processes serve one request at a time. A `server` section in
+`model/metadata.yml` selects another gunicorn worker class, e.g. threaded workers
+(`gthread`) that serve several requests at a time per process. Micro-batching only
+coalesces requests served at the same time by a process, so when it is enabled the
+workers are threaded by default:
+
+    server:
+      worker_class: gthread   # gunicorn worker class, defaults to the SDK server (sync workers)
+      threads: 16             # threads per worker process, for gthread workers
+      timeout: 60             # seconds before a silent worker is restarted
+
+The model is loaded before the workers are forked, as with the SDK server.
+"""
+import logging
+
+DEFAULT_THREADS = 16
+DEFAULT_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+
+
+def server_settings(config=None, batching=None):
+    """
+    Returns the gunicorn worker class, threads per worker and timeout of the `server` section of
+    the metadata. The worker class is None for the SDK server, unless batching is enabled.
+
+    :param dict config: the `server` section of the metadata, or None
+    :param dict batching: the `batching` section of the metadata, or None
+    """
+    settings = {'worker_class': None, 'threads': None, 'timeout': DEFAULT_TIMEOUT}
+    settings.update(config or {})
+    if settings['worker_class'] is None and (batching or {}).get('enabled', False):
+        settings['worker_class'] = 'gthread'
+    if settings['worker_class'] == 'gthread' and not settings['threads']:
+        settings['threads'] = DEFAULT_THREADS
+    return settings
+
+
+def run_server(wrapper, num_workers, config=None, batching=None, log_level='warning'):
+    """
+    Serves the wrapper's application with `num_workers` worker processes: with the Certifai SDK
+    production server, or with the gunicorn worker class of the settings.
+
+    :param wrapper: the `SimpleModelWrapper` instance
+    :param int num_workers: number of worker processes
+    :param dict config: the `server` section of the metadata, or None
+    :param dict batching: the `batching` section of the metadata, or None
+    :param str log_level: gunicorn log level
+    """
+    settings = server_settings(config, batching)
+    if settings['worker_class'] is None:
+        # Production mode requires Certifai 1.3.6 or higher
+        wrapper.run(production=True, log_level=log_level, num_workers=num_workers)
+        return
+
+    from gunicorn.app.base import BaseApplication
+
+    class _Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{wrapper.host}:{wrapper.port}')
+            self.cfg.set('workers', num_workers)
+            self.cfg.set('worker_class', settings['worker_class'])
+            if settings['threads']:
+                self.cfg.set('threads', int(settings['threads']))
+            self.cfg.set('timeout', int(settings['timeout']))
+            self.cfg.set('loglevel', log_level)
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            return wrapper.app
+
+    logger.info('serving with %d %s workers%s', num_workers, settings['worker_class'],
+                f' x {settings["threads"]} threads' if settings['threads'] else '')
+    _Server().run()
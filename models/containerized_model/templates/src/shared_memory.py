@@ -0,0 +1,99 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Sharing of the model memory between prediction service worker processes.
+
+The model is loaded once, before the server forks its worker processes, so the
+workers start with the parent's memory pages, shared copy-on-write. Those pages
+are soon copied into each worker though: reference counting and the garbage
+collector write to the objects of the model, and a page is copied when any of
+its objects is written to.
+
+Two things keep the model pages shared:
+
+- the numpy arrays of the model (e.g. weights and tree arrays) are memory-mapped
+  read-only from a joblib sidecar file, written next to the model on first load.
+  Their data then lives in the page cache, shared by all the workers, and is never
+  written to. Only the small array objects are in each worker's heap.
+- the objects allocated before the fork are moved to the garbage collector's
+  permanent generation (`gc.freeze`), so that collections in the workers do not
+  write to them.
+
+Enable it in `model/metadata.yml` (requires `joblib`, installed with scikit-learn):
+
+    shared_memory:
+      enabled: true
+      sidecar_dir: /tmp/model  # optional, defaults to the folder of the model
+"""
+import gc
+import os
+import pickle
+
+from model_bundle import is_bundle, load_model
+
+
+def sidecar_path(local_model_path, sidecar_dir=None):
+    """
+    Returns the path of the joblib sidecar of a model file. The path identifies the
+    model file by its size and modification time, so a changed model gets a new sidecar.
+
+    :param str local_model_path: path of the pickled model file
+    :param Optional[str] sidecar_dir: folder of the sidecar, defaults to the folder of the model
+    """
+    stat = os.stat(local_model_path)
+    name = f'{os.path.basename(local_model_path)}.{stat.st_size}-{stat.st_mtime_ns}.joblib'
+    return os.path.join(sidecar_dir or os.path.dirname(os.path.abspath(local_model_path)), name)
+
+
+def _dump_sidecar(joblib, obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_model_pickle(local_model_path, config=None):
+    """
+    Loads a pickled model file. If `shared_memory` is enabled, its numpy arrays are
+    memory-mapped read-only from a joblib sidecar file (written on first load).
+    Model bundles (see model_bundle.py) are loaded lazily, with their arrays memory-mapped.
+
+    :param str local_model_path: path of the pickled model file or model bundle folder
+    :param dict config: the `shared_memory` section of the metadata, or None
+    :return: the unpickled object
+    """
+    if is_bundle(local_model_path):
+        return load_model(local_model_path)
+    config = config or {}
+    if not config.get('enabled', False):
+        with open(local_model_path, 'rb') as f:
+            return pickle.load(f)
+
+    import joblib
+    path = sidecar_path(local_model_path, config.get('sidecar_dir'))
+    if not os.path.exists(path):
+        with open(local_model_path, 'rb') as f:
+            model_pickle = pickle.load(f)
+        try:
+            _dump_sidecar(joblib, model_pickle, path)
+        except PermissionError:
+            path = os.path.join('/tmp', os.path.basename(path))
+            if not os.path.exists(path):
+                _dump_sidecar(joblib, model_pickle, path)
+        del model_pickle
+    return joblib.load(path, mmap_mode='r')
+
+
+def freeze_before_fork(config=None):
+    """
+    Moves all objects allocated so far to the garbage collector's permanent generation, so that
+    collections in forked worker processes do not write to (and copy) their pages. Call it after
+    loading the model, just before the server forks its workers.
+
+    :param dict config: the `shared_memory` section of the metadata, or None
+    """
+    config = config or {}
+    if config.get('enabled', False) and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
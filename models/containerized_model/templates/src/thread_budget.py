@@ -0,0 +1,220 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+CPU budget for prediction service worker processes and their native thread pools.
+
+By default every server worker process runs its native thread pools (OpenMP, e.g.
+xgboost, and BLAS, e.g. scikit-learn MLP and SVM models) with one thread per core,
+so that several workers oversubscribe the cores. With a thread budget, the CPUs
+available to the container (or a configured number) are split between the worker
+processes and their native thread pools:
+
+- the number of workers defaults to the number of CPUs divided by the threads per
+  worker, capped by the number of copies of the model that fit in memory,
+- the native thread pools of each worker are limited to its share of the CPUs
+  (with threadpoolctl, and xgboost's `nthread` or `n_jobs`), and the worker is optionally
+  pinned to its own CPUs.
+
+Enable it in `model/metadata.yml`:
+
+    thread_budget:
+      enabled: true
+      cpus: 16                 # CPU budget, defaults to the CPUs available to the container
+      num_workers: auto        # or a number of worker processes
+      threads_per_worker: 1    # native threads per worker, defaults to the CPUs left per worker
+      memory_fraction: 0.8     # fraction of the memory limit the workers may use
+      cpu_affinity: false      # pin each worker to its own CPUs (Linux only)
+"""
+import multiprocessing
+import os
+import threading
+
+DEFAULT_NUM_WORKERS = 3
+# approximate memory of a worker process besides the model (interpreter, libraries, buffers)
+WORKER_OVERHEAD_BYTES = 150 * 1024 * 1024
+# native thread pool sizes read by the libraries when they initialize
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                   'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def available_cpus():
+    """Returns the number of CPUs available to the process, from its affinity and cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()[:2]
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def memory_limit():
+    """Returns the memory available to the container in bytes, from its cgroup limit or the available memory"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            # unlimited cgroups report 'max' or a very large number
+            if value != 'max' and int(value) < 1 << 60:
+                return int(value)
+        except (OSError, ValueError):
+            pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def resident_memory():
+    """Returns the resident memory of the process in bytes (0 if not known)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+class ThreadBudget:
+    """
+    Split of a CPU budget between worker processes and their native thread pools.
+    """
+
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, threads_per_worker=None, cpus=None, cpu_affinity=False):
+        """
+        :param int num_workers: number of server worker processes
+        :param Optional[int] threads_per_worker: native threads per worker, or None to not limit them
+        :param Optional[int] cpus: the CPU budget
+        :param bool cpu_affinity: whether to pin each worker to its own CPUs
+        """
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.cpus = cpus
+        self.cpu_affinity = cpu_affinity
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_cpus = None
+        # shared by the forked workers, to give each its own slice of the CPUs
+        self._next_slot = multiprocessing.Value('i', 0) if cpu_affinity else None
+        # the process that forks the workers (e.g. for the warm-up pass) is not pinned
+        self._parent_pid = os.getpid()
+
+    @classmethod
+    def from_config(cls, config, model_bytes=0):
+        """
+        Sizes the worker processes and thread pools from the `thread_budget` section of the metadata.
+
+        :param dict config: the `thread_budget` section of the metadata, or None
+        :param int model_bytes: memory used by a copy of the model in a worker, for sizing the number of workers
+        """
+        config = config or {}
+        if not config.get('enabled', False):
+            return cls()
+        cpus = int(config.get('cpus') or available_cpus())
+        threads = config.get('threads_per_worker', 'auto')
+        workers = config.get('num_workers', 'auto')
+        if workers == 'auto':
+            workers = cpus if threads == 'auto' else max(1, cpus // int(threads))
+            limit = memory_limit()
+            if limit is not None:
+                per_worker = model_bytes + WORKER_OVERHEAD_BYTES
+                workers = min(workers, max(1, int(limit * float(config.get('memory_fraction', 0.8)) // per_worker)))
+        workers = max(1, int(workers))
+        threads = max(1, cpus // workers) if threads == 'auto' else max(1, int(threads))
+        return cls(num_workers=workers, threads_per_worker=threads, cpus=cpus,
+                   cpu_affinity=bool(config.get('cpu_affinity', False)))
+
+    def set_environment(self):
+        """Sets the native thread pool sizes of libraries that are initialized later (e.g. in the workers)"""
+        if self.threads_per_worker is not None:
+            for name in THREAD_ENV_VARS:
+                os.environ[name] = str(self.threads_per_worker)
+
+    def _claim_cpus(self):
+        cpus = sorted(os.sched_getaffinity(0))
+        slots = max(1, len(cpus) // self.threads_per_worker)
+        with self._next_slot.get_lock():
+            slot = self._next_slot.value % slots
+            self._next_slot.value += 1
+        return set(cpus[slot * self.threads_per_worker:(slot + 1) * self.threads_per_worker])
+
+    def apply(self, model=None):
+        """
+        Limits the native thread pools of the calling thread (once per thread and process), and pins it
+        to the worker's CPUs if enabled (in the worker processes only). Threads started by the calling
+        thread inherit its CPUs.
+
+        :param model: the model, to limit the threads of xgboost models
+        """
+        if self.threads_per_worker is None:
+            return
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._pid = pid
+                self._worker_cpus = self._claim_cpus() if self.cpu_affinity and pid != self._parent_pid else None
+                if model is not None and hasattr(model, 'set_param'):
+                    model.set_param({'nthread': self.threads_per_worker})
+                elif model is not None and hasattr(model, 'get_booster'):
+                    # xgboost scikit-learn models (XGBClassifier, XGBRegressor)
+                    model.set_params(n_jobs=self.threads_per_worker)
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=self.threads_per_worker)
+        except ImportError:
+            pass
+        if self._worker_cpus:
+            os.sched_setaffinity(0, self._worker_cpus)
+        self._local.pid = pid
+
+    def describe(self) -> str:
+        if self.threads_per_worker is None:
+            return f'{self.num_workers} workers, native threads not limited'
+        return (f'{self.num_workers} workers x {self.threads_per_worker} native threads '
+                f'(budget {self.cpus} CPUs{", pinned" if self.cpu_affinity else ""})')
+
+
+def install_thread_budget(wrapper, budget, methods=('predict', 'soft_predict')):
+    """
+    Applies the thread budget in the wrapper's worker processes, before their `predict` and
+    `soft_predict` calls. The budget is available as `wrapper.thread_budget`.
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param ThreadBudget budget: the thread budget
+    :param tuple methods: the wrapper methods to apply the budget for
+    """
+    wrapper.thread_budget = budget
+    if budget.threads_per_worker is None:
+        return
+    budget.set_environment()
+    print(f'thread budget: {budget.describe()}')
+    for method in methods:
+        fn = getattr(wrapper, method)
+
+        def limited(npinstances, fn=fn, **kwargs):
+            budget.apply(wrapper.model)
+            return fn(npinstances, **kwargs)
+        setattr(wrapper, method, limited)
@@ -0,0 +1,212 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Start up warm-up pass and readiness endpoint for prediction services.
+
+The first requests to a fresh prediction service are much slower than later ones
+(lazy imports and library initialization, allocator growth, first call caches).
+The warm-up pass scores sample rows through the `/predict` endpoint, at several
+batch sizes, before the server starts; the server worker processes are forked
+from the warmed up process. As the server only listens once the warm-up pass is
+over, a Kubernetes readiness probe on `GET /ready` fails until then. `/ready`
+returns 200 if the warm-up pass succeeded (and always if it is not enabled), and
+503 if it failed, so that a service that can not score its sample rows does not
+receive traffic.
+
+The warm-up pass also measures how quickly latency settles: for each batch size,
+the number of calls and time until a call is within `tolerance` of the steady
+state (median) latency of the later calls. These are logged, and returned by
+`/ready`. Enable it in `model/metadata.yml`:
+
+    warmup:
+      enabled: true
+      rows: [[...], [...]]      # sample rows, with values in the order of `columns`
+      path: model/warmup.csv    # or a csv file (local path or url) of sample rows, with a header
+      batch_sizes: [1, 10, 100]
+      rounds: 20                # calls per batch size
+      max_seconds: 60           # time limit of the warm-up pass
+      tolerance: 1.5            # calls within 1.5x of the steady state latency are good
+"""
+import csv
+import io
+import json
+import threading
+import time
+
+import numpy as np
+
+READY_URL = '/ready'
+
+
+def _parse_value(value):
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_rows_csv(text, columns=None):
+    """
+    Parses csv sample rows, converting numeric values to numbers.
+
+    :param str text: csv contents, with a header row
+    :param Optional[list] columns: the model input columns; if given (and all in the header), the
+        rows are reduced to these columns, in this order
+    :return: list of rows
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader)
+    indices = list(range(len(header)))
+    if columns and all(column in header for column in columns):
+        indices = [header.index(column) for column in columns]
+    return [[_parse_value(row[index]) for index in indices] for row in reader if row]
+
+
+def load_warmup_rows(config, columns=None):
+    """
+    Returns the warm-up sample rows from the inline `rows` or the csv file at `path`.
+
+    :param dict config: the `warmup` section of the metadata
+    :param Optional[list] columns: the model input columns
+    :return: list of rows
+    """
+    if config.get('rows'):
+        return list(config['rows'])
+    if config.get('path'):
+        from certifai.common.file.interface import FilePath
+        from certifai.common.file.locaters import make_generic_locater
+        with make_generic_locater(FilePath(config['path'])).text_reader() as f:
+            return read_rows_csv(f.read(), columns)
+    raise ValueError('warmup requires sample rows: set "rows" or "path" in metadata.yml')
+
+
+def settling(latencies, tolerance):
+    """
+    Measures how quickly the latency of successive calls settles.
+
+    :param list latencies: latencies of successive calls, in seconds
+    :param float tolerance: factor of the steady state latency within which a call is good
+    :return: dict of the first and steady state (median of the later half of the calls) latency
+        in milliseconds, and the number of calls and milliseconds until the first good call
+    """
+    steady = float(np.median(latencies[len(latencies) // 2:]))
+    first_good = next(index for index, latency in enumerate(latencies) if latency <= tolerance * steady)
+    return {'first_ms': latencies[0] * 1000., 'steady_ms': steady * 1000.,
+            'calls_to_good_latency': first_good + 1,
+            'time_to_good_latency_ms': sum(latencies[:first_good + 1]) * 1000.}
+
+
+class Warmup:
+    """
+    Scores sample rows through a prediction service application, and tracks readiness.
+    """
+
+    def __init__(self, app, rows, endpoint_url='/predict', batch_sizes=(1, 10, 100), rounds=20,
+                 max_seconds=60., tolerance=1.5):
+        """
+        :param app: the prediction service Flask application
+        :param list rows: sample rows; batches are drawn from them, repeating rows if needed
+        :param str endpoint_url: the predict endpoint
+        :param batch_sizes: batch sizes to score
+        :param int rounds: number of calls per batch size
+        :param float max_seconds: time limit of the warm-up pass, after which remaining calls are skipped
+        :param float tolerance: factor of the steady state latency within which a call is good
+        """
+        self.app = app
+        self.rows = list(rows)
+        self.endpoint_url = endpoint_url
+        self.batch_sizes = [int(batch_size) for batch_size in batch_sizes]
+        self.rounds = max(2, int(rounds))
+        self.max_seconds = float(max_seconds)
+        self.tolerance = float(tolerance)
+        self.status = 'pending'
+        self.error = None
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == 'ready'
+
+    def _batch(self, batch_size):
+        return [self.rows[index % len(self.rows)] for index in range(batch_size)]
+
+    def run(self) -> dict:
+        """
+        Runs the warm-up pass. Errors are recorded rather than raised, leaving the service not ready.
+
+        :return: dict of the warm-up time, and the latency settling measures per batch size
+        """
+        with self._lock:
+            self.status = 'running'
+            start = time.monotonic()
+            try:
+                if len(self.rows) == 0:
+                    raise ValueError('no warmup sample rows')
+                client = self.app.test_client()
+                per_batch_size = {}
+                for batch_size in self.batch_sizes:
+                    body = json.dumps({'payload': {'instances': self._batch(batch_size)}})
+                    latencies = []
+                    while len(latencies) < self.rounds and time.monotonic() - start < self.max_seconds:
+                        call_start = time.monotonic()
+                        response = client.post(self.endpoint_url, data=body, content_type='application/json')
+                        latencies.append(time.monotonic() - call_start)
+                        if response.status_code != 200:
+                            raise RuntimeError(f'warmup request of {batch_size} rows failed with status '
+                                               f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+                    if latencies:
+                        per_batch_size[batch_size] = settling(latencies, self.tolerance)
+                self.stats = {'warmup_ms': (time.monotonic() - start) * 1000., 'batch_sizes': per_batch_size}
+                self.status = 'ready'
+            except Exception as e:
+                self.error = f'{type(e).__name__}: {e}'
+                self.status = 'failed'
+            return self.stats
+
+    def report(self) -> dict:
+        return {'status': self.status, 'error': self.error, **self.stats}
+
+
+def install_warmup(wrapper, config, columns=None, endpoint_url='/predict'):
+    """
+    Adds the `/ready` endpoint to the wrapper's application, and runs the warm-up pass if enabled in
+    the `warmup` section of the metadata. Call it before installing features that should not see the
+    warm-up requests (micro-batching and the prediction cache). The warm-up state is available as
+    `wrapper.warmup` (None if not enabled).
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param dict config: the `warmup` section of the metadata, or None
+    :param Optional[list] columns: the model input columns, to select the columns of a csv sample
+    :param str endpoint_url: the predict endpoint of the wrapper
+    """
+    config = config or {}
+    wrapper.warmup = None
+    if config.get('enabled', False):
+        rows = load_warmup_rows(config, columns)
+        wrapper.warmup = Warmup(wrapper.app, rows, endpoint_url=endpoint_url,
+                                batch_sizes=config.get('batch_sizes', (1, 10, 100)),
+                                rounds=config.get('rounds', 20),
+                                max_seconds=config.get('max_seconds', 60.),
+                                tolerance=config.get('tolerance', 1.5))
+
+    def ready():
+        if wrapper.warmup is None:
+            return json.dumps({'status': 'ready'}), 200, {'Content-Type': 'application/json'}
+        status = 200 if wrapper.warmup.ready else 503
+        return json.dumps(wrapper.warmup.report()), status, {'Content-Type': 'application/json'}
+    wrapper.app.add_url_rule(READY_URL, 'ready', ready, methods=['GET'])
+
+    if wrapper.warmup is not None:
+        wrapper.warmup.run()
+        if wrapper.warmup.ready:
+            summary = ', '.join(f'{batch_size} rows: {s["first_ms"]:.1f}ms first, {s["steady_ms"]:.1f}ms steady, '
+                                f'good after {s["calls_to_good_latency"]} calls '
+                                f'({s["time_to_good_latency_ms"]:.0f}ms)'
+                                for batch_size, s in wrapper.warmup.stats['batch_sizes'].items())
+            print(f'warmup completed in {wrapper.warmup.stats["warmup_ms"]:.0f}ms - {summary}')
+        else:
+            print(f'warmup failed, the service will not report ready: {wrapper.warmup.error}')
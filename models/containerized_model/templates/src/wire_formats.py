@@ -0,0 +1,324 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Binary columnar encodings for the prediction service `/predict` endpoint.
+
+JSON (`{"payload": {"instances": [[...]]}}`) remains the default. A client may
+instead POST instances with one of the following content types, and ask for the
+response in the same (or another) binary encoding with the `Accept` header:
+
+- `application/x-npy`: a stream of `.npy` arrays. The request is either a single
+  2-D array (homogeneous, e.g. numeric instances), or one 1-D array per column
+  (mixed types, e.g. numeric and string columns). The `.npy` header of each array
+  is its typed schema. Object arrays are rejected, as they require pickle.
+  The response is the predictions array, followed by the scores array for
+  soft-scoring models.
+- `application/vnd.apache.arrow.stream`: an Arrow IPC stream with one column per
+  feature (requires `pyarrow`). The response has a `predictions` column, and a
+  `score_<i>` column per class for soft-scoring models.
+
+Numeric requests are decoded without copying: the arrays returned wrap the
+request body buffer.
+"""
+import io
+import json
+
+import numpy as np
+
+from metrics import stage
+from postprocessing import ScorePostprocessor
+
+JSON_CONTENT_TYPE = 'application/json'
+NPY_CONTENT_TYPE = 'application/x-npy'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+BINARY_CONTENT_TYPES = (NPY_CONTENT_TYPE, ARROW_CONTENT_TYPE)
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+def _media_type(header_value):
+    return (header_value or '').split(';')[0].strip().lower()
+
+
+def _as_native_array(values):
+    """Converts an object array to the numpy dtype inferred from its values."""
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = np.array(values.tolist())
+    if values.dtype.hasobject:
+        raise UnsupportedEncoding('values can not be encoded without pickle')
+    return values
+
+
+def _columns_to_instances(columns):
+    """Assembles 1-D column arrays into a 2-D instances array."""
+    if len(columns) == 1 and columns[0].ndim == 2:
+        return columns[0]
+    if all(column.dtype.kind in 'biuf' for column in columns):
+        return np.column_stack(columns)
+    instances = np.empty((len(columns[0]), len(columns)), dtype=object)
+    for index, column in enumerate(columns):
+        instances[:, index] = column
+    return instances
+
+
+def encode_npy(arrays):
+    """
+    Encodes a list of numpy arrays as a `.npy` stream.
+
+    :param list arrays: arrays to encode, in order
+    :return: bytes
+    """
+    stream = io.BytesIO()
+    for array in arrays:
+        np.lib.format.write_array(stream, np.ascontiguousarray(array), allow_pickle=False)
+    return stream.getvalue()
+
+
+def decode_npy(body):
+    """
+    Decodes a `.npy` stream into a list of numpy arrays, without copying the
+    array data out of `body`.
+
+    :param bytes body: the encoded stream
+    :return: list of read-only numpy arrays
+    """
+    buffer = memoryview(body)
+    stream = io.BytesIO(buffer)
+    arrays = []
+    while stream.tell() < len(buffer):
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        if dtype.hasobject:
+            raise UnsupportedEncoding('object arrays are not supported, as they require pickle')
+        count = int(np.prod(shape))
+        offset = stream.tell()
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        arrays.append(array.reshape(shape, order='F' if fortran_order else 'C'))
+        stream.seek(offset + count * dtype.itemsize)
+    return arrays
+
+
+def encode_arrow(columns):
+    """
+    Encodes a dict of 1-D arrays as an Arrow IPC stream.
+
+    :param dict columns: column name to array
+    :return: bytes
+    """
+    import pyarrow as pa
+    batch = pa.RecordBatch.from_pydict({name: pa.array(values) for name, values in columns.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_arrow(body):
+    """
+    Decodes an Arrow IPC stream into a dict of 1-D numpy arrays. Numeric columns
+    without nulls are not copied.
+
+    :param bytes body: the encoded stream
+    :return: dict of column name to array
+    """
+    import pyarrow as pa
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def encode_instances(instances, content_type):
+    """
+    Client side encoding of a 2-D instances array for a `/predict` request.
+
+    :param np.ndarray instances: array of shape (n_samples, n_features)
+    :param str content_type: one of the supported content types
+    :return: bytes
+    """
+    media_type = _media_type(content_type)
+    if media_type == JSON_CONTENT_TYPE:
+        return json.dumps({'payload': {'instances': instances.tolist()}}).encode()
+    if instances.dtype != object:
+        columns = None if media_type == NPY_CONTENT_TYPE else list(instances.T)
+    else:
+        columns = [_as_native_array(instances[:, index]) for index in range(instances.shape[1])]
+    if media_type == NPY_CONTENT_TYPE:
+        return encode_npy([instances] if columns is None else columns)
+    if media_type == ARROW_CONTENT_TYPE:
+        return encode_arrow({str(index): column for index, column in enumerate(columns)})
+    raise UnsupportedEncoding(f'unsupported content type {content_type}')
+
+
+def decode_instances(body, content_type):
+    """
+    Server side decoding of a `/predict` request body into a 2-D instances array.
+
+    :param bytes body: the request body
+    :param str content_type: the request content type
+    :return: np.ndarray of shape (n_samples, n_features)
+    """
+    media_type = _media_type(content_type)
+    if media_type == NPY_CONTENT_TYPE:
+        return _columns_to_instances(decode_npy(body))
+    if media_type == ARROW_CONTENT_TYPE:
+        return _columns_to_instances(list(decode_arrow(body).values()))
+    raise UnsupportedEncoding(f'unsupported content type {content_type}')
+
+
+def encode_predictions(predictions, scores, content_type):
+    """
+    Server side encoding of a `/predict` response.
+
+    :param np.ndarray predictions: array of shape (n_samples,)
+    :param Optional[np.ndarray] scores: array of shape (n_samples, n_classes), or None
+    :param str content_type: the response content type
+    :return: bytes
+    """
+    media_type = _media_type(content_type)
+    predictions = _as_native_array(predictions)
+    if media_type == JSON_CONTENT_TYPE:
+        payload = {'predictions': predictions.tolist()}
+        if scores is not None:
+            payload['scores'] = np.asarray(scores).tolist()
+        return json.dumps({'payload': payload}).encode()
+    if media_type == NPY_CONTENT_TYPE:
+        return encode_npy([predictions] if scores is None else [predictions, scores])
+    if media_type == ARROW_CONTENT_TYPE:
+        columns = {'predictions': predictions}
+        if scores is not None:
+            for index in range(scores.shape[1]):
+                columns[f'score_{index}'] = scores[:, index]
+        return encode_arrow(columns)
+    raise UnsupportedEncoding(f'unsupported content type {content_type}')
+
+
+def decode_predictions(body, content_type):
+    """
+    Client side decoding of a `/predict` response.
+
+    :param bytes body: the response body
+    :param str content_type: the response content type
+    :return: (predictions, scores), where scores is None for hard-scoring models
+    """
+    media_type = _media_type(content_type)
+    if media_type == JSON_CONTENT_TYPE:
+        payload = json.loads(body)['payload']
+        scores = payload.get('scores')
+        return np.array(payload['predictions']), None if scores is None else np.array(scores)
+    if media_type == NPY_CONTENT_TYPE:
+        arrays = decode_npy(body)
+        return arrays[0], arrays[1] if len(arrays) > 1 else None
+    if media_type == ARROW_CONTENT_TYPE:
+        columns = decode_arrow(body)
+        predictions = columns.pop('predictions')
+        return predictions, np.column_stack(list(columns.values())) if columns else None
+    raise UnsupportedEncoding(f'unsupported content type {content_type}')
+
+
+def request_headers(environ):
+    """Returns the HTTP headers of a WSGI request, e.g. `{'X-Request-Deadline-Ms': '200'}`"""
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers['-'.join(part.capitalize() for part in key[5:].split('_'))] = value
+    return headers
+
+
+def score_instances(wrapper, instances, encoder=None, supports_soft_scores=False,
+                    score_labels=None, threshold=None, headers=None):
+    """
+    Scores decoded instances with the wrapper as the Certifai `/predict` endpoint
+    does: encodes them, then calls `soft_predict` (mapping scores to labels by
+    threshold or argmax) or `predict`.
+
+    :param Optional[dict] headers: request headers, passed on to `predict`/`soft_predict` as `headers=`
+        if not None (the binary requests are served outside of the Flask request context)
+    :return: (predictions, scores), where scores is None for hard-scoring models
+    """
+    kwargs = {} if headers is None else {'headers': headers}
+    if encoder is not None:
+        with stage('encode'):
+            instances = encoder(instances)
+    if not supports_soft_scores:
+        return wrapper.predict(instances, **kwargs), None
+    scores = np.asarray(wrapper.soft_predict(instances, **kwargs))
+    with stage('postprocess'):
+        postprocessor = ScorePostprocessor(labels=score_labels if score_labels is not None else wrapper.score_labels,
+                                           threshold=threshold)
+        if threshold is not None and scores.shape[1] == 2:
+            return postprocessor.thresholded(scores), scores
+        return postprocessor.argmax(scores), scores
+
+
+class BinaryProtocolMiddleware:
+    """
+    WSGI middleware that serves binary encoded `/predict` requests, and passes
+    all other requests (including JSON `/predict` requests) on to the wrapped
+    Certifai prediction service application.
+    """
+
+    def __init__(self, wsgi_app, endpoint_url, score_fn):
+        """
+        :param wsgi_app: the prediction service WSGI application
+        :param str endpoint_url: the predict endpoint, e.g. `/predict`
+        :param score_fn: function of a 2-D instances array and the request headers returning
+            (predictions, scores)
+        """
+        self.wsgi_app = wsgi_app
+        self.endpoint_url = endpoint_url
+        self.score_fn = score_fn
+
+    def __call__(self, environ, start_response):
+        content_type = _media_type(environ.get('CONTENT_TYPE'))
+        if (environ.get('REQUEST_METHOD') != 'POST' or environ.get('PATH_INFO') != self.endpoint_url
+                or content_type not in BINARY_CONTENT_TYPES):
+            return self.wsgi_app(environ, start_response)
+
+        accept = _media_type(environ.get('HTTP_ACCEPT'))
+        if accept not in BINARY_CONTENT_TYPES + (JSON_CONTENT_TYPE,):
+            accept = content_type
+        try:
+            with stage('decode'):
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+                body = environ['wsgi.input'].read(length)
+                instances = decode_instances(body, content_type)
+            predictions, scores = self.score_fn(instances, request_headers(environ))
+            with stage('serialize'):
+                response = encode_predictions(predictions, scores, accept)
+            status = '200 OK'
+        except (UnsupportedEncoding, ImportError) as e:
+            response, status, accept = self._error(e), '415 Unsupported Media Type', JSON_CONTENT_TYPE
+        except TimeoutError as e:
+            # e.g. the request deadline passed before the hosted model responded
+            response, status, accept = self._error(e), '504 Gateway Timeout', JSON_CONTENT_TYPE
+        except ValueError as e:
+            response, status, accept = self._error(e), '400 Bad Request', JSON_CONTENT_TYPE
+        start_response(status, [('Content-Type', accept), ('Content-Length', str(len(response)))])
+        return [response]
+
+    @staticmethod
+    def _error(e):
+        return json.dumps({'error': str(e)}).encode()
+
+
+def install_binary_protocol(wrapper, endpoint_url='/predict', pass_headers=False, **scoring_args):
+    """
+    Enables binary encoded requests on a Certifai prediction service.
+    The `scoring_args` are those passed to `score_instances` (the encoder,
+    `supports_soft_scores`, `score_labels` and `threshold` the wrapper was created with).
+
+    :param wrapper: the `SimpleModelWrapper` instance, before calling `run`
+    :param str endpoint_url: the predict endpoint of the wrapper
+    :param bool pass_headers: pass the request headers to the wrapper's `predict`/`soft_predict` as `headers=`,
+        for wrappers that read them (e.g. the proxy's request deadline header)
+    """
+    def score_fn(instances, headers):
+        return score_instances(wrapper, instances, headers=headers if pass_headers else None, **scoring_args)
+    app = wrapper.app
+    app.wsgi_app = BinaryProtocolMiddleware(app.wsgi_app, endpoint_url, score_fn)
@@ -0,0 +1,12 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+The template modules import each other as top level modules, as in the generated
+prediction services (where the common `src` files are copied next to the template's).
+"""
+import os
+import sys
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates')
+sys.path[:0] = [os.path.join(TEMPLATES, 'proxy', 'src'), os.path.join(TEMPLATES, 'src')]
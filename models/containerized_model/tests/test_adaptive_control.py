@@ -0,0 +1,217 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Tests of the proxy's adaptive (AIMD) control of the chunk size and in-flight limit,
+and of the retries of throttled hosted model requests.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+import requests
+
+from adaptive_control import AIMDController
+from tail_latency import DeadlineExceeded
+
+
+def saturate(control):
+    """Takes all the in-flight slots, so that successful responses increase the limit"""
+    while control.acquire(blocking=False):
+        pass
+
+
+def test_limit_additive_increase_per_window():
+    control = AIMDController(initial_in_flight=2, max_in_flight=4)
+    saturate(control)
+    control.on_response(100, 0.01, 200)
+    control.on_response(100, 0.01, 200)
+    assert control.limit == 2
+    control.on_response(100, 0.01, 200)
+    assert control.limit == 3
+    assert control.metrics()['limit_increases'] == 1
+
+
+def test_limit_not_increased_below_the_limit():
+    control = AIMDController(initial_in_flight=2, max_in_flight=4)
+    for _ in range(10):
+        control.on_response(100, 0.01, 200)
+    assert control.limit == 2
+
+
+def test_limit_bounded_by_max_in_flight():
+    control = AIMDController(initial_in_flight=4, max_in_flight=4)
+    saturate(control)
+    for _ in range(20):
+        control.on_response(100, 0.01, 200)
+    assert control.limit == 4
+
+
+@pytest.mark.parametrize('status', [429, 502, 503, 504])
+def test_limit_multiplicative_decrease_on_throttling(status):
+    control = AIMDController(initial_in_flight=8, max_in_flight=16)
+    control.on_response(100, 0.01, status)
+    assert control.limit == 4
+    metrics = control.metrics()
+    assert metrics['throttled'] == 1 and metrics['limit_decreases'] == 1
+
+
+def test_burst_of_throttled_responses_decreases_once():
+    control = AIMDController(initial_in_flight=8, max_in_flight=16)
+    # responses within the smoothed request latency of a decrease are part of the same burst
+    control.on_response(100, 10., 200)
+    control.on_response(100, 0.01, 429)
+    control.on_response(100, 0.01, 429)
+    control.on_response(100, 0.01, 429)
+    assert control.limit == 4
+    assert control.metrics()['limit_decreases'] == 1
+
+
+def test_limit_at_least_one():
+    control = AIMDController(initial_in_flight=1)
+    control.on_response(100, 0.01, 429)
+    assert control.limit == 1
+
+
+def test_server_error_is_not_congestion():
+    control = AIMDController(initial_in_flight=8, max_in_flight=16)
+    control.on_response(100, 0.01, 500)
+    assert control.limit == 8
+    assert control.metrics()['throttled'] == 0
+
+
+def test_chunk_size_slow_start_then_additive_increase():
+    control = AIMDController(initial_chunk_size=100, max_chunk_size=1000, target_latency_ms=1000)
+    control.on_response(100, 0.01, 200)
+    assert control.chunk_size == 200
+    control.on_response(200, 0.01, 200)
+    assert control.chunk_size == 400
+    control.on_response(400, 2., 200)
+    assert control.chunk_size == 200
+    control.on_response(200, 0.01, 200)
+    assert control.chunk_size == 210
+
+
+def test_chunk_size_not_increased_by_smaller_chunks():
+    control = AIMDController(initial_chunk_size=100)
+    control.on_response(10, 0.01, 200)
+    assert control.chunk_size == 100
+
+
+def test_chunk_size_decrease_on_payload_too_large():
+    control = AIMDController(initial_chunk_size=100, min_chunk_size=30)
+    control.on_response(100, 0.01, 413)
+    assert control.chunk_size == 50
+    control.on_response(50, 0.01, 413)
+    assert control.chunk_size == 30
+    assert control.metrics()['too_large'] == 2
+
+
+def test_acquire_waits_for_release():
+    control = AIMDController(initial_in_flight=1)
+    assert control.acquire()
+    assert not control.acquire(blocking=False)
+    threading.Timer(0.05, control.release).start()
+    assert control.acquire()
+
+
+def test_acquire_stops_at_deadline():
+    control = AIMDController(initial_in_flight=1)
+    control.acquire()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        control.acquire(deadline=start + 0.05)
+    assert time.monotonic() - start < 1.
+
+
+class FakeHostedModel:
+    """Stand-in for the hosted model session: responds with the first column of each row, or with the
+    statuses in `statuses` first"""
+
+    def __init__(self, statuses=(), max_rows=None, headers=None):
+        self.statuses = list(statuses)
+        self.max_rows = max_rows
+        self.headers = headers or {}
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def post(self, url, data=None, headers=None, timeout=None, **kwargs):
+        instances = json.loads(data)['payload']['instances']
+        with self._lock:
+            self.requests.append(len(instances))
+            status = self.statuses.pop(0) if self.statuses else 200
+        if self.max_rows is not None and len(instances) > self.max_rows:
+            status = 413
+        resp = requests.Response()
+        resp.status_code = status
+        resp.reason = 'test'
+        resp.url = url
+        resp.headers.update(self.headers)
+        predictions = [row[0] for row in instances] if status == 200 else []
+        resp._content = json.dumps({'payload': {'predictions': predictions}}).encode()
+        return resp
+
+
+@pytest.fixture
+def proxy_with():
+    pytest.importorskip('certifai.model.sdk')
+    from prediction_service import Proxy
+
+    def create(hosted_model, **kwargs):
+        kwargs.setdefault('adaptive_control', AIMDController(initial_chunk_size=10, initial_in_flight=2))
+        proxy = Proxy(hosted_model_url='http://hosted-model/predict', **kwargs)
+        proxy.retry_backoff_factor = 0.001
+        proxy._session = proxy._deadline_session = hosted_model
+        return proxy
+    return create
+
+
+def instances(n):
+    return np.arange(n * 2, dtype=float).reshape(n, 2)
+
+
+def test_predictions_in_order(proxy_with):
+    proxy = proxy_with(FakeHostedModel())
+    np.testing.assert_array_equal(proxy.predict(instances(95)), instances(95)[:, 0])
+
+
+def test_throttled_chunks_retried(proxy_with):
+    hosted_model = FakeHostedModel(statuses=[429, 503])
+    proxy = proxy_with(hosted_model)
+    np.testing.assert_array_equal(proxy.predict(instances(20)), instances(20)[:, 0])
+    metrics = proxy.adaptive_control.metrics()
+    assert metrics['throttled'] == 2 and metrics['retries'] == 2
+    assert sum(hosted_model.requests) == 20 + 2 * 10
+
+
+def test_retries_limited_to_retry_total(proxy_with):
+    proxy = proxy_with(FakeHostedModel(statuses=[429] * 100))
+    with pytest.raises(requests.HTTPError):
+        proxy.predict(instances(5))
+    assert proxy.adaptive_control.metrics()['retries'] == proxy.retry_total
+
+
+def test_server_error_not_retried(proxy_with):
+    hosted_model = FakeHostedModel(statuses=[500])
+    proxy = proxy_with(hosted_model, adaptive_control=AIMDController(initial_chunk_size=10))
+    with pytest.raises(requests.HTTPError):
+        proxy.predict(instances(5))
+    assert hosted_model.requests == [5]
+
+
+def test_too_large_chunks_split(proxy_with):
+    hosted_model = FakeHostedModel(max_rows=4)
+    proxy = proxy_with(hosted_model)
+    np.testing.assert_array_equal(proxy.predict(instances(20)), instances(20)[:, 0])
+    assert proxy.adaptive_control.chunk_size < 10
+    assert proxy.adaptive_control.metrics()['too_large'] > 0
+
+
+def test_retry_backoff_stops_at_deadline(proxy_with):
+    proxy = proxy_with(FakeHostedModel(statuses=[429] * 100, headers={'Retry-After': '60'}))
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        proxy._predict_batch(instances(5), deadline=start + 0.2)
+    assert time.monotonic() - start < 5.
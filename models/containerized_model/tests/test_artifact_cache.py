@@ -0,0 +1,94 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Tests of the model artifact cache: the fingerprints of artifacts fetched without
+`MODEL_SHA256`, and fetching when the cache can not be written.
+"""
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip('certifai.common.file.locaters')
+import artifact_cache  # noqa: E402
+from artifact_cache import fetch_file, fingerprint, store  # noqa: E402
+
+S3_URL = 's3://bucket/model.pkl'
+
+
+class FakeObjectStore:
+    """Stand-in for an fsspec filesystem, with the object metadata s3fs reports"""
+
+    def __init__(self, **info):
+        self.info_ = dict({'type': 'file', 'size': 5, 'LastModified': '2020-06-01 10:00:00+00:00',
+                           'ETag': '"abc"'}, **info)
+
+    def info(self, path):
+        return self.info_
+
+
+@pytest.fixture
+def object_store(monkeypatch):
+    fsspec = pytest.importorskip('fsspec')
+
+    def use(**info):
+        fs = FakeObjectStore(**info)
+        monkeypatch.setattr(fsspec.core, 'url_to_fs', lambda url: (fs, url.split('://', 1)[1]))
+        return fs
+    return use
+
+
+def test_object_fingerprint_from_storage_metadata(object_store):
+    object_store()
+    first = fingerprint(S3_URL)
+    assert first is not None and first == fingerprint(S3_URL)
+    object_store(ETag='"def"')
+    assert fingerprint(S3_URL) != first
+    object_store(LastModified='2020-06-02 10:00:00+00:00', ETag=None)
+    assert fingerprint(S3_URL) not in (None, first)
+
+
+def test_object_fingerprint_requires_metadata(object_store):
+    object_store(LastModified=None, ETag=None)
+    assert fingerprint(S3_URL) is None
+    object_store(type='directory')
+    assert fingerprint(S3_URL) is None
+
+
+def test_object_fetched_from_cache_without_sha256(object_store, monkeypatch, tmp_path):
+    object_store()
+    source = tmp_path / 'fetched.pkl'
+    source.write_bytes(b'model')
+    cache_dir = str(tmp_path / 'cache')
+    store(cache_dir, fingerprint(S3_URL), hashlib.sha256(b'model').hexdigest(), str(source))
+
+    def not_fetched(path):
+        raise AssertionError(f'{path} fetched')
+    monkeypatch.setattr(artifact_cache, 'make_generic_locater', not_fetched)
+    destination = tmp_path / 'model' / 'model.pkl'
+    fetch_file(S3_URL, str(destination), cache_dir=cache_dir)
+    assert destination.read_bytes() == b'model'
+
+
+def test_unwritable_cache_not_cached(tmp_path, monkeypatch):
+    source = tmp_path / 'source.pkl'
+    source.write_bytes(b'model')
+    # a file where the cache directory should be, so that the cache can not be written
+    cache_dir = tmp_path / 'cache'
+    cache_dir.write_bytes(b'')
+
+    class LocalLocater:
+        def __init__(self, path):
+            self.path = str(path)
+
+        def isfile(self):
+            return os.path.isfile(self.path)
+
+        def reader(self):
+            return open(self.path, 'rb')
+    monkeypatch.setattr(artifact_cache, 'make_generic_locater', LocalLocater)
+    monkeypatch.setattr(artifact_cache, 'FilePath', str)
+    destination = tmp_path / 'model.pkl'
+    fetch_file(str(source), str(destination), cache_dir=str(cache_dir))
+    assert destination.read_bytes() == b'model'
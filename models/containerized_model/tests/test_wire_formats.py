@@ -0,0 +1,165 @@
+"""
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
+
+Tests that binary (npy and Arrow) requests to the prediction service templates are
+scored as the Certifai SDK scores JSON requests: with the same predictions (labels,
+threshold) and soft scores. Binary requests are scored by `score_instances`, outside
+of the SDK, so these tests catch any difference. They require the Certifai SDK.
+"""
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from conftest import TEMPLATES
+from wire_formats import (ARROW_CONTENT_TYPE, JSON_CONTENT_TYPE, NPY_CONTENT_TYPE, decode_predictions,
+                          encode_instances, install_binary_protocol)
+
+CONTENT_TYPES = [NPY_CONTENT_TYPE]
+if importlib.util.find_spec('pyarrow') is not None:
+    CONTENT_TYPES.append(ARROW_CONTENT_TYPE)
+
+_templates = {}
+
+
+def template(name):
+    """Imports the prediction service module of a template (with its own `utils`)"""
+    pytest.importorskip('certifai.model.sdk')
+    if name not in _templates:
+        src = os.path.join(TEMPLATES, name, 'src')
+        sys.modules.pop('utils', None)
+        sys.path.insert(0, src)
+        try:
+            spec = importlib.util.spec_from_file_location(f'{name}_prediction_service',
+                                                          os.path.join(src, 'prediction_service.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        finally:
+            sys.path.remove(src)
+            sys.modules.pop('utils', None)
+        _templates[name] = module
+    return _templates[name]
+
+
+def assert_binary_responses_equal_json(app, instances, **scoring_args):
+    """Installs the binary protocol with the scoring arguments the template's `main` passes, and checks
+    that the binary responses to `instances` are those of the JSON request"""
+    install_binary_protocol(app, **scoring_args)
+    client = app.app.test_client()
+    response = client.post('/predict', json={'payload': {'instances': instances.tolist()}})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    expected_predictions, expected_scores = decode_predictions(response.data, JSON_CONTENT_TYPE)
+
+    for content_type in CONTENT_TYPES:
+        response = client.post('/predict', data=encode_instances(instances, content_type),
+                               content_type=content_type, headers={'Accept': content_type})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        predictions, scores = decode_predictions(response.data, content_type)
+        assert predictions.tolist() == expected_predictions.tolist(), content_type
+        if expected_scores is None:
+            assert scores is None, content_type
+        else:
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-6, err_msg=content_type)
+
+
+@pytest.fixture(scope='module')
+def classification_data():
+    rng = np.random.RandomState(0)
+    x = rng.normal(size=(200, 4))
+    y = (x[:, 0] + x[:, 1] > 0).astype(int) + (x[:, 2] > 1).astype(int)
+    return x, y
+
+
+def python_app(model, supports_soft_scores, score_labels=None, threshold=None, encoder=None):
+    module = template('python')
+    app = module.PythonModelWrapper(model=model, encoder=encoder, host='0.0.0.0',
+                                    supports_soft_scores=supports_soft_scores, score_labels=score_labels,
+                                    threshold=threshold, metadata={})
+    app.set_global_imports()
+    return app, dict(encoder=encoder, supports_soft_scores=supports_soft_scores, score_labels=score_labels,
+                     threshold=threshold)
+
+
+def test_python_hard_scoring(classification_data):
+    from sklearn.tree import DecisionTreeClassifier
+    x, y = classification_data
+    app, scoring_args = python_app(DecisionTreeClassifier(random_state=0).fit(x, y), supports_soft_scores=False)
+    assert_binary_responses_equal_json(app, x[:50], **scoring_args)
+
+
+def test_python_soft_scoring_labels(classification_data):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+    x, y = classification_data
+    scaler = StandardScaler().fit(x)
+    model = LogisticRegression().fit(scaler.transform(x), y)
+    app, scoring_args = python_app(model, supports_soft_scores=True, score_labels=['low', 'mid', 'high'],
+                                   encoder=scaler.transform)
+    assert_binary_responses_equal_json(app, x[:50], **scoring_args)
+
+
+@pytest.mark.parametrize('threshold', [None, 0.2, 0.5, 0.8])
+def test_python_soft_scoring_threshold(classification_data, threshold):
+    from sklearn.linear_model import LogisticRegression
+    x, y = classification_data
+    model = LogisticRegression().fit(x, y > 0)
+    app, scoring_args = python_app(model, supports_soft_scores=True, score_labels=[1, 2], threshold=threshold)
+    assert_binary_responses_equal_json(app, x[:50], **scoring_args)
+
+
+@pytest.mark.parametrize('task_type, threshold', [('binary-classification', None),
+                                                  ('binary-classification', 0.3),
+                                                  ('multiclass-classification', None),
+                                                  ('regression', None)])
+def test_xgboost_dmatrix(classification_data, task_type, threshold):
+    xgb = pytest.importorskip('xgboost')
+    module = template('python_xgboost_dmatrix')
+    x, y = classification_data
+    objective, labels, target = {
+        'binary-classification': ('binary:logistic', [0, 1], y > 0),
+        'multiclass-classification': ('multi:softprob', ['low', 'mid', 'high'], y),
+        'regression': ('reg:squarederror', None, x[:, 0] * 2.),
+    }[task_type]
+    params = {'objective': objective}
+    if task_type == 'multiclass-classification':
+        params['num_class'] = 3
+    model = xgb.train(params, xgb.DMatrix(x, label=target), num_boost_round=5)
+    supports_soft_scores = task_type != 'regression'
+    app = module.XgboostWrapper(model=model, encoder=None, host='0.0.0.0', supports_soft_scores=supports_soft_scores,
+                                threshold=threshold, score_labels=labels, metadata={'task_type': task_type})
+    app.set_global_imports()
+    assert_binary_responses_equal_json(app, x[:50], encoder=None, supports_soft_scores=supports_soft_scores,
+                                       score_labels=labels, threshold=threshold)
+
+
+class FakeMojo:
+    """Stand-in for a daimojo model: scores from a logistic function of the first column, or the sum of the
+    columns for a regression model"""
+
+    def __init__(self, output_names):
+        self.output_names = output_names
+
+    def predict(self, frame):
+        import datatable as dt
+        values = frame.to_numpy().astype(float)
+        if len(self.output_names) == 1:
+            return dt.Frame({self.output_names[0]: values.sum(axis=1)})
+        positive = 1. / (1. + np.exp(-values[:, 0]))
+        return dt.Frame({self.output_names[0]: 1. - positive, self.output_names[1]: positive})
+
+
+@pytest.mark.parametrize('output_names, supports_soft_scores', [(['outcome.1', 'outcome.2'], True),
+                                                                (['outcome.1', 'outcome.2'], False),
+                                                                (['amount'], False)])
+def test_h2o_mojo(classification_data, output_names, supports_soft_scores):
+    pytest.importorskip('datatable')
+    module = template('h2o_mojo')
+    x, _ = classification_data
+    columns = [f'c{index}' for index in range(x.shape[1])]
+    app = module.MojoModelWrapper(host='0.0.0.0', model=FakeMojo(output_names), metadata={'columns': columns},
+                                  supports_soft_scores=supports_soft_scores, score_labels=None)
+    app.set_global_imports()
+    assert_binary_responses_equal_json(app, x[:50], supports_soft_scores=supports_soft_scores)
@@ -3,14 +3,19 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
-import pickle
+import os
+import sys
 
 from certifai.model.sdk import SimpleModelWrapper
 
-with open('models/german_credit_mlp.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    model = saved.get('model')
-    encoder = saved.get('encoder', None)
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
+
+saved = load_model('models/german_credit_mlp.bundle')
+model = saved.get('model')
+encoder = saved.get('encoder', None)
 
 # To enable models with soft-scores use `supports_soft_scores=True` when initializing SimpleModelWrapper
 # scikit mlp classifier provides default implementation for soft_scores using `predict_proba` method
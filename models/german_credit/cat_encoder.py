@@ -0,0 +1,93 @@
+""" 
+Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
+Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/7998b8a481fccd467463deb1fc46d19622079b0e/LICENSE.md
+"""
+# copy of tutorials/remote_scan_tutorial/utils/cat_encoder.py ; used by train.py for the sparse (CSR) output of
+# the logistic regression and SVM models
+
+from sklearn import preprocessing
+from sklearn.preprocessing import StandardScaler
+import numpy as np
+from scipy import sparse as sp
+
+class CatEncoder:
+    def __init__(self, cat_columns, data, normalize: bool=True, sparse: bool=False):
+        """
+        :param sparse: return a scipy CSR matrix instead of a dense array, for models that accept sparse input
+            (e.g. sklearn linear models and SVMs); the model must be trained on the sparse output
+        """
+        self.sparse = sparse
+        self.cat_indexes = [data.columns.get_loc(name) for name in cat_columns]
+        self.num_indexes = [idx for idx in range(len(data.columns)) if idx not in self.cat_indexes]
+        self.encoder = preprocessing.OneHotEncoder()
+        self.encoder.fit(data[cat_columns])
+        self.num_columns = list(data.columns[self.num_indexes])
+        self.cat_columns = cat_columns
+        # get_feature_names was renamed in scikit-learn 1.0
+        get_feature_names = getattr(self.encoder, 'get_feature_names_out', None) or self.encoder.get_feature_names
+        cat_transformed_names = get_feature_names(input_features=self.cat_columns)
+        self._transformed_column_names =  self.num_columns + list(cat_transformed_names)
+        if normalize:
+            self.normalizer = StandardScaler()
+            self.normalizer.fit(data.iloc[:, self.num_indexes])
+        else:
+            self.normalizer = None
+        self._compile()
+
+    def _compile(self):
+        # lookup tables for __call__: the output column of each category of each categorical column
+        # (numeric columns first, then the one-hot columns in the OneHotEncoder order), and the
+        # normalization mean and scale vectors
+        self._column_tables = []
+        offset = len(self.num_indexes)
+        for categories in self.encoder.categories_:
+            self._column_tables.append({category: offset + position for position, category in enumerate(categories)})
+            offset += len(categories)
+        self._width = offset
+        normalizer = self.normalizer
+        self._mean = normalizer.mean_ if normalizer is not None and normalizer.with_mean else None
+        self._scale = normalizer.scale_ if normalizer is not None and normalizer.with_std else None
+    
+    def __call__(self, x):
+        if not hasattr(self, '_column_tables'):
+            # encoder pickled before the lookup tables were added
+            self._compile()
+        num_count = len(self.num_indexes)
+        if getattr(self, 'sparse', False):
+            # the numeric values and a 1 for each categorical column, at increasing columns in each row
+            row_width = num_count + len(self.cat_indexes)
+            values = np.ones((len(x), row_width))
+            columns = np.empty((len(x), row_width), dtype=np.int32)
+            columns[:, :num_count] = np.arange(num_count)
+            self._normalized(x, values[:, :num_count])
+            for position, (name, index, table) in enumerate(zip(self.cat_columns, self.cat_indexes,
+                                                                self._column_tables)):
+                columns[:, num_count + position] = self._category_columns(x, name, index, table)
+            return sp.csr_matrix((values.ravel(), columns.ravel(), np.arange(0, values.size + 1, row_width)),
+                                 shape=(len(x), self._width))
+        out = np.zeros((len(x), self._width))
+        self._normalized(x, out[:, :num_count])
+        rows = np.arange(len(x))
+        for name, index, table in zip(self.cat_columns, self.cat_indexes, self._column_tables):
+            out[rows, self._category_columns(x, name, index, table)] = 1.
+        return out
+
+    def _normalized(self, x, out):
+        out[:] = x[:, self.num_indexes]
+        if self._mean is not None:
+            out -= self._mean
+        if self._scale is not None:
+            out /= self._scale
+
+    @staticmethod
+    def _category_columns(x, name, index, table):
+        columns = np.fromiter((table.get(value, -1) for value in x[:, index]), dtype=np.intp, count=len(x))
+        unknown = columns < 0
+        if unknown.any():
+            raise ValueError(f'Found unknown categories {sorted(set(x[unknown, index]))} in column {name} '
+                             f'during transform')
+        return columns
+
+    @property
+    def transformed_features(self):
+        return self._transformed_column_names
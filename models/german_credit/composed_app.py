@@ -3,37 +3,39 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
-import pickle
+import os
+import sys
 
 from certifai.model.sdk import ComposedModelWrapper, SimpleModelWrapper
 
-with open('models/german_credit_dtree.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    dtree_app = SimpleModelWrapper(
-        model=saved.get('model'),
-        encoder=saved.get('encoder', None)
-    )
-
-with open('models/german_credit_logit.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    logit_app = SimpleModelWrapper(
-        model=saved.get('model'),
-        encoder=saved.get('encoder', None)
-    )
-
-with open('models/german_credit_mlp.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    mlp_app = SimpleModelWrapper(
-        model=saved.get('model'),
-        encoder=saved.get('encoder', None)
-    )
-
-with open('models/german_credit_svm.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    svm_app = SimpleModelWrapper(
-        model=saved.get('model'),
-        encoder=saved.get('encoder', None)
-    )
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
+
+saved = load_model('models/german_credit_dtree.bundle')
+dtree_app = SimpleModelWrapper(
+    model=saved.get('model'),
+    encoder=saved.get('encoder', None)
+)
+
+saved = load_model('models/german_credit_logit.bundle')
+logit_app = SimpleModelWrapper(
+    model=saved.get('model'),
+    encoder=saved.get('encoder', None)
+)
+
+saved = load_model('models/german_credit_mlp.bundle')
+mlp_app = SimpleModelWrapper(
+    model=saved.get('model'),
+    encoder=saved.get('encoder', None)
+)
+
+saved = load_model('models/german_credit_svm.bundle')
+svm_app = SimpleModelWrapper(
+    model=saved.get('model'),
+    encoder=saved.get('encoder', None)
+)
 
 composed_app = ComposedModelWrapper()
 composed_app.add_wrapped_model('/german_credit_dtree', dtree_app)
@@ -3,18 +3,23 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
-import pickle
+import os
+import sys
 
 import pandas as pd
 
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
+
 
 def main():
 
     # Load the trained model and its encoder
-    with open('models/german_credit_dtree.pkl', 'rb') as f:
-        saved = pickle.load(f)
-        model = saved.get('model')
-        encoder = saved.get('encoder', None)
+    saved = load_model('models/german_credit_dtree.bundle')
+    model = saved.get('model')
+    encoder = saved.get('encoder', None)
 
     # Bring in test and training data.
     eval = pd.read_csv('german_credit_eval.csv')
@@ -2,9 +2,11 @@
 Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
+import argparse
 import os
 import pickle
 import random
+import sys
 import time
 import warnings
 
@@ -13,11 +15,16 @@ import pandas as pd
 from certifai.common.utils.encoding import CatEncoder
 from sklearn.model_selection import train_test_split
 
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import write_bundle
+
 # supress all warnings
 warnings.filterwarnings('ignore')
 
 
-def main():
+def main(sparse=False):
     random.seed(0)
     np.random.seed(0)
 
@@ -51,6 +58,14 @@ def main():
     encoder = CatEncoder(cat_columns, x, normalize=True)
     encoded_x_train = encoder(x_train.values)
     encoded_x_test = encoder(x_test.values)
+    # The logistic regression and SVM models accept sparse input. With `--sparse`, they are trained on (and score)
+    # the CSR output of the local CatEncoder (cat_encoder.py), instead of wide dense arrays
+    linear_encoder, linear_x_train, linear_x_test = encoder, encoded_x_train, encoded_x_test
+    if sparse:
+        import cat_encoder
+        linear_encoder = cat_encoder.CatEncoder(cat_columns, x, normalize=True, sparse=True)
+        linear_x_train = linear_encoder(x_train.values)
+        linear_x_test = linear_encoder(x_test.values)
 
     # Train a decision tree model
     from sklearn.tree import DecisionTreeClassifier
@@ -67,32 +82,36 @@ def main():
     # Train a support vector machine model
     from sklearn import svm
     SVM = svm.SVC(gamma='scale')
-    SVM.fit(encoded_x_train, y_train.values)
-    svm_acc = SVM.score(encoded_x_test,y_test.values)
+    SVM.fit(linear_x_train, y_train.values)
+    svm_acc = SVM.score(linear_x_test,y_test.values)
 
     # Train a logistic regression model
     from sklearn.linear_model import LogisticRegression
     logit = LogisticRegression(random_state=0, solver='lbfgs')
-    logit.fit(encoded_x_train, y_train.values)
-    logit_acc = logit.score(encoded_x_test,y_test.values)
+    logit.fit(linear_x_train, y_train.values)
+    logit_acc = logit.score(linear_x_test,y_test.values)
 
-    # function to pickle our models for later access
+    # function to pickle our models, and save them as model bundles, for later access
     def pickle_model(model, encoder, model_name, test_accuracy, description, filename):
         model_obj = {'model': model, 'encoder': encoder, 'name': model_name,
                      'description': description, 'test_acc': test_accuracy,
                      'created': int(time.time())}
         with open(filename, 'wb') as file:
             pickle.dump(model_obj, file)
+        write_bundle(model_obj, os.path.splitext(filename)[0] + '.bundle')
         print(f"Saved: {model_name}")
 
-    # Save models as pickle files
+    # Save models as pickle files and model bundles
     os.makedirs('models', exist_ok=True)
     pickle_model(dtree, encoder, 'Decision Tree', dtree_acc, 'Basic Decision Tree model',
                  'models/german_credit_dtree.pkl')
-    pickle_model(logit, encoder, 'LOGIT', logit_acc, 'Basic LOGIT model', 'models/german_credit_logit.pkl')
+    pickle_model(logit, linear_encoder, 'LOGIT', logit_acc, 'Basic LOGIT model', 'models/german_credit_logit.pkl')
     pickle_model(mlp, encoder, 'MLP', mlp_acc, 'Basic MLP model', 'models/german_credit_mlp.pkl')
-    pickle_model(SVM, encoder, 'SVM', svm_acc, 'Basic SVM model', 'models/german_credit_svm.pkl')
+    pickle_model(SVM, linear_encoder, 'SVM', svm_acc, 'Basic SVM model', 'models/german_credit_svm.pkl')
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sparse', action='store_true',
+                        help='train the logistic regression and SVM models on sparse (CSR) encoded input')
+    main(parser.parse_args().sparse)
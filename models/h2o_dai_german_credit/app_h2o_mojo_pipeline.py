@@ -3,12 +3,20 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
 from certifai.model.sdk import SimpleModelWrapper
 import datatable as dt
 import daimojo.model
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from postprocessing import ScorePostprocessor
 
 model = daimojo.model("./pipeline.mojo")
 print(f"Loaded {model.uuid} from ./pipeline.mojo")
+# the first label is 1 (loan granted) and the second label is 2 (loan denied), which equal scores map to
+to_labels = ScorePostprocessor(labels=[1, 2], ties='last')
 
 
 class GermanCredit(SimpleModelWrapper):
@@ -41,22 +49,30 @@ class GermanCredit(SimpleModelWrapper):
                    ]
         return columns
 
-    def __get_prediction(self, preds):
+    def __to_frame(self, npinstances):
         """
-        `__get_prediction` is user defined helper method to convert the H2O model
+        `__to_frame` is user defined helper method to build the datatable Frame
+        for the model column by column from the numpy batch
+        """
+        columns = {}
+        for index, name in enumerate(self.__get_columns()):
+            column = npinstances[:, index]
+            columns[name] = column.tolist() if column.dtype == object else column
+        return dt.Frame(columns)
+
+    def __get_predictions(self, preds):
+        """
+        `__get_predictions` is user defined helper method to convert the H2O model
         outputs to the predictions expected by Certifai. In this example,
-        returns the appropriate class label based on the class probability.
+        returns the appropriate class label for each row based on the class probability.
         Specifically, the first label is 1 (loan granted) and the second label is 2 (loan denied)
         """
-        if preds[0] > preds[1]:
-            return 1
-        return 2
+        return to_labels.argmax(preds)
 
     def predict(self, npinstances):
-        instances = [tuple(instance) for instance in npinstances]
-        input_dt = dt.Frame(instances, names=self.__get_columns())
-        predictions = model.predict(input_dt).to_pandas().apply(self.__get_prediction, axis=1)
-        return predictions.values
+        input_dt = self.__to_frame(npinstances)
+        predictions = model.predict(input_dt).to_numpy()
+        return self.__get_predictions(predictions)
 
 
 if __name__ == "__main__":
@@ -3,12 +3,18 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
 from certifai.model.sdk import SimpleModelWrapper
 import pandas as pd
 import numpy as np
 from numpy import nan
 import datatable as dt
 from scipy.special._ufuncs import expit
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from postprocessing import ScorePostprocessor
 # TODO dynamically determine module to import
 from scoring_h2oai_experiment_4b16871c_1233_11eb_b801_0242ac110002 import Scorer
 
@@ -36,17 +42,15 @@ columns = ['checkingstatus',
 ]
 scorer = Scorer()
 
-def _get_prediction_class(preds):
-    if preds[0] > preds[1]:
-        return 1
-    return 2
+# the first label is 1 (loan granted) and the second label is 2 (loan denied), which equal scores map to
+to_labels = ScorePostprocessor(labels=[1, 2], ties='last')
 
 class GermanCredit(SimpleModelWrapper):
     def predict(self, npinstances):
         instances = [tuple(instance) for instance in npinstances]
         input_dt = dt.Frame(instances, names=columns)
-        predictions = scorer.score_batch(input_dt, output_margin=False).apply(_get_prediction_class, axis=1)
-        return predictions.values
+        scores = scorer.score_batch(input_dt, output_margin=False)
+        return to_labels.argmax(scores.values)
 
 if __name__ == "__main__":
     # Host is set to 0.0.0.0 to allow this to be run in a docker container
@@ -3,8 +3,15 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
+
 from certifai.model.sdk import SimpleModelWrapper
 
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+
 
 class ModelWrapper(SimpleModelWrapper):
     """
@@ -54,24 +61,43 @@ class ModelWrapper(SimpleModelWrapper):
         """
         global dt
         import datatable as dt
+        global ScorePostprocessor
+        from postprocessing import ScorePostprocessor
+
+    def __to_frame(self, npinstances):
+        """
+        `__to_frame` is user defined helper method to build the datatable Frame
+        for the model column by column from the numpy batch. Object columns are
+        converted once per column so datatable infers the same column types as
+        it would from a list of rows.
+        """
+        columns = {}
+        for index, name in enumerate(self.__get_columns()):
+            column = npinstances[:, index]
+            columns[name] = column.tolist() if column.dtype == object else column
+        return dt.Frame(columns)
 
-    def __get_prediction(self, preds):
+    def __get_predictions(self, preds):
         """
-        For a regression model, _get_prediction should return the first and only
-        prediction value.
+        For a regression model, __get_predictions should return the first and only
+        prediction column.
         """
-        # for regression we get only one prediction
-        return preds[0]
+        # for regression we get only one prediction per row
+        return ScorePostprocessor.regression(preds)
 
     def predict(self, npinstances):
         # reference model by using `self.model`
-        instances = [tuple(instance) for instance in npinstances]
-        input_dt = dt.Frame(instances, names=self.__get_columns())
-        predictions = self.model.predict(input_dt).to_pandas().apply(self.__get_prediction, axis=1)
-        return predictions.values
+        input_dt = self.__to_frame(npinstances)
+        predictions = self.model.predict(input_dt).to_numpy()
+        return self.__get_predictions(predictions)
 
 
 if __name__ == "__main__":
+    from metrics import install_metrics
+
     # Host is set to 0.0.0.0 to allow this to be run in a docker container
     app = ModelWrapper(host="0.0.0.0", model_type='h2o_mojo', model_path='./pipeline.mojo')
+    # Serve per-stage latency histograms and worker counters on /metrics, with METRICS_ENABLED=true
+    # (requires prometheus_client)
+    install_metrics(app, {'enabled': os.getenv('METRICS_ENABLED', 'false').lower() == 'true'})
     app.run(log_level="warning", production=True, num_workers=3)
@@ -2,8 +2,14 @@
 Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
+import os
+import sys
+
 from certifai.model.sdk import SimpleModelWrapper
-import pickle
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
 import numpy as np
 import xgboost as xgb # This import is used in the development server
 
@@ -22,15 +28,25 @@ class Wrapper(SimpleModelWrapper):
 
     def soft_predict(self, npinstances):
         # reference model by using `self.model`
-        results = self.model.predict(xgb.DMatrix(data=npinstances))
-        return np.array([[1. - x, x] for x in results])
+        # predict in place on a contiguous float32 copy of the instances, rather than building a DMatrix
+        if hasattr(self.model, 'inplace_predict'):
+            results = self.model.inplace_predict(np.ascontiguousarray(npinstances, dtype=np.float32))
+        else:
+            results = self.model.predict(xgb.DMatrix(data=npinstances))
+        scores = np.empty((len(results), 2), dtype=results.dtype)
+        np.subtract(1., results, out=scores[:, 0])
+        scores[:, 1] = results
+        return scores
 
 
-with open('adult_income_xgb.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    model = saved.get('model')
-    encoder = saved.get('encoder', None)
-    threshold = saved.get('threshold', 0.5)
+saved = load_model('adult_income_xgb.bundle')
+model = saved.get('model')
+encoder = saved.get('encoder', None)
+threshold = saved.get('threshold', 0.5)
+# threads per prediction, set to avoid oversubscribing the cores when running several worker processes
+nthread = os.getenv('XGBOOST_NTHREAD')
+if nthread:
+    model.set_param({'nthread': int(nthread)})
 
 if __name__ == "__main__":
     # since xgboost is a soft-scoring model with single score for each prediction,
@@ -2,6 +2,8 @@
 Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
+import os
+import sys
 import pickle
 import random
 import pandas as pd
@@ -10,6 +12,10 @@ from sklearn.metrics import accuracy_score
 from sklearn.model_selection import train_test_split
 from certifai.common.utils.encoding import CatEncoder
 import xgboost as xgb
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import write_bundle
 import warnings
 
 # supress all warnings
@@ -69,6 +75,8 @@ def main():
 
     with open(filename, 'wb') as file:
         pickle.dump(model_obj, file)
+    # and as a model bundle, loaded lazily with memory-mapped arrays
+    write_bundle(model_obj, 'adult_income_xgb.bundle')
 
     # Create a smaller eval dataset (workaround 10K limit for Shap)
     shap_eval_df = df.sample(9000)
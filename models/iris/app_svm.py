@@ -3,25 +3,33 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
+
 from certifai.model.sdk import SimpleModelWrapper
-import pickle
+
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
+from postprocessing import ScorePostprocessor
 import numpy as np
 
 # The model returns 0, 1, or 2. The service should return the names of the
 # species
 species = np.array(['Iris-setosa', 'Iris-versicolor', 'Iris-virginica'])
+to_species = ScorePostprocessor(labels=species)
 
 # Customize the SimpleModelWrapper to convert the predictions to the species
 class IrisApp(SimpleModelWrapper):
     def predict(self, npinstances):
         results = self.model.predict(npinstances)
-        return species[results]
+        return to_species.classes(results)
 
 # Load the trained model and its encoder
-with open('iris_svm.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    model = saved.get('model')
-    encoder = saved.get('encoder', None)
+saved = load_model('iris_svm.bundle')
+model = saved.get('model')
+encoder = saved.get('encoder', None)
 
 # Run the wrapped model as a service
 app = IrisApp(model=model, encoder=encoder)
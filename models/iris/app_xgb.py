@@ -3,8 +3,16 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
+
 from certifai.model.sdk import SimpleModelWrapper
-import pickle
+
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
+from postprocessing import ScorePostprocessor
 import numpy as np
 import xgboost as xgb
 
@@ -12,19 +20,19 @@ import xgboost as xgb
 # species. The score labels must be given in the order of the probabilities
 # returned by the model.
 species = np.array(['Iris-setosa', 'Iris-versicolor', 'Iris-virginica'])
+to_species = ScorePostprocessor(labels=species)
 
 # Customize the SimpleModelWrapper to convert the predictions to the species
 class IrisApp(SimpleModelWrapper):
     def predict(self, npinstances):
         # This method is only used if supports_soft_scores is False
         results = self.model.predict(npinstances)
-        return species[results]
+        return to_species.classes(results)
 
 # Load the trained model and its encoder
-with open('iris_xgb.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    model = saved.get('model')
-    encoder = saved.get('encoder', None)
+saved = load_model('iris_xgb.bundle')
+model = saved.get('model')
+encoder = saved.get('encoder', None)
 
 # Run the wrapped model as a service
 app = IrisApp(model=model,
@@ -3,6 +3,8 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import sys
+import os
 import time
 import random
 import pickle
@@ -11,6 +13,10 @@ import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from certifai.common.utils.encoding import CatEncoder
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import write_bundle
 # supress all warnings
 warnings.filterwarnings('ignore')
 
@@ -43,16 +49,17 @@ def main():
     xgb.fit(encoded_x_train, y_train)
     xgb_acc = xgb.score(encoded_x_test,y_test)
 
-    # function to pickle our models for later access
+    # function to pickle our models, and save them as model bundles, for later access
     def pickle_model(model, encoder, model_name, test_accuracy, description, filename):
         model_obj = {'model': model, 'encoder': encoder, 'name': model_name,
                      'description': description, 'test_acc': test_accuracy,
                      'created': int(time.time())}
         with open(filename, 'wb') as file:
             pickle.dump(model_obj, file)
+        write_bundle(model_obj, os.path.splitext(filename)[0] + '.bundle')
         print(f"Saved: {model_name}")
 
-    # Save models as pickle files
+    # Save models as pickle files and model bundles
     pickle_model(svm, encoder, 'Support Vector Machine', svm_acc, 'Support Vector Machine classifier', 'iris_svm.pkl')
     pickle_model(xgb, encoder, 'XGBoost Classifier', xgb_acc, 'XGBoost classifier', 'iris_xgb.pkl')
 
@@ -3,15 +3,21 @@ Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/master/LICENSE.md
 """
 
+import os
+import sys
+
 from certifai.model.sdk import SimpleModelWrapper
-import pickle
+
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import load_model
 from clean_pipeline import CleanPipeline
 
 
-with open('readmission_mlp.pkl', 'rb') as f:
-    saved = pickle.load(f)
-    model = saved.get('model')
-    encoder = saved.get('encoder', None)
+saved = load_model('readmission_mlp.bundle')
+model = saved.get('model')
+encoder = saved.get('encoder', None)
 
 app = SimpleModelWrapper(model=model, encoder=encoder)
 app.run(production=True)
@@ -1,15 +1,115 @@
-from typing import Union
+from typing import Optional, Union
+import warnings
 
 import numpy as np
 import pandas as pd
 from certifai.common.utils.encoding import CatEncoder
 
+# number of training rows the compiled plan is checked against at fit time
+_PLAN_CHECK_ROWS = 1000
+
+
+def _parse_age(r):
+    f, to = r[1:-1].split('-')
+    return int((int(to) + int(f))/2)
+
+
+class _TransformPlan:
+    """
+    Column-index plan of `CleanPipeline.transform` for numpy arrays of instances, compiled at fit time: the
+    input column of each numeric output column (with a lookup table for the age buckets), and the input
+    column, output columns and encoded values of each category of each categorical column. The encoder's
+    output layout is found by encoding variations of a training row, so the plan makes no assumption on it.
+    Values are looked up for a whole column at a time, with the hash table of a `pd.Index` of the categories.
+    """
+
+    def __init__(self, columns, ages, cleaned: pd.DataFrame, encoder):
+        """
+        :param list columns: the input columns
+        :param ages: the age buckets of the training data, e.g. '[70-80)'
+        :param cleaned: the cleaned training data
+        :param encoder: the fitted encoder of the cleaned data
+        """
+        base = cleaned.iloc[[0]]
+        cat_columns = list(cleaned.select_dtypes('object').columns)
+        num_columns = [c for c in cleaned.columns if c not in cat_columns]
+        base_encoded = np.asarray(encoder.transform(base.copy()))
+        self.template = base_encoded[0]
+
+        # (input index, output index, (value index, values) lookup table or None) of each numeric column
+        self.numeric = []
+        for name in num_columns:
+            probe = pd.concat([base] * 2, ignore_index=True)
+            probe[name] = [1, 2]
+            changed = np.flatnonzero((np.asarray(encoder.transform(probe)) != self.template).any(axis=0))
+            if len(changed) != 1:
+                raise ValueError(f'column {name} is not encoded as a single column')
+            lookup = None
+            if name == 'age':
+                buckets = pd.unique(ages)
+                lookup = pd.Index(buckets), np.array([_parse_age(age) for age in buckets])
+            self.numeric.append((columns.index(name), int(changed[0]), lookup))
+
+        # (input index, output indexes, category index, code of each category in the index, code of missing
+        # values, encoded values) of each categorical column
+        self.categorical = []
+        for name in cat_columns:
+            categories = pd.unique(cleaned[name])
+            probe = pd.concat([base] * len(categories), ignore_index=True)
+            probe[name] = categories
+            encoded = np.asarray(encoder.transform(probe))
+            block = np.flatnonzero((encoded != self.template).any(axis=0))
+            lookup, missing = {}, -1
+            for code, category in enumerate(categories):
+                if pd.isnull(category):
+                    # '?' is replaced by NaN when cleaning
+                    lookup['?'] = missing = code
+                else:
+                    lookup[category] = code
+            self.categorical.append((columns.index(name), block, pd.Index(list(lookup), dtype=object),
+                                     np.array(list(lookup.values()), dtype=np.intp), missing, encoded[:, block]))
+
+        covered = np.concatenate([[out for _, out, _ in self.numeric]] + [block for _, block, *_ in self.categorical])
+        if len(np.unique(covered)) != len(covered):
+            raise ValueError('encoded columns overlap')
+
+    def transform(self, x: np.ndarray) -> Optional[np.ndarray]:
+        """Returns the cleaned and encoded instances, or None if a value is outside of the plan"""
+        out = np.repeat(self.template[np.newaxis], len(x), axis=0)
+        for index, out_index, lookup in self.numeric:
+            values = x[:, index]
+            if lookup is not None:
+                keys, lookup_values = lookup
+                positions = keys.get_indexer(values)
+                if (positions < 0).any():
+                    return None
+                values = lookup_values[positions]
+            else:
+                values = np.where(values == '?', np.nan, values)
+            try:
+                out[:, out_index] = values
+            except (TypeError, ValueError):
+                return None
+        for index, block, keys, key_codes, missing, encoded in self.categorical:
+            values = x[:, index]
+            positions = keys.get_indexer(values)
+            codes = key_codes[positions]
+            unknown = positions < 0
+            if unknown.any():
+                # NaN values are encoded as the NaN category, anything else is left to the encoder
+                if missing < 0 or not all(isinstance(value, float) and value != value for value in values[unknown]):
+                    return None
+                codes[unknown] = missing
+            out[:, block] = encoded[codes]
+        return out
+
 
 class CleanPipeline:
     def __init__(self):
         self._cat_encoder = None
         self._invariate_cols = None
         self._columns = None
+        self._plan = None
 
     def _clean(self, df: pd.DataFrame):
         df.replace('?', np.nan, inplace=True)
@@ -20,29 +120,52 @@ class CleanPipeline:
         # dropping columns with no variation
         df.drop(columns=self._invariate_cols, inplace=True)
 
-        def parse_age(r):
-            f, to = r[1:-1].split('-')
-            return int((int(to) + int(f))/2)
-
-        df['age'] = df['age'].map(parse_age)
+        df['age'] = df['age'].map(_parse_age)
 
         return df
 
     def fit(self, df: pd.DataFrame):
         self._columns = list(df.columns)
         self._invariate_cols = [c for c in df.columns if len(df[c].unique()) < 2]
-        df = df.copy()
-        self._clean(df)
-        self._cat_encoder = CatEncoder(cat_columns=df.select_dtypes('object').columns, normalize=False)
-        self._cat_encoder.fit(df)
+        cleaned = self._clean(df.copy())
+        self._cat_encoder = CatEncoder(cat_columns=cleaned.select_dtypes('object').columns, normalize=False)
+        self._cat_encoder.fit(cleaned)
+        self._compile(df, cleaned)
 
-    def transform(self, data: Union[pd.DataFrame, np.ndarray]):
-        if self._cat_encoder is None:
-            raise ValueError("Cleaning pipeline has not been fit")
+    def _compile(self, df: pd.DataFrame, cleaned: pd.DataFrame):
+        # compile the plan used by transform for numpy arrays, and check it against the DataFrame
+        # transform on training rows, as they are served (an object array)
+        self._plan = None
+        try:
+            plan = _TransformPlan(self._columns, df['age'].values, cleaned, self._cat_encoder)
+        except ValueError as e:
+            warnings.warn(f'CleanPipeline transforms DataFrames, as its encoding could not be compiled: {e}')
+            return
+        sample = df.iloc[:_PLAN_CHECK_ROWS].values.astype(object)
+        expected = self._transform_frame(sample)
+        actual = plan.transform(sample)
+        if actual is None or actual.dtype != expected.dtype or not np.array_equal(actual, expected, equal_nan=True):
+            warnings.warn('CleanPipeline transforms DataFrames, as its compiled encoding differs from the encoder')
+            return
+        self._plan = plan
 
+    def _transform_frame(self, data: Union[pd.DataFrame, np.ndarray]):
         if isinstance(data, np.ndarray):
             df = pd.DataFrame(data, columns=self._columns)
         else:
             df = data.copy()
         self._clean(df)
         return self._cat_encoder.transform(df)
+
+    def transform(self, data: Union[pd.DataFrame, np.ndarray]):
+        if self._cat_encoder is None:
+            raise ValueError("Cleaning pipeline has not been fit")
+
+        # numpy arrays (as served) are transformed with the plan compiled at fit time, unless a value is
+        # outside of it (e.g. an unknown category), or the pipeline was pickled before plans were compiled
+        plan = getattr(self, '_plan', None)
+        if plan is not None and isinstance(data, np.ndarray):
+            encoded = plan.transform(data)
+            if encoded is not None:
+                return encoded
+        return self._transform_frame(data)
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import pandas as pd
 import time, pickle, random
@@ -7,62 +8,74 @@ from sklearn.neural_network import MLPClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import f1_score, accuracy_score, roc_auc_score, f1_score
 from clean_pipeline import CleanPipeline
-
-
-def _map_diagnostics(df: pd.DataFrame):
-    diag_cols = ['diag_1','diag_2','diag_3']
-    for col in diag_cols:
-        df[col].replace('?', np.nan, inplace=True)
-        df[col].fillna('0', inplace=True)
-        # Anything with E or V will get mapped into 'Other' group, so set as '0'
-        df.loc[df[col].str.contains('E'), col] = '0'
-        df.loc[df[col].str.contains('V'), col] = '0'
+# modules shared with the prediction service templates (models/containerized_model/templates/src)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'containerized_model', 'templates', 'src'))
+from model_bundle import write_bundle
+
+
+DIAGNOSIS_COLUMNS = ['diag_1', 'diag_2', 'diag_3']
+# ICD-9 diagnosis groups: closed intervals of codes, sorted, and single codes
+DIAGNOSIS_INTERVALS = [
+    (140, 239, 'Neoplasms'),
+    (390, 458, 'Circulatory'),
+    (460, 519, 'Respiratory'),
+    (520, 579, 'Digestive'),
+    (580, 629, 'Genitourinary'),
+    (710, 739, 'Muscoloskeletal'),
+    (800, 999, 'Injury'),
+]
+DIAGNOSIS_CODES = {250: 'Diabetes', 785: 'Circulatory', 786: 'Respiratory', 787: 'Digestive', 788: 'Genitourinary'}
+# rows per chunk when converting the dataset
+CONVERSION_CHUNK_ROWS = 100000
+
+
+def _diagnosis_code(value) -> float:
+    if not isinstance(value, str):
+        return float(value)
+    if value == '?' or 'E' in value or 'V' in value:
+        # Anything with E or V will get mapped into 'Other' group, so set as 0
+        return 0.
+    if '250' in value:
         # Any '250.xx' will be mapped to Diabetes
-        df.loc[df[col].str.contains('250'), col] = '250'
-
-    df[diag_cols] = df[diag_cols].astype(float)
-
-    # diagnosis grouping
-    for col in diag_cols:
-        df['temp']='Other'
-
-        condition = (df[col]>=390) & (df[col]<=458) | (df[col]==785)
-        df.loc[condition,'temp']='Circulatory'
-
-        condition = (df[col]>=460) & (df[col]<=519) | (df[col]==786)
-        df.loc[condition,'temp']='Respiratory'
+        return 250.
+    return float(value)
 
-        condition = (df[col]>=520) & (df[col]<=579) | (df[col]==787)
-        df.loc[condition,'temp']='Digestive'
 
-        condition = df[col]==250
-        df.loc[condition,'temp']='Diabetes'
+def _diagnosis_groups(codes: np.ndarray) -> np.ndarray:
+    """Returns the diagnosis group of each numeric diagnosis code, by a search of the sorted code intervals"""
+    starts = np.array([first for first, _, _ in DIAGNOSIS_INTERVALS], dtype=float)
+    ends = np.array([last for _, last, _ in DIAGNOSIS_INTERVALS], dtype=float)
+    names = np.array([group for _, _, group in DIAGNOSIS_INTERVALS], dtype=object)
+    interval = np.searchsorted(starts, codes, side='right') - 1
+    inside = (interval >= 0) & (codes <= ends[interval])
+    groups = np.where(inside, names[interval], 'Other').astype(object)
+    for code, group in DIAGNOSIS_CODES.items():
+        groups[codes == code] = group
+    groups[np.isnan(codes)] = 'Unknown'
+    return groups
 
-        condition = (df[col]>=800) & (df[col]<=999)
-        df.loc[condition,'temp']='Injury'
-
-        condition = (df[col]>=710) & (df[col]<=739)
-        df.loc[condition,'temp']='Muscoloskeletal'
-
-        condition = (df[col]>=580) & (df[col]<=629) | (df[col]==788)
-        df.loc[condition,'temp']='Genitourinary'
-
-        condition = (df[col]>=140) & (df[col]<=239)
-        df.loc[condition,'temp']='Neoplasms'
-
-        df.loc[df[col].isnull(),'temp']='Unknown'
-        df[col]=df['temp']
-        df.drop('temp',axis=1,inplace=True)
 
+def _map_diagnostics(df: pd.DataFrame):
+    # diagnosis grouping: the distinct codes of each column are mapped to groups, and the groups taken
+    # for the rows
+    for col in DIAGNOSIS_COLUMNS:
+        rows, values = pd.factorize(df[col])
+        # missing values (row -1) are mapped as code 0, the last one
+        codes = np.fromiter((_diagnosis_code(value) for value in values), dtype=float, count=len(values))
+        df[col] = _diagnosis_groups(np.append(codes, 0.))[rows]
     return df
 
 
-def _convert_to_diagnostic_mapped(dataset_filename: str, converted_filename: str) -> pd.DataFrame:
-    df = pd.read_csv(dataset_filename)
-    df = _map_diagnostics(df)
-    df['readmitted'] = np.where(df['readmitted']!='NO',1,0)
-    df.to_csv(converted_filename, index=False)
-    return df
+def _convert_to_diagnostic_mapped(dataset_filename: str, converted_filename: str,
+                                  chunk_rows: int = CONVERSION_CHUNK_ROWS):
+    # The dataset is converted in chunks of rows, in bounded memory. The values are read as text, so
+    # that they are written as they are, whatever the values in each chunk.
+    chunks = pd.read_csv(dataset_filename, dtype=str, chunksize=chunk_rows)
+    for index, df in enumerate(chunks):
+        df = _map_diagnostics(df)
+        df['readmitted'] = np.where(df['readmitted']!='NO',1,0)
+        df.to_csv(converted_filename, mode='w' if index == 0 else 'a', header=index == 0, index=False)
 
 
 def main():
@@ -79,8 +92,9 @@ def main():
     np.random.seed(0)
 
     # Convert and bring in test and training data.
-    df = _convert_to_diagnostic_mapped('../../notebooks/datasets/diabetic_data.csv',
-                                       'diabetic_data_diagnostic_mapped.csv')
+    _convert_to_diagnostic_mapped('../../notebooks/datasets/diabetic_data.csv',
+                                  'diabetic_data_diagnostic_mapped.csv')
+    df = pd.read_csv('diabetic_data_diagnostic_mapped.csv')
 
     # Just take the first N rows to explain as the explanation set - we save this here for
     # use by later analysis for the purposes of this example
@@ -120,9 +134,10 @@ def main():
         model_obj = {'model': encoded_model, 'encoder': None, 'name': name, 'created': int(time.time())}
         with open(f'readmission_{name}.pkl', 'wb') as file:
             pickle.dump(model_obj, file)
+        write_bundle(model_obj, f'readmission_{name}.bundle')
         print(f"Saved: {name}")
 
-    # Save model as pickle file
+    # Save model as pickle file and model bundle
     save('mlp', model)
 
 
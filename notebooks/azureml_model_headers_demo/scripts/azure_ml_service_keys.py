@@ -73,7 +73,8 @@ def main(args):
     )
 
     # %%
-    encoder = CatEncoder(cat_columns, X)
+    # both models accept sparse input, so they are trained on (and score) the CSR output of the encoder
+    encoder = CatEncoder(cat_columns, X, sparse=True)
 
     def build_model(data, name, model_family, test=None):
         if test is None:
@@ -1,8 +1,11 @@
-""" 
+"""
 Copyright (c) 2020. Cognitive Scale Inc. All rights reserved.
 Licensed under CognitiveScale Example Code License https://github.com/CognitiveScale/cortex-certifai-examples/blob/7998b8a481fccd467463deb1fc46d19622079b0e/LICENSE.md
 """
-from typing import List, Tuple
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 from certifai.common.hosted_model import IHostedModel
 
@@ -10,15 +13,85 @@ import numpy as np
 
 
 class JointModel:
-    def __init__(self, segment_models_idx_mapping: List[Tuple[int, IHostedModel]]):
+    def __init__(self, segment_models_idx_mapping: List[Tuple[int, IHostedModel]], max_workers: Optional[int] = None):
+        """
+        :param segment_models_idx_mapping: (index of the one-hot segment indicator column, segment model) of each
+            segment
+        :param max_workers: number of threads calling the segment models of a batch concurrently, which speeds up
+            models that release the GIL while predicting (e.g. numpy/BLAS based and libsvm models); defaults to one
+            per segment, and 1 calls them one after the other
+        """
         self.segment_models_idx_mapping = segment_models_idx_mapping
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def __getstate__(self):
+        # the thread pool is not pickled (e.g. for multi-processing), it is created again when needed
+        state = self.__dict__.copy()
+        for name in ('_executor', '_executor_pid', '_executor_lock'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('max_workers', None)
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # threads do not survive a fork, so the pool is created in the current process if needed
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers or len(self.segment_models_idx_mapping))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _route(self, X) -> List[Tuple[int, np.ndarray]]:
+        """
+        Returns the (segment, row indexes) of each segment with rows in the batch: the segment of each row is the
+        argmax of the segment indicator columns, and the rows are grouped by segment in a stable order.
+        """
+        indicators = np.asarray(X[:, [col_idx for col_idx, _ in self.segment_models_idx_mapping]], dtype=float)
+        segments = np.argmax(indicators, axis=1)
+        unrouted = indicators[np.arange(len(X)), segments] <= 0.5
+        if unrouted.any():
+            raise ValueError(f'{np.count_nonzero(unrouted)} rows have no segment indicator set')
+        order = np.argsort(segments, kind='stable')
+        counts = np.bincount(segments, minlength=indicators.shape[1])
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        return [(segment, order[start:end]) for segment, (start, end) in enumerate(zip(starts, ends)) if end > start]
+
+    def _dispatch(self, X, soft: bool) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Returns the (row indexes, predictions or scores of the segment model) of each segment with rows in the batch"""
+        def call(group):
+            segment, rows = group
+            model = self.segment_models_idx_mapping[segment][1]
+            fn = (getattr(model, 'soft_predict', None) or model.predict_proba) if soft else model.predict
+            return rows, np.asarray(fn(X[rows]))
+
+        groups = self._route(X)
+        if len(groups) < 2 or self.max_workers == 1:
+            return [call(group) for group in groups]
+        return list(self._get_executor().map(call, groups))
 
     def predict(self, X):
         result = np.empty(len(X), dtype='int')
-        accounted = 0
-        for col_idx, model in self.segment_models_idx_mapping:
-            seg_idxs = np.where(X[:, col_idx] > 0.5)[0]
-            if len(seg_idxs) > 0:
-                accounted += len(seg_idxs)
-                result[seg_idxs] = model.predict(X[seg_idxs])
+        for rows, predictions in self._dispatch(X, soft=False):
+            result[rows] = predictions
         return result
+
+    def soft_predict(self, X):
+        """
+        Returns the scores of each row from its segment model's `soft_predict` (or `predict_proba`); the segment
+        models must score the same classes, in the same order.
+        """
+        result = None
+        for rows, scores in self._dispatch(X, soft=True):
+            if result is None:
+                result = np.empty((len(X),) + scores.shape[1:], dtype=scores.dtype)
+            result[rows] = scores
+        return result if result is not None else np.empty((0, 0))